@@ -0,0 +1,96 @@
+"""Compare the memory kept per canvas: manifest dicts against Canvas records.
+
+A synthetic manifest shaped like those of the Portale Antenati (each
+canvas nests its image, the image resource and the image service) is
+decoded with :func:`json.loads`. The script prints the Python heap still
+allocated (``tracemalloc``) once the whole manifest is decoded, and once
+only the :class:`antenati.iiif.Canvas` records and the manifest header
+are left, as a :class:`antenati.Downloader` keeps them for the run.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_canvases --canvases 1000 10000 100000
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import tracemalloc
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from typing import Any
+
+from antenati import iiif
+
+_IIIF_SERVER = 'https://iiif-antenati.cultura.gov.it/iiif/2'
+_ARK = 'https://antenati.cultura.gov.it/ark:/12657/an_ua19944535'
+
+
+def _manifest_text(n_canvases: int) -> str:
+    canvases = [
+        {
+            '@id': f'{_ARK}/canvas/p{i}',
+            '@type': 'sc:Canvas',
+            'label': f'pag. {i}',
+            'width': 3543,
+            'height': 4724,
+            'images': [
+                {
+                    '@type': 'oa:Annotation',
+                    'motivation': 'sc:painting',
+                    'on': f'{_ARK}/canvas/p{i}',
+                    'resource': {
+                        '@id': f'{_IIIF_SERVER}/{i:07x}Xy/full/full/0/default.jpg',
+                        '@type': 'dctypes:Image',
+                        'format': 'image/jpeg',
+                        'width': 3543,
+                        'height': 4724,
+                        'service': {
+                            '@context': 'http://iiif.io/api/image/2/context.json',
+                            '@id': f'{_IIIF_SERVER}/{i:07x}Xy',
+                            'profile': 'http://iiif.io/api/image/2/level1.json',
+                        },
+                    },
+                }
+            ],
+        }
+        for i in range(1, n_canvases + 1)
+    ]
+    manifest = {
+        '@id': f'{_ARK}/manifest',
+        'label': 'Synthetic register',
+        'metadata': [{'label': 'Titolo', 'value': '1900'}],
+        'sequences': [{'canvases': canvases}],
+    }
+    return json.dumps(manifest)
+
+
+def _measure(text: str) -> tuple[int, int]:
+    """Return the heap kept by the decoded manifest, and by its records and header."""
+    gc.collect()
+    tracemalloc.start()
+    manifest: dict[str, Any] = json.loads(text)
+    decoded, _ = tracemalloc.get_traced_memory()
+    canvases = [iiif.Canvas.from_iiif(canvas, seq) for seq, canvas in enumerate(iiif.slice_canvases(manifest, 0, None))]
+    header = iiif.manifest_header(manifest)
+    del manifest
+    gc.collect()
+    compact, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert canvases and header
+    return decoded, compact
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0], formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--canvases', type=int, nargs='+', default=[1000, 10000, 100000], help='canvases in the synthetic manifest')
+    args = parser.parse_args()
+
+    print(f'{"canvases":>9} {"dicts MiB":>10} {"records MiB":>12} {"B/canvas":>9} {"B/record":>9}')
+    for n_canvases in args.canvases:
+        decoded, compact = _measure(_manifest_text(n_canvases))
+        print(f'{n_canvases:>9} {decoded / 2**20:>10.1f} {compact / 2**20:>12.1f} {decoded // n_canvases:>9} {compact // n_canvases:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Compare the thread-pool and asyncio download engines.
+
+Both engines download the same synthetic gallery from the local stand-in
+server (``tests/fixtures/server.py``), which adds a fixed latency to every
+reply to mimic a slow SAN server. For each concurrency level the script
+prints wall time, throughput, the peak of Python heap allocations
+(``tracemalloc``: thread stacks are not included) and the connections
+opened, which should not exceed the number of workers.
+
+Run from the repository root (needs ``antenati[async]``)::
+
+    python -m benchmarks.bench_engines --images 400 --latency 0.2 --workers 16 64 256
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import time
+import tracemalloc
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from antenati import Downloader, ProgressBar
+from tests.fixtures.server import StandInServer
+
+
+def _null_progress() -> ProgressBar:
+    return ProgressBar(set_total=lambda _t: None, update=lambda: None)
+
+
+def _measure(server: StandInServer, engine: str, n_workers: int) -> tuple[float, int, int]:
+    with TemporaryDirectory() as tmp:
+        downloader = Downloader(server.manifest_url, first=0, last=None)
+        with redirect_stdout(io.StringIO()):
+            downloader.check_dir(parentdir=tmp, interactive=False)
+        tracemalloc.start()
+        start = time.perf_counter()
+        if engine == 'async':
+            asyncio.run(downloader.run_async(n_workers, 0, _null_progress()))
+        else:
+            downloader.run(n_workers, 0, _null_progress())
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(list(Path(downloader.dirname).glob('*.jpg'))) == server.n_images
+    return elapsed, peak, downloader.connection_stats.connections
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0], formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--images', type=int, default=200, help='canvases in the synthetic gallery')
+    parser.add_argument('--image-size', type=int, default=256 * 1024, help='bytes per image')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every reply')
+    parser.add_argument('--workers', type=int, nargs='+', default=[8, 32, 128], help='concurrency levels to compare')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f'{"engine":<8} {"workers":>7} {"seconds":>8} {"img/s":>8} {"peak MiB":>9} {"conns":>6}')
+    with StandInServer(n_images=args.images, image_size=args.image_size, latency=args.latency) as server:
+        # The server runs in this process: build its payloads up front so
+        # they do not count towards the first engine's allocations.
+        for i in range(1, args.images + 1):
+            server.payload(i)
+        for n_workers in args.workers:
+            for engine in ('threads', 'async'):
+                elapsed, peak, connections = _measure(server, engine, n_workers)
+                print(f'{engine:<8} {n_workers:>7} {elapsed:>8.2f} {args.images / elapsed:>8.1f} {peak / 2**20:>9.1f} {connections:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Time :func:`antenati.iiif.build_plan` on a large synthetic gallery.
+
+The canvases are :class:`antenati.iiif.Canvas` records labelled like
+those of the Portale Antenati (``pag. N``), with one label in
+``--duplicate-every`` repeating an earlier one. For comparison the
+script also times the per-canvas computation that the workers used to
+repeat on every attempt (slug of the label, image ID, sized URL), which
+neither detects nor resolves the collisions.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_plan --canvases 100000
+"""
+
+from __future__ import annotations
+
+import time
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+
+from slugify import slugify
+
+from antenati import iiif
+
+_IIIF_SERVER = 'https://iiif-antenati.cultura.gov.it/iiif/2'
+_ARK_ID = 'an_ua19944535'
+
+
+def _canvases(n_canvases: int, duplicate_every: int) -> list[iiif.Canvas]:
+    return [
+        iiif.Canvas(
+            i,
+            f'pag. {i - 1 if duplicate_every and i % duplicate_every == 0 else i}',
+            f'{_IIIF_SERVER}/{i:07x}Xy/full/full/0/default.jpg',
+            3543,
+            4724,
+        )
+        for i in range(1, n_canvases + 1)
+    ]
+
+
+def _per_canvas(canvases: list[iiif.Canvas], size: int, descriptive_names: bool) -> list[tuple[str, str]]:
+    results = []
+    for canvas in canvases:
+        image_url = canvas.require_image_url()
+        label = slugify(canvas.label)
+        stem = f'{label}+{_ARK_ID}+{iiif.get_image_id_from_url(image_url)}' if descriptive_names else label
+        results.append((stem, iiif.manipulate_image_url(image_url, size)))
+    return results
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.splitlines()[0], formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--canvases', type=int, default=100_000, help='canvases in the synthetic gallery')
+    parser.add_argument('--duplicate-every', type=int, default=100, help='one label in N repeats the previous one (0 for none)')
+    parser.add_argument('--size', type=int, default=0, help='image size in pixel (0 means full size)')
+    args = parser.parse_args()
+
+    canvases = _canvases(args.canvases, args.duplicate_every)
+    print(f'{"names":<12} {"method":<11} {"seconds":>8} {"us/canvas":>10} {"renamed":>8}')
+    for descriptive_names in (False, True):
+        names = 'descriptive' if descriptive_names else 'labels'
+        start = time.perf_counter()
+        _per_canvas(canvases, args.size, descriptive_names)
+        elapsed = time.perf_counter() - start
+        print(f'{names:<12} {"per canvas":<11} {elapsed:>8.2f} {elapsed / len(canvases) * 1e6:>10.1f} {"-":>8}')
+        start = time.perf_counter()
+        targets = iiif.build_plan(canvases, args.size, descriptive_names, _ARK_ID)
+        elapsed = time.perf_counter() - start
+        renamed = sum(target.renamed for target in targets)
+        print(f'{names:<12} {"build_plan":<11} {elapsed:>8.2f} {elapsed / len(canvases) * 1e6:>10.1f} {renamed:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ except PackageNotFoundError:
     # assert the attribute exists without pretending to know the tag.
     __version__ = '0.0.0+local'
 
+from antenati.batch import Batch
 from antenati.downloader import (
     DEFAULT_N_THREADS,
     DEFAULT_SIZE,
@@ -31,6 +32,7 @@ from antenati.errors import ThreadError
 __all__ = [
     'DEFAULT_N_THREADS',
     'DEFAULT_SIZE',
+    'Batch',
     'Downloader',
     'ProgressBar',
     'ThreadError',
@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""asyncio transport for :meth:`antenati.downloader.Downloader.run_async`.
+
+The thread-pool engine of :meth:`~antenati.downloader.Downloader.run`
+ties up one OS thread per in-flight request. This module provides the
+same image transfer on top of :mod:`aiohttp`, so a single thread can
+keep hundreds of requests in flight with memory that stays flat.
+
+It mirrors :func:`antenati.http.fetch_to_part` step by step (range
+resume, 416 restart, WAF detection, hashing while streaming) and reuses
+its helpers, so both engines produce identical files and index entries.
+Transient statuses are not retried here: as with the thread pool, the
+downloader queues the canvas again in its
+:class:`antenati.scheduler.RetryScheduler` (see :func:`is_transient_error`).
+
+:mod:`aiohttp` is an optional dependency (``pip install antenati[async]``):
+this module is only imported when the asyncio engine is selected.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import replace
+from http import HTTPStatus
+from pathlib import Path
+from types import SimpleNamespace
+
+try:
+    import aiohttp
+except ImportError as exc:  # pragma: no cover - depends on the environment
+    raise ImportError('The asyncio engine requires aiohttp: pip install "antenati[async]"') from exc
+
+from antenati import http, storage
+from antenati.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Errors a transfer can fail with, for callers that aggregate failures.
+CLIENT_ERRORS: tuple[type[Exception], ...] = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# No overall deadline: a full-resolution scan on a slow evening link can
+# legitimately take minutes. Only a stalled socket is treated as an error.
+_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+
+def open_session(
+    n_workers: int,
+    chunk_size: int = http.DEFAULT_CHUNK_SIZE,
+    stats: http.ConnectionStats | None = None,
+    limit_per_host: int | None = None,
+    limiter: RateLimiter | None = None,
+) -> aiohttp.ClientSession:
+    """Return a ClientSession sized for ``n_workers`` concurrent transfers.
+
+    The read buffer of each connection is capped to ``chunk_size`` so that,
+    as with the thread pool, memory grows with chunk size x concurrency.
+    ``limit_per_host`` caps the connections to a single host (default:
+    ``n_workers``); requests and new connections are counted in ``stats``,
+    and each request waits for the request budget of ``limiter``.
+    Must be called (and used) from within a running event loop.
+    """
+    connector = aiohttp.TCPConnector(limit=n_workers, limit_per_host=limit_per_host or n_workers)
+    return aiohttp.ClientSession(
+        headers=http.browser_headers(),
+        connector=connector,
+        timeout=_TIMEOUT,
+        read_bufsize=chunk_size,
+        trace_configs=[_trace_config(stats if stats is not None else http.ConnectionStats(), limiter)],
+    )
+
+
+def _trace_config(stats: http.ConnectionStats, limiter: RateLimiter | None) -> aiohttp.TraceConfig:
+    """Feed the aiohttp request and connection events to ``stats`` and ``limiter``."""
+
+    async def on_request_start(_session: aiohttp.ClientSession, context: SimpleNamespace, params: aiohttp.TraceRequestStartParams) -> None:
+        # Connection events carry no URL: remember the scheme for them.
+        context.tls = params.url.scheme == 'https'
+        stats.record_request()
+        if limiter is not None:
+            await _wait(limiter.reserve_request())
+
+    async def on_connection_create_end(_session: aiohttp.ClientSession, context: SimpleNamespace, _params: aiohttp.TraceConnectionCreateEndParams) -> None:
+        stats.record_connection(getattr(context, 'tls', False))
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def fetch_to_part(
+    session: aiohttp.ClientSession,
+    url: str,
+    part: Path,
+    chunk_size: int = http.DEFAULT_CHUNK_SIZE,
+    limiter: RateLimiter | None = None,
+) -> http.Transfer:
+    """Stream ``url`` into ``part``; see :func:`antenati.http.fetch_to_part`."""
+    received = 0
+    attempts = 0
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        try:
+            transfer = await _fetch_once(session, url, part, offset, chunk_size, limiter)
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError) as ex:
+            attempts += 1
+            if attempts > http.MAX_RESUME_ATTEMPTS:
+                raise
+            received += max(part.stat().st_size - offset, 0) if part.exists() else 0
+            logger.info('Transfer of %s interrupted, resuming: %s', url, ex)
+        except aiohttp.ClientResponseError as ex:
+            if ex.status != HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                raise
+            logger.info('Range rejected for %s, restarting: %s', url, ex)
+            part.unlink(missing_ok=True)
+        else:
+            return replace(transfer, received=received + transfer.received)
+
+
+def is_transient_error(ex: BaseException | None) -> bool:
+    """aiohttp counterpart of :func:`antenati.http.is_transient_error`."""
+    if isinstance(ex, aiohttp.ClientResponseError):
+        return ex.status in http.RETRYABLE_STATUSES
+    return isinstance(ex, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+
+
+def is_throttling_error(ex: BaseException | None) -> bool:
+    """aiohttp counterpart of :func:`antenati.http.is_throttling_error`."""
+    return isinstance(ex, aiohttp.ClientResponseError) and ex.status in http.RETRYABLE_STATUSES
+
+
+def retry_after_from_error(ex: BaseException | None) -> float | None:
+    """aiohttp counterpart of :func:`antenati.http.retry_after_from_error`."""
+    if isinstance(ex, aiohttp.ClientResponseError) and ex.headers is not None:
+        return http.retry_after(ex.headers)
+    return None
+
+
+async def _wait(delay: float) -> None:
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def _fetch_once(session: aiohttp.ClientSession, url: str, part: Path, offset: int, chunk_size: int, limiter: RateLimiter | None) -> http.Transfer:
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+    logger.debug('GET %s (from byte %d)', url, offset)
+    loop = asyncio.get_running_loop()
+    sent = loop.time()
+    async with session.get(url, headers=headers) as reply:
+        ttfb = loop.time() - sent
+        reply.raise_for_status()
+        if http.is_waf_challenge(reply.status, reply.headers):
+            raise http.waf_challenge_error(str(reply.url))
+        extension = http.guess_image_extension(url, reply.content_type)
+        start = http.resumed_offset(reply.status, reply.headers)
+        if start != offset:
+            logger.info('Server ignored the range request for %s, downloading it again', url)
+        expected = http.expected_length(reply.status, reply.headers)
+        # Disk writes stay synchronous: chunks land in the page cache
+        # and are far cheaper than a hop to a thread pool.
+        with storage.PartFile(part, start) as part_file:
+            async for chunk in reply.content.iter_chunked(chunk_size):
+                part_file.write(chunk)
+                if limiter is not None:
+                    await _wait(limiter.reserve_bytes(len(chunk)))
+    part_file.check_length(url, expected)
+    return http.Transfer(extension, part_file.size, part_file.size - start, expected, part_file.sha256, ttfb)
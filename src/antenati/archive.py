@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Write the images of a gallery into one ZIP (or CBZ) archive as they finish.
+
+A gallery saved as a directory is thousands of small files: heavy on
+inodes, slow on network filesystems and slow to back up. A
+:class:`GalleryArchive` appends each image to a single archive as soon
+as its download is complete, stored as it is (JPEG and PNG are
+compressed already), so a gallery costs one file written sequentially
+rather than thousands of files created and closed.
+
+Images finish in no particular order, and their entries follow one
+another in that order. The central directory, written when the archive
+is closed, lists them in canvas order, which is the order readers of
+comic book archives page through. The ``.part`` files of the images
+still downloading stay in the gallery directory until they are added.
+
+A run killed before closing the archive leaves it without a central
+directory. Continuing it rebuilds the archive from the local headers
+of the entries that are complete, checking their CRC, so the images
+lost with the tail of the file are downloaded again.
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import struct
+import threading
+import zlib
+from collections.abc import Iterator, Mapping
+from os import replace
+from os.path import splitext
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO
+from zipfile import ZIP_STORED, BadZipFile, ZipFile, ZipInfo
+
+logger = logging.getLogger(__name__)
+
+# ``cbz`` is a ZIP with another extension, for comic book readers.
+FORMATS: tuple[str, ...] = ('zip', 'cbz')
+
+# Block size of the copy of a downloaded image into the archive.
+_COPY_BLOCK_SIZE: int = 1024 * 1024
+
+# ZIP local file header: signature, versions, flags, method, time, date,
+# CRC-32, sizes and lengths of the name and of the extra field.
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_LOCAL_SIGNATURE: bytes = b'PK\x03\x04'
+_ZIP64_EXTRA_ID: int = 0x0001
+_ZIP64_LIMIT: int = 0xFFFFFFFF
+# Flags: sizes in a data descriptor after the data, UTF-8 name.
+_FLAG_DATA_DESCRIPTOR: int = 0x08
+_FLAG_UTF8: int = 0x800
+
+
+class GalleryArchive:
+    """The archive at ``path`` that the images of a gallery are added to.
+
+    ``positions`` gives the canvas position of each file stem, for the
+    order of the central directory. With ``append``, an existing
+    archive is continued: its images count as done (see :meth:`stems`).
+    Safe to share between the threads of a run; :meth:`close` it, or use
+    it as a context manager, to write the central directory.
+    """
+
+    def __init__(self, path: Path, positions: Mapping[str, int], append: bool = False) -> None:
+        self.path = path
+        self._positions = positions
+        self._lock = threading.Lock()
+        append = append and path.exists()
+        if append:
+            # Mode 'a' does not fail on a file without a central
+            # directory: it would start a new archive after its bytes.
+            try:
+                ZipFile(path).close()
+            except BadZipFile:
+                n_entries = _recover(path)
+                logger.warning('%s was not closed: rebuilt with the %d complete images it holds', path, n_entries)
+        self._zip = ZipFile(path, 'a' if append else 'w', ZIP_STORED, allowZip64=True)
+
+    def stems(self) -> set[str]:
+        """Return the file stems of the images in the archive."""
+        with self._lock:
+            return {splitext(name)[0] for name in self._zip.namelist()}
+
+    def add(self, name: str, source: Path) -> None:
+        """Copy ``source`` into the archive as ``name``, then delete it."""
+        with self._lock, open(source, 'rb') as src, self._zip.open(name, 'w', force_zip64=True) as dst:
+            shutil.copyfileobj(src, dst, _COPY_BLOCK_SIZE)
+        source.unlink()
+
+    def close(self) -> None:
+        """Write the central directory, in canvas order, and close the archive."""
+        with self._lock:
+            if self._zip.fp is None:
+                return
+            self._zip.filelist.sort(key=self._order)
+            self._zip.close()
+        logger.debug('Archive %s closed', self.path)
+
+    def _order(self, info: ZipInfo) -> tuple[int, str]:
+        # Files of other runs, not planned now, go last.
+        return self._positions.get(splitext(info.filename)[0], len(self._positions)), info.filename
+
+    def __enter__(self) -> GalleryArchive:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None) -> None:
+        self.close()
+
+
+def _recover(path: Path) -> int:
+    """Rebuild the archive at ``path`` from its complete entries, those before the first damaged one. Returns their number."""
+    tmp = path.with_name(f'{path.name}.recover')
+    n_entries = 0
+    with open(path, 'rb') as src, ZipFile(tmp, 'w', ZIP_STORED, allowZip64=True) as dst:
+        for name, offset, size, crc in list(_local_entries(src)):
+            if _crc(src, offset, size) != crc:
+                break
+            src.seek(offset)
+            with dst.open(name, 'w', force_zip64=True) as entry:
+                remaining = size
+                while remaining:
+                    block = src.read(min(_COPY_BLOCK_SIZE, remaining))
+                    entry.write(block)
+                    remaining -= len(block)
+            n_entries += 1
+    replace(tmp, path)
+    return n_entries
+
+
+def _local_entries(f: BinaryIO) -> Iterator[tuple[str, int, int, int]]:
+    """Yield the name, data offset, size and CRC-32 of the stored entries of a ZIP, from their local headers.
+
+    Stops at the first header that is missing, cut short or unlike those
+    :class:`GalleryArchive` writes: its header is rewritten with the
+    sizes and the CRC once the data is complete, so an entry interrupted
+    halfway has a size of zero.
+    """
+    end = f.seek(0, 2)
+    f.seek(0)
+    while True:
+        header = f.read(_LOCAL_HEADER.size)
+        if len(header) < _LOCAL_HEADER.size:
+            return
+        signature, _version, flags, method, _time, _date, crc, size, _usize, name_length, extra_length = _LOCAL_HEADER.unpack(header)
+        if signature != _LOCAL_SIGNATURE or method != ZIP_STORED or flags & _FLAG_DATA_DESCRIPTOR:
+            return
+        name = f.read(name_length).decode('utf-8' if flags & _FLAG_UTF8 else 'cp437')
+        extra = f.read(extra_length)
+        if size == _ZIP64_LIMIT:
+            size = _zip64_size(extra)
+        offset = f.tell()
+        if not size or offset + size > end:
+            return
+        yield name, offset, size, crc
+        f.seek(offset + size)
+
+
+def _zip64_size(extra: bytes) -> int:
+    """Return the compressed size in the ZIP64 field of ``extra``, or 0 when it has none."""
+    while len(extra) >= 4:
+        kind, length = struct.unpack('<HH', extra[:4])
+        if kind == _ZIP64_EXTRA_ID and length >= 16:
+            # Uncompressed size first, then compressed size: both are set.
+            return int(struct.unpack('<Q', extra[12:20])[0])
+        extra = extra[4 + length :]
+    return 0
+
+
+def _crc(f: BinaryIO, offset: int, size: int) -> int:
+    f.seek(offset)
+    crc = 0
+    remaining = size
+    while remaining:
+        block = f.read(min(_COPY_BLOCK_SIZE, remaining))
+        if not block:
+            return -1
+        crc = zlib.crc32(block, crc)
+        remaining -= len(block)
+    return crc
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Local index from ark IDs and archive IDs to IIIF manifest URLs.
+
+Resolving a gallery URL means fetching its HTML page to read the
+manifest URL out of it, and that page is the only request the AWS WAF
+challenges. The manifest URL of a gallery never changes, so
+:class:`ArkIndex` remembers it. The keys are the ``an_...`` ark token
+(:func:`antenati.iiif.get_ark_id_from_url`) and the archive ID. After
+the first resolution of a gallery, later runs go straight to its
+manifest.
+
+The index is a SQLite database in the user cache directory, which
+concurrent runs can safely share. It fills itself on every resolution,
+and :meth:`ArkIndex.import_csv` loads mappings gathered elsewhere in
+bulk, e.g. by a colleague or from an earlier batch job.
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+import sqlite3
+from collections.abc import Iterable, Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+from antenati import iiif
+from antenati.errors import ManifestError
+from antenati.paths import user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME: str = 'arks.sqlite3'
+
+# Columns of the CSV files read by ArkIndex.import_csv. Each row needs
+# a manifest URL and at least one of the two keys.
+CSV_ARK_ID: str = 'ark_id'
+CSV_ARCHIVE_ID: str = 'archive_id'
+CSV_MANIFEST_URL: str = 'manifest_url'
+
+# Seconds to wait for a concurrent run holding the database lock.
+_BUSY_TIMEOUT: float = 30.0
+
+_SCHEMA: str = 'CREATE TABLE IF NOT EXISTS manifests (key TEXT PRIMARY KEY, manifest_url TEXT NOT NULL)'
+
+
+class ArkIndex:
+    """Manifest URLs of the galleries already resolved, by ark ID and archive ID.
+
+    ``path`` defaults to a file in the user cache directory.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path if path is not None else user_cache_dir() / INDEX_FILENAME
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation: a few per gallery, and no state to
+        # share between the threads of a batch.
+        with closing(sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)) as conn, conn:
+            yield conn
+
+    def lookup(self, url: str) -> str | None:
+        """Return the manifest URL of the gallery at ``url``, if known."""
+        keys = [key for key in (iiif.get_ark_id_from_url(url), _archive_id(url)) if key]
+        with self._connect() as conn:
+            for key in keys:
+                row = conn.execute('SELECT manifest_url FROM manifests WHERE key = ?', (key,)).fetchone()
+                if row:
+                    logger.debug('Manifest URL of %s found in the index under %s', url, key)
+                    return str(row[0])
+        return None
+
+    def record(self, manifest_url: str, ark_id: str | None = None, archive_id: str | None = None) -> None:
+        """Remember ``manifest_url`` under the given keys."""
+        self._store((key, manifest_url) for key in (ark_id, archive_id) if key)
+
+    def forget(self, manifest_url: str) -> None:
+        """Drop every key leading to ``manifest_url``."""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM manifests WHERE manifest_url = ?', (manifest_url,))
+
+    def import_csv(self, path: Path) -> int:
+        """Load mappings from a CSV file with a header row, returning how many.
+
+        The columns are ``manifest_url`` and at least one of ``ark_id``
+        and ``archive_id``; others are ignored.
+
+        Raises
+        ------
+        ValueError
+            If the header lacks the required columns.
+        """
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            columns = set(reader.fieldnames or ())
+            if CSV_MANIFEST_URL not in columns or not columns & {CSV_ARK_ID, CSV_ARCHIVE_ID}:
+                raise ValueError(f'{path}: the CSV needs a {CSV_MANIFEST_URL} column and an {CSV_ARK_ID} or {CSV_ARCHIVE_ID} column')
+            rows = [
+                (key, manifest_url)
+                for row in reader
+                if (manifest_url := (row.get(CSV_MANIFEST_URL) or '').strip())
+                for key in ((row.get(CSV_ARK_ID) or '').strip(), (row.get(CSV_ARCHIVE_ID) or '').strip())
+                if key
+            ]
+        self._store(rows)
+        logger.info('Imported %d index entries from %s', len(rows), path)
+        return len(rows)
+
+    def _store(self, rows: Iterable[tuple[str, str]]) -> None:
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO manifests (key, manifest_url) VALUES (?, ?)', rows)
+
+
+def _archive_id(url: str) -> str | None:
+    try:
+        return iiif.get_archive_id_from_url(url)
+    except ManifestError:
+        return None
@@ -0,0 +1,379 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Download many galleries through one worker pool and one session.
+
+Running one :class:`antenati.Downloader` per gallery, one after the
+other, drains the worker pool at the end of every gallery. It then waits
+for the next manifest and ramps up again on a cold connection pool. A
+:class:`Batch` instead loads the manifests one at a time on a thread of
+its own, while the workers are busy with the galleries already loaded.
+The canvases of all the galleries go to the same workers and the same
+:class:`requests.Session`. The next manifest is requested as soon as the
+canvases left to start no longer fill the pool. The oldest gallery
+always goes first, so galleries start in order and only overlap at
+their boundaries.
+
+Retries and failures are handled per gallery as in
+:meth:`antenati.Downloader.run`: a gallery with failed images is
+reported as failed without stopping the others.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from requests import RequestException
+
+from antenati import http, iiif
+from antenati.arkindex import ArkIndex
+from antenati.cache import ResponseCache
+from antenati.downloader import Downloader, ProgressBar
+from antenati.errors import AntenatiError, ThreadError
+from antenati.journal import Journal
+from antenati.pipeline import Pipeline
+from antenati.ratelimit import RateLimiter
+from antenati.scheduler import THREADS_ERRORS, DownloadPass, RetryScheduler, backoff_delay
+from antenati.store import ContentStore
+
+logger = logging.getLogger(__name__)
+
+
+def read_batch_file(path: Path) -> list[str]:
+    """Return the gallery URLs listed in ``path``, one per line.
+
+    Blank lines and lines starting with ``#`` are skipped.
+    """
+    with open(path, encoding='utf-8') as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith('#')]
+
+
+@dataclass
+class GalleryReport:
+    """Progress and outcome of one gallery of a batch."""
+
+    url: str
+    shard: tuple[int, int] | None = None
+    dirname: Path | None = None
+    total: int = 0
+    done: int = 0
+    received: int = 0
+    error: str | None = None
+    finished: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.finished and self.error is None
+
+
+@dataclass
+class _Gallery:
+    """A gallery whose canvases are being downloaded."""
+
+    report: GalleryReport
+    downloader: Downloader
+    state: DownloadPass
+    resume: bool
+    in_flight: int = 0
+
+    @property
+    def drained(self) -> bool:
+        return not self.state.scheduler and self.in_flight == 0
+
+
+@dataclass
+class _Opened:
+    """A gallery started on the loader thread, with what it announced to its progress bar.
+
+    The progress bars belong to the orchestrating thread, which replays
+    the total and the canvases skipped there.
+    """
+
+    downloader: Downloader
+    resume: bool
+    targets: list[iiif.ImageTarget] = field(default_factory=list)
+    total: int = 0
+    skipped: int = 0
+
+    def progress(self) -> ProgressBar:
+        def set_total(total: int) -> None:
+            self.total = total
+
+        def update() -> None:
+            self.skipped += 1
+
+        return ProgressBar(set_total, update)
+
+
+@dataclass
+class _Load:
+    """The manifest being loaded on the loader thread."""
+
+    report: GalleryReport
+    future: Future[_Opened]
+
+
+class Batch:
+    """A list of galleries downloaded by one pool of workers.
+
+    The keyword arguments are those of :class:`antenati.Downloader` and
+    apply to every gallery; ``parentdir`` and ``resume`` are those of
+    :meth:`antenati.Downloader.check_dir`. Each gallery has a
+    :class:`GalleryReport` in :attr:`reports`, in the order of ``urls``.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        parentdir: str | None = None,
+        resume: bool = False,
+        descriptive_names: bool = False,
+        chunk_size: int = http.DEFAULT_CHUNK_SIZE,
+        max_host_connections: int | None = None,
+        rate_limiter: RateLimiter | None = None,
+        cache: ResponseCache | None = None,
+        index: ArkIndex | None = None,
+        journal: Journal | None = None,
+        shard: tuple[int, int] | None = None,
+        probe_sizes: bool = False,
+        archive: str | None = None,
+        pdf: bool = False,
+        pipeline: Pipeline | None = None,
+        store: ContentStore | None = None,
+    ) -> None:
+        if max_host_connections is not None and max_host_connections <= 0:
+            raise ValueError(f'max_host_connections must be positive, got {max_host_connections}')
+        self.reports = [GalleryReport(url) for url in urls]
+        self.parentdir = parentdir
+        self.resume = resume
+        self.descriptive_names = descriptive_names
+        self.chunk_size = chunk_size
+        self.max_host_connections = max_host_connections
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.index = index
+        self.journal = journal
+        self.shard = shard
+        self.probe_sizes = probe_sizes
+        self.archive = archive
+        self.pdf = pdf
+        self.pipeline = pipeline
+        self.store = store
+        self.session = http.build_session(limiter=rate_limiter)
+        self.connection_stats = http.connection_stats(self.session)
+
+    def run(
+        self,
+        n_workers: int,
+        size: int,
+        progress: ProgressBar,
+        on_gallery: Callable[[GalleryReport], None] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> int:
+        """Download every gallery. Returns the total bytes written.
+
+        ``progress`` counts the images of all the galleries, and its total
+        grows as their manifests are loaded. ``on_gallery`` is called from
+        the calling thread with the report of each gallery, as soon as it
+        is finished, whether it succeeded or failed. ``cancel`` stops the
+        batch like it stops :meth:`antenati.Downloader.run`.
+        """
+        self.connection_stats.reset()
+        pool_size = n_workers if self.max_host_connections is None else min(n_workers, self.max_host_connections)
+        # One more connection for the loader thread.
+        http.size_pools(self.session, pool_size + 1, block=pool_size < n_workers)
+        previous_policy = http.set_retry_policy(self.session, http.transport_retry_policy())
+        totals = _Totals(progress)
+        pending = list(self.reports)
+        active: list[_Gallery] = []
+        loading: _Load | None = None
+        in_flight: dict[Future[http.Transfer], tuple[_Gallery, iiif.ImageTarget, int]] = {}
+        closing: dict[Future[None], _Gallery] = {}
+        cancelled = False
+
+        def finish(report: GalleryReport) -> None:
+            report.finished = True
+            if on_gallery is not None:
+                on_gallery(report)
+
+        try:
+            # Closing a gallery waits for its pipeline and writes its PDF:
+            # a thread of its own keeps the other galleries going meanwhile.
+            with (
+                ThreadPoolExecutor(max_workers=1) as loader,
+                ThreadPoolExecutor(max_workers=1) as closer,
+                ThreadPoolExecutor(max_workers=n_workers) as executor,
+            ):
+                while pending or loading is not None or active or closing:
+                    if cancel is not None and cancel.is_set():
+                        cancelled = True
+                        break
+                    while len(in_flight) < n_workers and (job := _pop_ready(active)) is not None:
+                        gallery, target, attempt = job
+                        gallery.in_flight += 1
+                        future = executor.submit(gallery.downloader.download_canvas, target, gallery.resume or attempt > 0)
+                        in_flight[future] = job
+                    # Ask for the next manifest before the pool runs dry.
+                    if loading is None and pending and sum(len(g.state.scheduler) for g in active) < n_workers:
+                        report = pending.pop(0)
+                        loading = _Load(report, loader.submit(self.__open, report.url, size))
+                    waiting: list[Future[Any]] = [*in_flight, *closing]
+                    if loading is not None:
+                        waiting.append(loading.future)
+                    timeout = None if len(in_flight) >= n_workers else _wait_time(active)
+                    if not waiting:
+                        # Only retries waiting for their backoff are left.
+                        if cancel is not None:
+                            cancel.wait(timeout)
+                        else:
+                            time.sleep(timeout or 0)
+                        continue
+                    done, _ = wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if loading is not None and loading.future in done:
+                        gallery_or_none = self.__started(loading, totals)
+                        if gallery_or_none is None:
+                            finish(loading.report)
+                        else:
+                            active.append(gallery_or_none)
+                        loading = None
+                    for future in done & in_flight.keys():
+                        gallery, target, attempt = in_flight.pop(future)
+                        gallery.in_flight -= 1
+                        try:
+                            transfer = future.result()
+                        except ThreadError as ex:
+                            gallery.state.attempt_failed(target, attempt, ex)
+                        else:
+                            gallery.state.succeeded(transfer)
+                    for closed in done & closing.keys():
+                        gallery = closing.pop(closed)
+                        closed.result()
+                        finish(gallery.report)
+                    for gallery in [g for g in active if g.drained]:
+                        active.remove(gallery)
+                        gallery.report.received = gallery.state.received
+                        closing[closer.submit(_close, gallery)] = gallery
+                if self.journal is not None:
+                    self.journal.flush()
+                if cancelled:
+                    logger.info('Batch cancelled by caller')
+                    for gallery in active:
+                        gallery.downloader.close()
+                        gallery.report.received = gallery.state.received
+        finally:
+            http.restore_retry_policy(previous_policy)
+        n_images = sum(r.total for r in self.reports)
+        logger.info('Connections: %s', self.connection_stats.describe(n_images))
+        return sum(r.received for r in self.reports)
+
+    def __open(self, url: str, size: int) -> _Opened:
+        """Load the manifest of ``url``, create its directory and start the gallery, on the loader thread.
+
+        The shared session does not retry on its own during the batch, so
+        transient errors are retried here. Starting the gallery may read
+        the info.json of some canvases (with ``probe_sizes``): it is done
+        here too, not to hold up the workers.
+        """
+        attempt = 0
+        while True:
+            try:
+                downloader = Downloader(
+                    url,
+                    0,
+                    None,
+                    descriptive_names=self.descriptive_names,
+                    chunk_size=self.chunk_size,
+                    rate_limiter=self.rate_limiter,
+                    cache=self.cache,
+                    index=self.index,
+                    session=self.session,
+                    journal=self.journal,
+                    shard=self.shard,
+                    probe_sizes=self.probe_sizes,
+                    archive=self.archive,
+                    pdf=self.pdf,
+                    pipeline=self.pipeline,
+                    store=self.store,
+                )
+            except RequestException as ex:
+                if not http.is_transient_error(ex) or attempt >= http.RETRY_TOTAL:
+                    raise
+                delay = backoff_delay(attempt, http.retry_after_from_error(ex))
+                logger.info('Loading %s failed (%s), retrying in %.1f s', url, ex, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            downloader.check_dir(parentdir=self.parentdir, interactive=False, resume=self.resume)
+            opened = _Opened(downloader, self.resume or downloader.restored)
+            opened.targets = downloader.start(size, opened.progress(), opened.resume)
+            return opened
+
+    def __started(self, load: _Load, totals: _Totals) -> _Gallery | None:
+        """Schedule the gallery started by ``load``, or record why it could not be started."""
+        report = load.report
+        try:
+            opened = load.future.result()
+        except (AntenatiError, RequestException, OSError, RuntimeError) as ex:
+            logger.warning('Gallery %s failed: %s', report.url, ex)
+            report.error = str(ex)
+            return None
+        report.dirname = opened.downloader.dirname
+        gallery_progress = totals.gallery_progress(report)
+        gallery_progress.set_total(opened.total)
+        for _ in range(opened.skipped):
+            gallery_progress.update()
+        state = DownloadPass(RetryScheduler(opened.targets), gallery_progress, THREADS_ERRORS)
+        return _Gallery(report, opened.downloader, state, opened.resume)
+
+
+@dataclass
+class _Totals:
+    """The aggregate progress bar, fed by the progress of every gallery."""
+
+    progress: ProgressBar
+    total: int = 0
+
+    def gallery_progress(self, report: GalleryReport) -> ProgressBar:
+        def set_total(total: int) -> None:
+            report.total = total
+            self.total += total
+            self.progress.set_total(self.total)
+
+        def update() -> None:
+            report.done += 1
+            self.progress.update()
+
+        return ProgressBar(set_total, update)
+
+
+def _pop_ready(active: list[_Gallery]) -> tuple[_Gallery, iiif.ImageTarget, int] | None:
+    """Return the next canvas to download, from the oldest gallery that has one ready."""
+    for gallery in active:
+        item = gallery.state.scheduler.pop_ready()
+        if item is not None:
+            return gallery, *item
+    return None
+
+
+def _wait_time(active: list[_Gallery]) -> float | None:
+    times = [t for g in active if (t := g.state.scheduler.wait_time()) is not None]
+    return min(times, default=None)
+
+
+def _close(gallery: _Gallery) -> None:
+    """Record the outcome of a gallery whose canvases are all done, on the closer thread."""
+    report = gallery.report
+    gallery.downloader.close()
+    try:
+        gallery.state.outcome(cancelled=False)
+        if gallery.downloader.pdf:
+            gallery.downloader.write_pdf()
+    except (RuntimeError, OSError) as ex:
+        report.error = str(ex)
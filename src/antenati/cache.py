@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Size-bounded on-disk cache for gallery pages and IIIF manifests.
+
+Building a :class:`antenati.Downloader` fetches the gallery page and the
+manifest, which for a large register is several megabytes of JSON.
+:func:`antenati.http.fetch_document` keeps those bodies here, keyed by
+URL, with the ``ETag`` and ``Last-Modified`` validators the server sent.
+Later fetches of the same URL are conditional GETs: a ``304 Not
+Modified`` reply costs a few hundred bytes, and the body is read back
+from disk.
+
+Each entry is two files named after the SHA-256 of its URL: the body and
+a small JSON record. Both are written to a temporary name and moved into
+place, so concurrent runs never read a half-written entry. The cache
+is bounded in total size. When it grows beyond that, the least recently
+used entries are evicted, and recency is the modification time of the
+record, refreshed on every hit.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from contextlib import suppress
+from dataclasses import asdict, dataclass
+from hashlib import sha256
+from pathlib import Path
+
+from antenati.paths import user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Manifests of large registers reach a few MB: this keeps the last
+# hundred or so galleries.
+DEFAULT_MAX_BYTES: int = 256 * 1024 * 1024
+
+CACHE_SUBDIR: str = 'http'
+
+_RECORD_SUFFIX: str = '.json'
+_BODY_SUFFIX: str = '.body'
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """A cached response body and what is needed to revalidate it."""
+
+    url: str
+    content_type: str
+    etag: str | None
+    last_modified: str | None
+    content: bytes
+
+
+class ResponseCache:
+    """Response bodies on disk, keyed by URL, evicted least-recently-used first.
+
+    ``path`` defaults to a sub-directory of the user cache directory.
+    """
+
+    def __init__(self, path: Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if max_bytes <= 0:
+            raise ValueError(f'max_bytes must be positive, got {max_bytes}')
+        self.path = path if path is not None else user_cache_dir() / CACHE_SUBDIR
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _files(self, url: str) -> tuple[Path, Path]:
+        key = sha256(url.encode('utf-8')).hexdigest()
+        return self.path / f'{key}{_RECORD_SUFFIX}', self.path / f'{key}{_BODY_SUFFIX}'
+
+    def get(self, url: str) -> CacheEntry | None:
+        """Return the entry of ``url``, or None. A hit makes it the most recently used."""
+        record_file, body_file = self._files(url)
+        try:
+            with open(record_file, encoding='utf-8') as f:
+                record = json.load(f)
+            content = body_file.read_bytes()
+            entry = CacheEntry(content=content, **record)
+        except (OSError, ValueError, TypeError):
+            return None
+        if entry.url != url:
+            return None
+        with suppress(FileNotFoundError):
+            os.utime(record_file)
+        return entry
+
+    def put(self, entry: CacheEntry) -> None:
+        """Store ``entry``, then evict old entries beyond the size bound."""
+        record_file, body_file = self._files(entry.url)
+        record = asdict(entry)
+        del record['content']
+        # The body first: a record never points to a missing body.
+        _write_atomic(body_file, entry.content)
+        _write_atomic(record_file, json.dumps(record).encode('utf-8'))
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits ``max_bytes``."""
+        entries = []
+        total = 0
+        for record_file in self.path.glob(f'*{_RECORD_SUFFIX}'):
+            body_file = record_file.with_suffix(_BODY_SUFFIX)
+            try:
+                used = record_file.stat().st_mtime
+                size = record_file.stat().st_size + body_file.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((used, size, record_file, body_file))
+            total += size
+        for _used, size, record_file, body_file in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.debug('Evicting %s from the HTTP cache', record_file.stem)
+            record_file.unlink(missing_ok=True)
+            body_file.unlink(missing_ok=True)
+            total -= size
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
@@ -5,14 +5,75 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+import sys
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError
+from collections.abc import Callable
+from contextlib import nullcontext
+from pathlib import Path
 
 from humanize import naturalsize
 from tqdm import tqdm
 
-from antenati import __copyright__, __version__
-from antenati.downloader import DEFAULT_N_THREADS, DEFAULT_SIZE, Downloader, ProgressBar
+from antenati import __copyright__, __version__, http, pipeline, verify
+from antenati.archive import FORMATS as ARCHIVE_FORMATS
+from antenati.arkindex import ArkIndex
+from antenati.batch import Batch, GalleryReport, read_batch_file
+from antenati.cache import ResponseCache
+from antenati.downloader import (
+    DEFAULT_ENGINE,
+    DEFAULT_MAX_ADAPTIVE_WORKERS,
+    DEFAULT_N_THREADS,
+    DEFAULT_SIZE,
+    DEFAULT_TILE_SIZE,
+    DEFAULT_TILE_WORKERS,
+    ENGINES,
+    Downloader,
+    ProgressBar,
+)
+from antenati.journal import Journal
+from antenati.plan import parse_shard, write_plan
+from antenati.processes import ProcessOptions, Unit, run_processes, shard_gallery
+from antenati.ratelimit import RateLimiter
+from antenati.store import ContentStore
+
+
+def _shard(text: str) -> tuple[int, int]:
+    """argparse type for ``--shard I/N``."""
+    try:
+        return parse_shard(text)
+    except ValueError as ex:
+        raise ArgumentTypeError(str(ex)) from ex
+
+
+def _processors(value: str) -> tuple[str, ...]:
+    """argparse type for ``--process NAME[,NAME...]``: built-in processors whose requirements are installed."""
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    if not names:
+        raise ArgumentTypeError('no processors given')
+    for name in names:
+        if name not in pipeline.PROCESSORS:
+            raise ArgumentTypeError(f'unknown processor {name!r} (choose from {", ".join(pipeline.PROCESSORS)})')
+        missing = pipeline.missing_requirement(name)
+        if missing is not None:
+            raise ArgumentTypeError(f'processor {name!r} requires {missing}')
+    return names
+
+
+def _derivative_sizes(value: str) -> tuple[int, ...]:
+    """argparse type for ``--derivatives SIZE[,SIZE...]``."""
+    try:
+        sizes = tuple(sorted({int(size) for size in value.split(',')}))
+    except ValueError:
+        raise ArgumentTypeError(f'invalid sizes: {value!r}') from None
+    if sizes[0] <= 0:
+        raise ArgumentTypeError(f'sizes must be positive: {value!r}')
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        raise ArgumentTypeError('derivatives require Pillow: pip install "antenati[images]"') from None
+    return sizes
 
 
 def _configure_logging(verbosity: int) -> None:
@@ -30,20 +91,198 @@ def _configure_logging(verbosity: int) -> None:
     logging.basicConfig(level=level, format='%(levelname)s %(name)s: %(message)s')
 
 
-def run_cli(downloader: Downloader, n_workers: int, size: int) -> int:
+_SIZE_SUFFIXES: dict[str, int] = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+
+def _byte_rate(value: str) -> int:
+    """Parse a bandwidth such as ``500K`` or ``2M`` (binary multiples) to bytes per second."""
+    number, suffix = value[:-1], value[-1:].upper()
+    if suffix not in _SIZE_SUFFIXES:
+        number, suffix = value, ''
+    try:
+        rate = int(float(number) * _SIZE_SUFFIXES[suffix])
+    except ValueError:
+        raise ArgumentTypeError(f'invalid bandwidth: {value!r}') from None
+    if rate <= 0:
+        raise ArgumentTypeError(f'bandwidth must be positive: {value!r}')
+    return rate
+
+
+def run_cli(
+    downloader: Downloader,
+    n_workers: int,
+    size: int,
+    resume: bool = False,
+    engine: str = DEFAULT_ENGINE,
+    adaptive: bool = False,
+    final_pass: bool = False,
+) -> int:
     """Run the download with a tqdm progress bar attached."""
     with tqdm(unit='img') as progress:
         progress_bar = ProgressBar(progress.reset, progress.update)  # type: ignore[arg-type]
-        return downloader.run(n_workers, size, progress_bar)
+        if engine == 'async':
+            return asyncio.run(downloader.run_async(n_workers, size, progress_bar, resume=resume, final_pass=final_pass))
+        return downloader.run(n_workers, size, progress_bar, resume=resume, adaptive=adaptive, final_pass=final_pass)
+
+
+def run_batch_cli(batch: Batch, n_workers: int, size: int) -> int:
+    """Run a batch with an overall tqdm progress bar and a line per finished gallery.
+
+    Returns the n. of galleries that failed.
+    """
+    return _run_reports_cli(len(batch.reports), lambda progress, on_gallery: batch.run(n_workers, size, progress, on_gallery))
+
+
+def run_processes_cli(units: list[Unit], n_processes: int, options: ProcessOptions) -> tuple[int, int]:
+    """Run ``units`` in worker processes, with the progress bar of :func:`run_batch_cli`.
+
+    Returns the n. of units that failed and the total bytes written.
+    """
+    received = 0
+
+    def run(progress: ProgressBar, on_gallery: Callable[[GalleryReport], None]) -> None:
+        nonlocal received
+        reports = run_processes(units, n_processes, options, progress, on_gallery)
+        received = sum(r.received for r in reports)
+
+    n_failed = _run_reports_cli(len(units), run)
+    return n_failed, received
+
+
+def _run_reports_cli(n_galleries: int, run: Callable[[ProgressBar, Callable[[GalleryReport], None]], object]) -> int:
+    """Call ``run`` with an overall tqdm progress bar and a line per finished gallery.
+
+    Returns the n. of galleries that failed.
+    """
+    n_failed = 0
+    n_finished = 0
+    with tqdm(unit='img') as progress:
+
+        def set_total(total: int) -> None:
+            # The total grows with each manifest: keep the count.
+            progress.total = total
+            progress.refresh()
+
+        def on_gallery(report: GalleryReport) -> None:
+            nonlocal n_failed, n_finished
+            name = f'{report.dirname or report.url}'
+            if report.shard is not None:
+                name += f' (shard {report.shard[0]}/{report.shard[1]})'
+            if report.ok:
+                tqdm.write(f'{name}: {report.done} images, {naturalsize(report.received, True)}')
+            else:
+                n_failed += 1
+                tqdm.write(f'{name}: FAILED: {report.error}')
+            n_finished += 1
+            progress.set_postfix_str(f'{n_finished}/{n_galleries} galleries')
+
+        run(ProgressBar(set_total, progress.update), on_gallery)  # type: ignore[arg-type]
+    return n_failed
+
+
+def verify_main(argv: list[str]) -> int:
+    """Entry point of ``antenati verify``. Returns the process exit status."""
+    parser = ArgumentParser(
+        prog='antenati verify',
+        description='Check galleries downloaded by antenati against their sidecar index',
+        epilog=__copyright__,
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('dirs', metavar='DIR', type=Path, nargs='+', help='gallery directory, or a directory containing galleries')
+    parser.add_argument('-j', '--jobs', type=int, default=verify.DEFAULT_N_PROCESSES, help='n. of checking processes (default: one per CPU)')
+    parser.add_argument('--quick', action='store_true', help='compare sizes with the index only, without hashing')
+    parser.add_argument('--requeue', action='store_true', help='delete bad files so that a --resume run downloads them again')
+    parser.add_argument('--verbose', action='count', default=0, help='increase logging verbosity')
+    args = parser.parse_args(argv)
+
+    _configure_logging(args.verbose)
+    galleries = [gallery for root in args.dirs for gallery in verify.find_galleries(root)]
+    reports = verify.verify_galleries(galleries, args.jobs, quick=args.quick)
+    n_bad = 0
+    for report in reports:
+        for name, reason in report.bad.items():
+            print(f'{report.dirname / name}: {reason}')
+        n_bad += len(report.bad)
+        if args.requeue and not report.ok:
+            verify.requeue(report)
+    n_checked = sum(r.checked for r in reports)
+    print(f'Checked {n_checked} files in {len(reports)} galleries: {n_bad} bad.')
+    if n_bad and args.requeue:
+        print('Bad files removed: download them again with --resume.')
+    return 1 if n_bad else 0
+
+
+def index_main(argv: list[str]) -> int:
+    """Entry point of ``antenati index``. Returns the process exit status."""
+    parser = ArgumentParser(
+        prog='antenati index',
+        description='Import gallery to manifest URL mappings, so that antenati skips the gallery pages of those galleries',
+        epilog=__copyright__,
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('csvs', metavar='CSV', type=Path, nargs='+', help='CSV file with manifest_url and ark_id and/or archive_id columns')
+    parser.add_argument('--verbose', action='count', default=0, help='increase logging verbosity')
+    args = parser.parse_args(argv)
+
+    _configure_logging(args.verbose)
+    index = ArkIndex()
+    for csv_path in args.csvs:
+        try:
+            n_entries = index.import_csv(csv_path)
+        except (OSError, ValueError) as ex:
+            print(ex, file=sys.stderr)
+            return 1
+        print(f'{csv_path}: {n_entries} entries imported.')
+    return 0
+
+
+def derive_main(argv: list[str]) -> int:
+    """Entry point of ``antenati derive``. Returns the process exit status."""
+    parser = ArgumentParser(
+        prog='antenati derive',
+        description='Save the images of downloaded galleries scaled to fit each SIZE x SIZE, in a SIZEpx folder of each gallery',
+        epilog=__copyright__,
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('dirs', metavar='DIR', type=Path, nargs='+', help='gallery directory, or a directory containing galleries')
+    parser.add_argument('-s', '--sizes', metavar='SIZE[,SIZE...]', type=_derivative_sizes, required=True, help='sizes of the boxes to fit the images in')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='n. of processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='make the derivatives again even when they are there')
+    parser.add_argument('--verbose', action='count', default=0, help='increase logging verbosity')
+    args = parser.parse_args(argv)
+
+    _configure_logging(args.verbose)
+    from antenati import derivatives
+
+    galleries = [gallery for root in args.dirs for gallery in verify.find_galleries(root)]
+    n_images, failed = derivatives.derive_galleries(galleries, args.sizes, args.jobs, force=args.force)
+    for image, reason in sorted(failed.items()):
+        print(f'{image}: {reason}')
+    print(f'Derivatives of {n_images} images in {len(galleries)} galleries: {len(failed)} failed.')
+    return 1 if failed else 0
 
 
-def main() -> None:
+def main(argv: list[str] | None = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['verify']:
+        sys.exit(verify_main(argv[1:]))
+    if argv[:1] == ['index']:
+        sys.exit(index_main(argv[1:]))
+    if argv[:1] == ['derive']:
+        sys.exit(derive_main(argv[1:]))
     parser = ArgumentParser(
-        description='Download data from the Portale Antenati',
+        description='Download data from the Portale Antenati. See "antenati verify -h", "antenati index -h" and "antenati derive -h" for the subcommands.',
         epilog=__copyright__,
         formatter_class=ArgumentDefaultsHelpFormatter,
     )
-    parser.add_argument('url', metavar='URL', type=str, help='url of the gallery page or of its IIIF manifest')
+    parser.add_argument('url', metavar='URL', type=str, nargs='?', help='url of the gallery page or of its IIIF manifest')
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        type=Path,
+        help='download all the galleries listed in FILE (one URL per line) with one pool of threads, instead of URL',
+    )
     parser.add_argument(
         '-s',
         '--size',
@@ -51,12 +290,32 @@ def main() -> None:
         default=DEFAULT_SIZE,
         help='image size in pixel (0 means full size)',
     )
+    parser.add_argument(
+        '--probe-sizes',
+        action='store_true',
+        help='with --size, request the largest size the image server has ready that fits, read from a sample of info.json',
+    )
     parser.add_argument(
         '-n',
         '--nthreads',
         type=int,
         default=DEFAULT_N_THREADS,
-        help='max n. of threads',
+        help='max n. of threads (of concurrent requests with --engine async)',
+    )
+    parser.add_argument(
+        '--adaptive',
+        metavar='MAX',
+        type=int,
+        nargs='?',
+        const=DEFAULT_MAX_ADAPTIVE_WORKERS,
+        default=None,
+        help=f'adapt the n. of concurrent requests to the server, up to MAX ({DEFAULT_MAX_ADAPTIVE_WORKERS} if omitted); overrides --nthreads',
+    )
+    parser.add_argument(
+        '--engine',
+        choices=ENGINES,
+        default=DEFAULT_ENGINE,
+        help='download engine: one thread per request, or asyncio (needs "pip install antenati[async]")',
     )
     parser.add_argument(
         '-f',
@@ -78,6 +337,119 @@ def main() -> None:
         action='store_true',
         help='include the archive and image IDs in the saved file names',
     )
+    parser.add_argument(
+        '-r',
+        '--resume',
+        action='store_true',
+        help='continue an interrupted download, skipping images already complete on disk',
+    )
+    parser.add_argument(
+        '--final-pass',
+        action='store_true',
+        help='try the images that failed once more at the end, with fewer threads',
+    )
+    parser.add_argument(
+        '--tiles',
+        metavar='SIZE',
+        type=int,
+        nargs='?',
+        const=DEFAULT_TILE_SIZE,
+        default=None,
+        help=f'fetch full-size images as SIZE x SIZE tiles ({DEFAULT_TILE_SIZE} if omitted), {DEFAULT_TILE_WORKERS} at a time, and stitch them into PNGs',
+    )
+    parser.add_argument(
+        '--archive',
+        choices=ARCHIVE_FORMATS,
+        default=None,
+        help='write the images of each gallery into one archive inside its folder, as they finish, instead of a file each',
+    )
+    parser.add_argument(
+        '--pdf',
+        action='store_true',
+        help='also assemble the images of each gallery into one PDF inside its folder, once they are all downloaded',
+    )
+    parser.add_argument(
+        '--process',
+        metavar='NAME[,NAME...]',
+        type=_processors,
+        default=None,
+        help=f'run the processors NAMEs ({", ".join(pipeline.PROCESSORS)}) on each image, in worker processes, as it is downloaded',
+    )
+    parser.add_argument(
+        '--derivatives',
+        metavar='SIZE[,SIZE...]',
+        type=_derivative_sizes,
+        default=None,
+        help='also save each image scaled to fit each SIZE x SIZE, in a SIZEpx folder of its gallery, in the worker processes of --process',
+    )
+    parser.add_argument(
+        '--process-workers',
+        metavar='N',
+        type=int,
+        default=None,
+        help='n. of worker processes running --process (one per CPU if not set, one per download process with --processes)',
+    )
+    parser.add_argument(
+        '--store',
+        metavar='DIR',
+        type=Path,
+        default=None,
+        help='keep one copy of each image in the DIR store, hard-linked into the galleries, and link the images already there instead of downloading them',
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=http.DEFAULT_CHUNK_SIZE,
+        help='size in bytes of the blocks streamed from each image to disk',
+    )
+    parser.add_argument(
+        '--max-host-connections',
+        type=int,
+        default=None,
+        help='max n. of connections kept open to each server (one per thread if not set)',
+    )
+    parser.add_argument(
+        '--max-rate',
+        type=float,
+        default=None,
+        help='max requests per second, shared by all the antenati runs on this machine',
+    )
+    parser.add_argument(
+        '--max-bandwidth',
+        type=_byte_rate,
+        default=None,
+        help='max bytes per second (e.g. 500K, 2M), shared by all the antenati runs on this machine',
+    )
+    parser.add_argument(
+        '--processes',
+        metavar='N',
+        type=int,
+        default=None,
+        help='download in N worker processes, each with --nthreads threads: a gallery of --batch each, or a shard of URL each',
+    )
+    parser.add_argument(
+        '--shard',
+        metavar='I/N',
+        type=_shard,
+        help='download only shard I of N (1 <= I <= N) of each gallery, to share it out between N machines',
+    )
+    parser.add_argument(
+        '--export-plan',
+        metavar='FILE',
+        type=Path,
+        help='dry run: list the images that would be downloaded in FILE (NDJSON, or a JSON array if FILE ends in .json) and exit',
+    )
+    parser.add_argument(
+        '--journal',
+        metavar='FILE',
+        type=Path,
+        help='record the job in the FILE database; run the same command again to continue it after a crash',
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='do not keep gallery pages, manifests and manifest URLs in the user cache directory',
+    )
     parser.add_argument('-v', '--version', action='version', version=__version__)
     parser.add_argument(
         '--verbose',
@@ -85,14 +457,152 @@ def main() -> None:
         default=0,
         help='increase logging verbosity (--verbose for INFO, --verbose --verbose for DEBUG)',
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.max_rate is not None and args.max_rate <= 0:
+        parser.error('--max-rate must be positive')
+    if args.adaptive is not None and args.engine != 'threads':
+        parser.error('--adaptive is only supported by the threads engine')
+    if args.tiles is not None and args.tiles <= 0:
+        parser.error('--tiles must be positive')
+    if args.tiles is not None and (args.engine != 'threads' or (args.batch is not None and args.processes is None)):
+        parser.error('--tiles is only supported by the threads engine, and with --batch only together with --processes')
+    if args.pdf and (args.archive is not None or args.shard is not None or (args.processes is not None and args.url is not None)):
+        parser.error('--pdf needs the whole gallery on disk: it does not support --archive, --shard and --processes with URL')
+    if args.pdf and 'webp' in (args.process or ()):
+        parser.error('--pdf embeds JPEG and PNG images as they are: it does not support --process webp')
+    if (args.process or args.derivatives) and args.archive is not None:
+        parser.error('--process and --derivatives work on the images on disk: they do not support --archive')
+    if args.store is not None and args.archive is not None:
+        parser.error('--store links the images on disk: it does not support --archive')
+    if args.process_workers is not None and args.process_workers <= 0:
+        parser.error('--process-workers must be positive')
+    if (args.url is None) == (args.batch is None):
+        parser.error('pass either URL or --batch FILE')
+    if args.batch is not None and (args.adaptive is not None or args.engine != 'threads' or args.final_pass or args.first != 0 or args.last is not None):
+        parser.error('--batch does not support --adaptive, --engine async, --final-pass, --first and --last')
+    if args.processes is not None:
+        if args.processes <= 0:
+            parser.error('--processes must be positive')
+        if args.adaptive is not None or args.engine != 'threads' or args.final_pass or args.first != 0 or args.last is not None or args.export_plan is not None:
+            parser.error('--processes does not support --adaptive, --engine async, --final-pass, --first, --last and --export-plan')
+        if args.url is not None and args.shard is not None:
+            parser.error('--processes already splits URL into shards, one per process: drop --shard')
 
     _configure_logging(args.verbose)
-    downloader = Downloader(args.url, args.first, args.last, descriptive_names=args.descriptive_names)
-    downloader.print_gallery_info()
-    downloader.check_dir()
-    gallery_size = run_cli(downloader, args.nthreads, args.size)
-    print(f'Done. Total size: {naturalsize(gallery_size, True)}')
+    if args.processes is not None:
+        options = ProcessOptions(
+            n_workers=args.nthreads,
+            size=args.size,
+            resume=args.resume,
+            descriptive_names=args.descriptive_names,
+            chunk_size=args.chunk_size,
+            max_host_connections=args.max_host_connections,
+            max_rate=args.max_rate,
+            max_bandwidth=args.max_bandwidth,
+            cache=not args.no_cache,
+            index=not args.no_cache,
+            journal=args.journal,
+            probe_sizes=args.probe_sizes,
+            tile_size=args.tiles,
+            archive=args.archive,
+            pdf=args.pdf,
+            process=args.process or (),
+            derivatives=args.derivatives or (),
+            process_workers=args.process_workers or 1,
+            store=args.store,
+            log_level=logging.getLogger().getEffectiveLevel(),
+        )
+        if args.batch is not None:
+            units = [Unit(url, args.shard) for url in read_batch_file(args.batch)]
+        else:
+            units = shard_gallery(args.url, args.processes, options, interactive=True)
+        n_failed, total_size = run_processes_cli(units, args.processes, options)
+        print(f'Done. {len(units)} parts, {n_failed} failed. Total size: {naturalsize(total_size, True)}')
+        sys.exit(1 if n_failed else 0)
+    limiter = None
+    if args.max_rate is not None or args.max_bandwidth is not None:
+        limiter = RateLimiter(args.max_rate, args.max_bandwidth)
+    if args.export_plan is not None:
+        urls = read_batch_file(args.batch) if args.batch is not None else [args.url]
+        items = []
+        for url in urls:
+            downloader = Downloader(
+                url,
+                args.first,
+                args.last,
+                descriptive_names=args.descriptive_names,
+                cache=None if args.no_cache else ResponseCache(),
+                index=None if args.no_cache else ArkIndex(),
+                shard=args.shard,
+                probe_sizes=args.probe_sizes,
+            )
+            items.extend(downloader.plan(args.size))
+        n_items = write_plan(items, args.export_plan)
+        print(f'Plan of {n_items} images written to {args.export_plan}')
+        return
+    store = ContentStore(args.store) if args.store is not None else None
+    processors = pipeline.processors(args.process or (), args.derivatives or ())
+    # The journal must be closed to commit the last transitions, and the
+    # pipeline to process the last images.
+    with (
+        Journal(args.journal) if args.journal is not None else nullcontext() as journal,
+        pipeline.Pipeline(processors, args.process_workers) if processors else nullcontext() as stage,
+    ):
+        if args.batch is not None:
+            batch = Batch(
+                read_batch_file(args.batch),
+                resume=args.resume,
+                descriptive_names=args.descriptive_names,
+                chunk_size=args.chunk_size,
+                max_host_connections=args.max_host_connections,
+                rate_limiter=limiter,
+                cache=None if args.no_cache else ResponseCache(),
+                index=None if args.no_cache else ArkIndex(),
+                journal=journal,
+                shard=args.shard,
+                probe_sizes=args.probe_sizes,
+                archive=args.archive,
+                pdf=args.pdf,
+                pipeline=stage,
+                store=store,
+            )
+            n_failed = run_batch_cli(batch, args.nthreads, args.size)
+            total_size = sum(r.received for r in batch.reports)
+            print(f'Done. {len(batch.reports)} galleries, {n_failed} failed. Total size: {naturalsize(total_size, True)}')
+            sys.exit(1 if n_failed else 0)
+        downloader = Downloader(
+            args.url,
+            args.first,
+            args.last,
+            descriptive_names=args.descriptive_names,
+            chunk_size=args.chunk_size,
+            max_host_connections=args.max_host_connections,
+            rate_limiter=limiter,
+            cache=None if args.no_cache else ResponseCache(),
+            index=None if args.no_cache else ArkIndex(),
+            journal=journal,
+            shard=args.shard,
+            probe_sizes=args.probe_sizes,
+            tile_size=args.tiles,
+            archive=args.archive,
+            pdf=args.pdf,
+            pipeline=stage,
+            store=store,
+        )
+        downloader.print_gallery_info()
+        downloader.check_dir(resume=args.resume)
+        adaptive = args.adaptive is not None
+        n_workers = args.adaptive if adaptive else args.nthreads
+        gallery_size = run_cli(
+            downloader,
+            n_workers,
+            args.size,
+            resume=args.resume,
+            engine=args.engine,
+            adaptive=adaptive,
+            final_pass=args.final_pass,
+        )
+        print(f'Done. Total size: {naturalsize(gallery_size, True)}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Adaptive concurrency for :meth:`antenati.downloader.Downloader.run`.
+
+The throughput of the SAN servers varies by an order of magnitude over
+the day, so no fixed ``--nthreads`` is right for long. With ``adaptive``
+the downloader asks an :class:`AimdController` how many requests to keep
+in flight, and reports to it every image that completes.
+
+The controller follows the additive-increase/multiplicative-decrease
+scheme of TCP congestion control. Completions are grouped in windows of
+``limit`` images, about one round of requests each. At the end of a
+window the limit grows by one if the server is keeping up: the time to
+first byte (TTFB) stays close to the best seen and throughput did not
+drop. It is halved when the TTFB grows well beyond that baseline, which
+means requests are queueing at the server, and right away when the
+server throttles (any of :data:`antenati.http.RETRYABLE_STATUSES`).
+After a decrease, the completions of the requests already in flight at
+the old limit are ignored, so one overload is not punished twice.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable
+from statistics import median
+
+logger = logging.getLogger(__name__)
+
+# Requests added per window while the server keeps up.
+ADDITIVE_INCREASE: int = 1
+# Factor applied to the limit on throttling or queueing.
+MULTIPLICATIVE_DECREASE: float = 0.5
+# A window whose median TTFB exceeds the baseline by this factor is taken
+# as requests queueing at the server.
+LATENCY_TOLERANCE: float = 2.0
+# Fraction of the previous window's throughput a window must reach for
+# the limit to keep growing: below it, more requests are not helping.
+THROUGHPUT_TOLERANCE: float = 0.95
+# The TTFB baseline is the lowest window median, raised by this factor
+# every window: the server may get slower for good (evening traffic) and
+# a baseline from the morning would otherwise pin the limit to the floor.
+BASELINE_DRIFT: float = 1.05
+
+
+class AimdController:
+    """Pick the number of requests in flight from the replies they get.
+
+    Not thread-safe: :meth:`record` is meant to be called by the thread
+    that collects the results, as :meth:`Downloader.run` does.
+    """
+
+    def __init__(self, max_limit: int, initial: int = 2, min_limit: int = 1, clock: Callable[[], float] = time.monotonic) -> None:
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(f'invalid concurrency bounds {min_limit}..{max_limit}')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(max(initial, min_limit), max_limit)
+        self._clock = clock
+        self._baseline: float | None = None
+        self._throughput: float | None = None
+        self._cooldown = 0
+        self._start_window()
+
+    def _start_window(self) -> None:
+        self._window_start = self._clock()
+        self._completed = 0
+        self._ttfbs: list[float] = []
+
+    def record(self, ttfb: float | None, throttled: bool = False) -> None:
+        """Account for a completed request.
+
+        ``ttfb`` is the time from sending the request to receiving the
+        reply headers, None if unknown (e.g. the request failed before).
+        ``throttled`` tells whether the server answered with a retryable
+        status on the way.
+        """
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+        if throttled:
+            self._decrease('server is throttling')
+            return
+        self._completed += 1
+        if ttfb is not None:
+            self._ttfbs.append(ttfb)
+        if self._completed >= self.limit:
+            self._end_window()
+
+    def _end_window(self) -> None:
+        elapsed = self._clock() - self._window_start
+        throughput = self._completed / elapsed if elapsed > 0 else float('inf')
+        latency = median(self._ttfbs) if self._ttfbs else None
+        baseline = self._baseline
+        if latency is not None:
+            self._baseline = latency if baseline is None else min(latency, baseline * BASELINE_DRIFT)
+        if latency is not None and baseline is not None and latency > baseline * LATENCY_TOLERANCE:
+            self._decrease(f'TTFB {latency:.2f} s, baseline {baseline:.2f} s')
+            return
+        if self._throughput is None or throughput >= self._throughput * THROUGHPUT_TOLERANCE:
+            self._increase()
+        self._throughput = throughput
+        self._start_window()
+
+    def _increase(self) -> None:
+        limit = min(self.limit + ADDITIVE_INCREASE, self.max_limit)
+        if limit != self.limit:
+            logger.debug('Concurrency raised to %d', limit)
+        self.limit = limit
+
+    def _decrease(self, reason: str) -> None:
+        limit = max(int(self.limit * MULTIPLICATIVE_DECREASE), self.min_limit)
+        if limit != self.limit:
+            logger.info('Concurrency lowered from %d to %d: %s', self.limit, limit, reason)
+        # The requests still in flight were sent at the old limit.
+        self._cooldown = self.limit - 1
+        self.limit = limit
+        self._throughput = None
+        self._start_window()
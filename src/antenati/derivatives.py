@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Make thumbnails and previews of the downloaded images, several sizes from one master.
+
+Downloading a gallery again at another ``--size`` costs the whole
+transfer again, and resizing the full-resolution images one by one
+decodes every pixel of each. :func:`make_derivatives` decodes each image
+once, and a JPEG only at the resolution the largest derivative needs:
+Pillow's draft mode has libjpeg scale the image by 1/2, 1/4 or 1/8 while
+decoding it, in the DCT domain, so most of the pixels of the master are
+never computed. Each smaller size is then resized from the one before
+it.
+
+The derivative of ``0001.jpg`` at size ``256`` is ``256px/0001.jpg`` in
+the gallery directory: a sub-directory per size, ignored by the resume
+and by ``antenati verify``. :class:`Derivatives` runs it as a processor
+of :class:`antenati.pipeline.Pipeline`, as each image is downloaded;
+``antenati derive`` runs it on the galleries already on disk.
+
+Pillow is an optional dependency (``pip install antenati[images]``):
+this module is only imported when derivatives are requested.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+from collections.abc import Iterable, Sequence
+from concurrent.futures import Future
+from dataclasses import dataclass
+from os import replace
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError as exc:  # pragma: no cover - depends on the environment
+    raise ImportError('Making derivatives requires Pillow: pip install "antenati[images]"') from exc
+
+from antenati import storage
+from antenati.pipeline import Pipeline, Processed
+
+logger = logging.getLogger(__name__)
+
+# JPEG quality of the derivatives: plenty for images meant to be browsed.
+DEFAULT_QUALITY: int = 85
+
+# Modes saved as JPEG as they are; any other is converted to RGB.
+_JPEG_MODES: frozenset[str] = frozenset({'L', 'RGB', 'CMYK'})
+# The images a gallery directory can hold, beside its PDF or archive.
+_IMAGE_SUFFIXES: frozenset[str] = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+
+
+def derivative_path(image: Path, size: int) -> Path:
+    """Return where the derivative of ``image`` at ``size`` goes."""
+    return image.parent / f'{size}px' / f'{image.stem}.jpg'
+
+
+def make_derivatives(image: Path, sizes: Sequence[int], quality: int = DEFAULT_QUALITY) -> list[Path]:
+    """Save ``image`` scaled to fit each of the ``sizes`` x ``sizes`` boxes, as JPEG. Returns their paths.
+
+    An image smaller than a box is saved at its own size.
+    """
+    if not sizes or min(sizes) <= 0:
+        raise ValueError(f'sizes must be positive, got {list(sizes)}')
+    paths = []
+    with Image.open(image) as master:
+        largest = max(sizes)
+        # Only JPEGs have a draft mode: libjpeg decodes them at the
+        # smallest 1/2^n scale still at least as large as the box.
+        master.draft(master.mode if master.mode in _JPEG_MODES else 'RGB', (largest, largest))
+        current = master.convert('RGB') if master.mode not in _JPEG_MODES else master.copy()
+    try:
+        for size in sorted(set(sizes), reverse=True):
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
+            path = derivative_path(image, size)
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f'{path.name}{storage.PART_SUFFIX}')
+            current.save(tmp, 'JPEG', quality=quality, optimize=True)
+            replace(tmp, path)
+            paths.append(path)
+    finally:
+        current.close()
+    logger.debug('%s: %d derivatives', image.name, len(paths))
+    return paths
+
+
+@dataclass(frozen=True)
+class Derivatives:
+    """A :class:`antenati.pipeline.Pipeline` processor making the derivatives of each image at ``sizes``.
+
+    It leaves the image as it is, so it goes before the processors that
+    rewrite it.
+    """
+
+    sizes: tuple[int, ...]
+    quality: int = DEFAULT_QUALITY
+
+    def __call__(self, path: Path) -> Path:
+        make_derivatives(path, self.sizes, self.quality)
+        return path
+
+
+def missing(image: Path, sizes: Sequence[int]) -> bool:
+    """Return True when a derivative of ``image`` at one of the ``sizes`` is not there yet."""
+    return any(not derivative_path(image, size).exists() for size in sizes)
+
+
+def derive_galleries(dirnames: Iterable[Path], sizes: Sequence[int], n_processes: int | None = None, force: bool = False) -> tuple[int, dict[Path, str]]:
+    """Make the derivatives of the images in the gallery directories ``dirnames``, in ``n_processes`` processes.
+
+    Images whose derivatives are all there already are skipped, unless
+    ``force``. Returns the number of images processed, and why each of
+    those that failed did.
+    """
+    derivatives = Derivatives(tuple(sizes))
+    failed: dict[Path, str] = {}
+    n_images = 0
+
+    def done(image: Path, future: Future[Processed]) -> None:
+        if future.exception() is not None:
+            failed[image] = str(future.exception())
+
+    with Pipeline([derivatives], n_processes) as pipeline:
+        for dirname in dirnames:
+            for image in sorted(storage.scan_dir(dirname).values()):
+                if image.suffix.lower() not in _IMAGE_SUFFIXES or not (force or missing(image, sizes)):
+                    continue
+                pipeline.submit(image, functools.partial(done, image))
+                n_images += 1
+    return n_images, failed
@@ -6,7 +6,8 @@ The :class:`Downloader` is the main entry point used by both the CLI
 (:mod:`antenati.cli`) and the GUI (:mod:`antenati.gui`). It composes the
 side-effect free helpers from :mod:`antenati.iiif` with the HTTP session
 built in :mod:`antenati.http`, and runs the per-canvas image downloads in
-a thread pool.
+a thread pool or, with :meth:`Downloader.run_async`, on an asyncio event
+loop (see :mod:`antenati.aio`).
 
 Keeping this orchestration in its own module makes it possible to embed
 the downloader from third-party scripts without depending on the CLI
@@ -15,29 +16,69 @@ plumbing (``argparse``, ``click.confirm``, ``tqdm``).
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import json
 import logging
 import threading
+import time
 from collections.abc import Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from json import loads
-from mimetypes import guess_extension
-from os import mkdir, path
+from os import mkdir, path, replace
 from pathlib import Path
 from sys import exit as sys_exit
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from click import confirm, echo
-from requests import RequestException, Session
+from requests import HTTPError, RequestException, Session
 from slugify import slugify
 
-from antenati import http, iiif
-from antenati.errors import AntenatiError, ThreadError
+from antenati import http, iiif, pdf, plan, storage
+from antenati.archive import FORMATS as ARCHIVE_FORMATS
+from antenati.archive import GalleryArchive
+from antenati.arkindex import ArkIndex
+from antenati.cache import ResponseCache
+from antenati.concurrency import AimdController
+from antenati.errors import AntenatiError, ManifestError, ThreadError
+from antenati.journal import CanvasState, Journal
+from antenati.pipeline import Pipeline, Processed, webp
+from antenati.plan import PlanItem
+from antenati.ratelimit import RateLimiter
+from antenati.scheduler import THREADS_ERRORS, DownloadPass, ErrorKinds, RetryScheduler
+from antenati.store import ContentStore
+
+if TYPE_CHECKING:
+    import aiohttp
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_SIZE: int = 0
 DEFAULT_N_THREADS: int = 2
+# Upper bound on the requests in flight when Downloader.run is adaptive.
+DEFAULT_MAX_ADAPTIVE_WORKERS: int = 32
+
+# Side in pixels of the regions a full-resolution image is split into
+# with tile_size, and the tiles fetched at once by a Downloader.
+DEFAULT_TILE_SIZE: int = 2048
+DEFAULT_TILE_WORKERS: int = 4
+
+# ``threads`` is Downloader.run (one OS thread per in-flight request),
+# ``async`` is Downloader.run_async (coroutines on a single thread).
+ENGINES: tuple[str, ...] = ('threads', 'async')
+DEFAULT_ENGINE: str = 'threads'
+
+# The final pass over failed canvases runs with this many times fewer
+# workers than the main one: those canvases failed under load.
+FINAL_PASS_DIVISOR: int = 4
+
+# Canvases whose info.json is read to learn the sizes the image server
+# has ready, spread over the gallery: first, middle and last.
+PROBE_SAMPLE: int = 3
+
+# How often an idle asyncio run checks its (threading) cancel event.
+_CANCEL_POLL_INTERVAL: float = 0.5
 
 
 @dataclass
@@ -59,50 +100,163 @@ class Downloader:
     url: str
     session: Session
     descriptive_names: bool
+    chunk_size: int
+    max_host_connections: int | None
+    rate_limiter: RateLimiter | None
+    cache: ResponseCache | None
+    index: ArkIndex | None
+    journal: Journal | None
+    probe_sizes: bool
+    tile_size: int | None
+    tile_workers: int
+    archive: str | None
+    pdf: bool
+    pipeline: Pipeline | None
+    store: ContentStore | None
+    restored: bool
+    connection_stats: http.ConnectionStats
+    manifest_url: str
     manifest: dict[str, Any]
-    canvases: list[dict[str, Any]]
+    canvases: list[iiif.Canvas]
     archive_id: str
     ark_id: str
     dirname: Path
     gallery_length: int
 
-    def __init__(self, url: str, first: int, last: int | None, descriptive_names: bool = False):
+    def __init__(
+        self,
+        url: str,
+        first: int,
+        last: int | None,
+        descriptive_names: bool = False,
+        chunk_size: int = http.DEFAULT_CHUNK_SIZE,
+        max_host_connections: int | None = None,
+        rate_limiter: RateLimiter | None = None,
+        cache: ResponseCache | None = None,
+        index: ArkIndex | None = None,
+        session: Session | None = None,
+        journal: Journal | None = None,
+        shard: tuple[int, int] | None = None,
+        probe_sizes: bool = False,
+        tile_size: int | None = None,
+        tile_workers: int = DEFAULT_TILE_WORKERS,
+        archive: str | None = None,
+        pdf: bool = False,
+        pipeline: Pipeline | None = None,
+        store: ContentStore | None = None,
+    ):
+        if chunk_size <= 0:
+            raise ValueError(f'chunk_size must be positive, got {chunk_size}')
+        if max_host_connections is not None and max_host_connections <= 0:
+            raise ValueError(f'max_host_connections must be positive, got {max_host_connections}')
+        if tile_size is not None and tile_size <= 0:
+            raise ValueError(f'tile_size must be positive, got {tile_size}')
+        if tile_workers <= 0:
+            raise ValueError(f'tile_workers must be positive, got {tile_workers}')
+        if archive is not None and archive not in ARCHIVE_FORMATS:
+            raise ValueError(f'archive must be one of {ARCHIVE_FORMATS}, got {archive!r}')
+        if pdf and (archive is not None or shard is not None):
+            raise ValueError('pdf is not supported with archive or shard')
+        if pdf and pipeline is not None and webp in pipeline.processors:
+            # The PDF embeds JPEG and PNG images as they are, and would be left without pages.
+            raise ValueError('pdf is not supported with the webp processor')
+        if (pipeline is not None or store is not None) and archive is not None:
+            raise ValueError('pipeline and store are not supported with archive')
         self.url = url
-        self.session = http.build_session()
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.index = index
+        self.journal = journal
+        self.probe_sizes = probe_sizes
+        self.tile_size = tile_size
+        self.tile_workers = tile_workers
+        self.__tile_pool: ThreadPoolExecutor | None = None
+        self.archive = archive
+        self.__archive: GalleryArchive | None = None
+        self.pdf = pdf
+        self.pipeline = pipeline
+        self.store = store
+        # Files of this gallery still in the pipeline, and the index
+        # entries of those it renamed, dropped on close().
+        self.__processing = threading.Condition()
+        self.__n_processing = 0
+        self.__replaced: set[str] = set()
+        self.__planned: list[iiif.ImageTarget] | None = None
+        self.__downscales: iiif.Downscales | None = None
+        self.__probed = False
+        self.__first = first
+        self.__last = last
+        self.__shard = f'{shard[0]}/{shard[1]}' if shard is not None else ''
+        # A session passed in is shared with other downloaders (see
+        # antenati.batch), and so are its connection pools and statistics.
+        self.session = session if session is not None else http.build_session(limiter=rate_limiter)
+        self.connection_stats = http.connection_stats(self.session)
         self.descriptive_names = descriptive_names
+        self.chunk_size = chunk_size
+        self.max_host_connections = max_host_connections
         # A gallery URL embeds the archive ID: extract it up front so a
         # malformed URL fails before any network round-trip. A manifest
         # URL does not embed it; in that case it is recovered after the
         # fetch from the first canvas @id, the only place the manifest
         # repeats it.
         archive_id = None if iiif.is_manifest_url(url) else iiif.get_archive_id_from_url(url)
-        logger.info('Loading manifest from %s', url)
-        self.manifest = self.__load_manifest()
-        self.canvases = iiif.slice_canvases(self.manifest, first, last)
-        self.archive_id = archive_id if archive_id is not None else iiif.get_archive_id_from_canvases(self.canvases)
-        self.ark_id = self.__resolve_ark_id()
-        self.dirname = self.__generate_dirname()
+        journaled = journal.gallery(url, first, last, self.__shard) if journal is not None else None
+        self.restored = journaled is not None
+        if journaled is not None:
+            logger.info('Restoring %s from the journal', url)
+            self.manifest_url, self.manifest = journaled.manifest_url, journaled.manifest
+        else:
+            logger.info('Loading manifest from %s', url)
+            self.manifest_url, self.manifest = self.__load_manifest()
+        self.__journal_id = journaled.id if journaled is not None else None
+        # Every canvas of the manifest is planned, for file names that do
+        # not depend on the selection: see iiif.build_plan. The selection
+        # is first:last and, when sharded, the canvases dealt to this shard.
+        all_canvases = iiif.slice_canvases(self.manifest, 0, None)
+        self.__all_canvases = [iiif.Canvas.from_iiif(canvas, index) for index, canvas in enumerate(all_canvases)]
+        positions = range(len(all_canvases))[first:last]
+        selected_positions = plan.shard(positions, *shard) if shard is not None else list(positions)
+        self.canvases = [self.__all_canvases[p] for p in selected_positions]
+        selected = [all_canvases[p] for p in selected_positions]
+        self.archive_id = archive_id if archive_id is not None else iiif.get_archive_id_from_canvases(selected)
+        self.ark_id = self.__resolve_ark_id(str(selected[0].get('@id', '')) if selected else '')
+        # Only the header of the manifest is kept for the whole run: the
+        # canvases live on as compact records. A new journal entry needs
+        # the whole manifest, until start() records it.
+        self.__full_manifest = self.manifest if journal is not None and journaled is None else None
+        self.manifest = iiif.manifest_header(self.manifest)
+        if self.index is not None:
+            self.index.record(self.manifest_url, iiif.get_ark_id_from_url(self.ark_id), self.archive_id)
+        self.dirname = journaled.dirname if journaled is not None else self.__generate_dirname()
         self.gallery_length = len(self.canvases)
         logger.info('Manifest loaded: %d canvases selected', self.gallery_length)
 
-    def __load_manifest(self) -> dict[str, Any]:
+    def __load_manifest(self) -> tuple[str, dict[str, Any]]:
         if iiif.is_manifest_url(self.url):
             # The manifest endpoint is not behind the AWS WAF, so a user
             # who gets a challenge on the gallery page can copy the "IIIF
             # manifest" link from it and pass that URL directly (issue #25).
-            manifest_url = self.url
-        else:
-            gallery_reply = http.fetch(self.session, self.url)
-            gallery_charset = http.get_content_charset(gallery_reply) or 'utf-8'
-            gallery_html = gallery_reply.content.decode(gallery_charset)
-            manifest_url = iiif.parse_manifest_url_from_html(gallery_html, self.url)
+            return self.url, self.__fetch_manifest(self.url)
+        # A gallery resolved before goes straight to its manifest too,
+        # skipping the gallery page and its WAF.
+        if self.index is not None and (indexed_url := self.index.lookup(self.url)) is not None:
+            try:
+                return indexed_url, self.__fetch_manifest(indexed_url)
+            except HTTPError as ex:
+                logger.warning('Manifest URL from the index failed (%s), reading it from the gallery page', ex)
+                self.index.forget(indexed_url)
+        gallery_html = http.fetch_document(self.session, self.url, self.cache).text
+        manifest_url = iiif.parse_manifest_url_from_html(gallery_html, self.url)
+        return manifest_url, self.__fetch_manifest(manifest_url)
+
+    def __fetch_manifest(self, manifest_url: str) -> dict[str, Any]:
         logger.debug('Manifest URL: %s', manifest_url)
-        manifest_reply = http.fetch(self.session, manifest_url)
-        manifest_charset = http.get_content_charset(manifest_reply) or 'utf-8'
-        return loads(manifest_reply.content.decode(manifest_charset))
+        manifest = http.fetch_document(self.session, manifest_url, self.cache)
+        if manifest.from_cache:
+            logger.info('Manifest not modified since last fetch, using the cached copy')
+        return loads(manifest.text)
 
-    def __resolve_ark_id(self) -> str:
-        first_canvas_url = str(self.canvases[0].get('@id', ''))
+    def __resolve_ark_id(self, first_canvas_url: str) -> str:
         for candidate in (self.url, first_canvas_url):
             ark = iiif.get_ark_id_from_url(candidate)
             if ark:
@@ -115,6 +269,22 @@ class Downloader:
         typology = iiif.get_metadata_value(self.manifest, iiif.META_TYPOLOGY)
         return Path(slugify(f'{context}-{year}-{typology}-{self.archive_id}'))
 
+    @property
+    def archive_path(self) -> Path | None:
+        """The archive the images are written to, inside :attr:`dirname`; None without :attr:`archive`.
+
+        Each shard of a gallery has an archive of its own.
+        """
+        if self.archive is None:
+            return None
+        shard = f'-{self.__shard.replace("/", "of")}' if self.__shard else ''
+        return self.dirname / f'{self.dirname.name}{shard}.{self.archive}'
+
+    @property
+    def pdf_path(self) -> Path:
+        """The PDF :meth:`write_pdf` writes, inside :attr:`dirname`."""
+        return self.dirname / f'{self.dirname.name}.pdf'
+
     def print_gallery_info(self) -> None:
         """Write the gallery's IIIF metadata to stdout."""
         for entry in self.manifest['metadata']:
@@ -123,12 +293,25 @@ class Downloader:
             print(f'{label:<25}{value}')
         print(f'{self.gallery_length} images found.')
 
-    def check_dir(self, parentdir: str | None = None, interactive: bool = True) -> None:
-        """Ensure the output directory exists, prompting the user on conflict."""
+    def check_dir(self, parentdir: str | None = None, interactive: bool = True, resume: bool = False) -> None:
+        """Ensure the output directory exists, prompting the user on conflict.
+
+        With ``resume=True`` an existing directory is expected (it holds
+        the output of an interrupted run) and is accepted without asking.
+        A gallery restored from the journal keeps its recorded directory.
+        """
+        if self.restored:
+            print(f'Output directory: {self.dirname}')
+            logger.info('Resuming into %s, as recorded in the journal', self.dirname)
+            self.dirname.mkdir(parents=True, exist_ok=True)
+            return
         if parentdir is not None:
             self.dirname = Path(parentdir) / self.dirname
         print(f'Output directory: {self.dirname}')
         if path.exists(self.dirname):
+            if resume:
+                logger.info('Resuming into existing directory %s', self.dirname)
+                return
             msg = f'Directory {self.dirname} already exists.'
             if not interactive:
                 raise RuntimeError(msg)
@@ -136,28 +319,259 @@ class Downloader:
             if not confirm('Do you want to proceed?'):
                 sys_exit(1)
         else:
-            mkdir(self.dirname)
+            try:
+                mkdir(self.dirname)
+            except FileExistsError:
+                # Created in the meantime by a concurrent run, e.g. another
+                # shard of the gallery.
+                if not resume:
+                    raise
+
+    def targets(self, size: int) -> list[iiif.ImageTarget]:
+        """Return the image URL and the file stem of each selected canvas, for ``size``.
+
+        The whole manifest is planned in one pass (see
+        :func:`antenati.iiif.build_plan`), and canvases whose labels
+        collide are saved under distinct names. With ``probe_sizes``, the
+        images are requested at the sizes the server has ready (see
+        :meth:`probe_downscales`).
+        """
+        downscales = self.probe_downscales() if self.probe_sizes and size > 0 else None
+        targets = iiif.build_plan(self.__all_canvases, size, self.descriptive_names, self.ark_id, downscales)
+        selected = [targets[canvas.index] for canvas in self.canvases]
+        renamed = [target for target in selected if target.renamed]
+        if renamed:
+            logger.warning('%d canvases share their label with an earlier one, saved as e.g. %s', len(renamed), renamed[0].stem)
+        if downscales is not None:
+            pixels = sum(t.width * t.height for t in selected if t.width is not None and t.height is not None)
+            logger.info('Planned %d images at the sizes ready on the server, %.1f megapixels in all', len(selected), pixels / 1e6)
+        return selected
+
+    def probe_downscales(self) -> iiif.Downscales | None:
+        """Return the reductions of the images that the image server has ready, or None.
+
+        They are learnt from the ``info.json`` of :data:`PROBE_SAMPLE`
+        canvases spread over the gallery, once per gallery; with a
+        ``cache`` the documents are revalidated rather than fetched again
+        on later runs. A probe that fails is logged, and the images are
+        then requested by box size.
+        """
+        if self.__probed:
+            return self.__downscales
+        self.__probed = True
+        canvases = [c for c in self.__all_canvases if c.image_url is not None]
+        if not canvases:
+            return None
+        last = len(canvases) - 1
+        sample = sorted({round(i * last / (PROBE_SAMPLE - 1)) for i in range(PROBE_SAMPLE)})
+        infos = []
+        try:
+            for i in sample:
+                document = http.fetch_document(self.session, iiif.info_url(canvases[i].require_image_url()), self.cache)
+                infos.append(iiif.parse_image_info(json.loads(document.text)))
+        except (RequestException, AntenatiError, ValueError) as ex:
+            logger.warning('Could not probe the sizes ready on the image server, requesting by box size: %s', ex)
+            return None
+        self.__downscales = iiif.downscales_from(infos)
+        if self.__downscales is None:
+            logger.info('The image server has no reduced sizes ready, requesting by box size')
+        else:
+            logger.info('The image server has sizes ready at 1/%s of the full size', ', 1/'.join(map(str, self.__downscales.divisors)))
+        return self.__downscales
 
-    def __thread_main(self, canvas: dict[str, Any], size: int) -> int:
-        label = slugify(canvas['label'])
+    def plan(self, size: int) -> list[PlanItem]:
+        """Return what :meth:`run` would download with ``size``, canvas by canvas.
+
+        Call it after :meth:`check_dir` to have the output directory as it
+        will be used. Canvases that cannot be planned (no image URL) are
+        left out.
+        """
+        items = []
+        for target in self.targets(size):
+            canvas = target.canvas
+            if target.url is None:
+                logger.warning('Canvas %d left out of the plan: %s', canvas.index, target.error)
+                continue
+            items.append(PlanItem(str(self.dirname), canvas.index, canvas.label, target.url, target.stem, target.width, target.height))
+        return items
+
+    def __pending_targets(self, targets: list[iiif.ImageTarget]) -> list[iiif.ImageTarget]:
+        """Return the targets whose image is not already complete on disk.
+
+        The output directory is listed once; each target is then matched
+        by its file stem, and its size checked against the sidecar index
+        when the file was recorded there. Targets without a URL are kept,
+        so the worker reports the error as usual. With an :attr:`archive`,
+        the targets whose image is in the archive are done instead.
+        """
+        if self.__archive is not None:
+            archived = self.__archive.stems()
+            return [target for target in targets if target.url is None or target.stem not in archived]
+        on_disk = storage.scan_dir(self.dirname)
+        recorded = self.__index.load()
+        pending = []
+        for target in targets:
+            existing = on_disk.get(target.stem)
+            if target.url is None or existing is None or not storage.is_complete(existing):
+                pending.append(target)
+                continue
+            entry = recorded.get(existing.name)
+            if entry is not None and entry.size != existing.stat().st_size:
+                pending.append(target)
+        return pending
+
+    def __prepare(self, target: iiif.ImageTarget, resume: bool) -> tuple[str, Path]:
+        """Return the image URL and the ``.part`` path of a target."""
+        if target.url is None:
+            raise ManifestError(str(target.error))
+        part = storage.part_path(self.dirname, target.stem)
+        if not resume:
+            # A leftover from an earlier run may belong to another
+            # --size: only continue partial files when resuming.
+            part.unlink(missing_ok=True)
+        return target.url, part
+
+    def download_canvas(self, target: iiif.ImageTarget, resume: bool) -> http.Transfer:
+        """Download the image of one canvas into the output directory.
+
+        Called by the workers of :meth:`run`, and by those of
+        :class:`antenati.batch.Batch` with the targets returned by
+        :meth:`start`.
+
+        Raises
+        ------
+        ThreadError
+            With the file stem of the canvas, chained to the cause.
+        """
+        self.__journal_mark(target, CanvasState.IN_FLIGHT)
         try:
-            image_url = iiif.image_url_for_canvas(canvas)
-            stem = label
-            if self.descriptive_names:
-                stem = f'{label}+{self.ark_id}+{iiif.get_image_id_from_url(image_url)}'
-            url = iiif.manipulate_image_url(image_url, size)
-            http_reply = http.fetch(self.session, url)
-            content_type = http.get_content_type(http_reply)
-            extension = guess_extension(content_type)
-            if not extension:
-                raise RuntimeError(f'{url}: Unable to guess extension "{content_type}"')
-            filename = self.dirname / f'{stem}{extension}'
-            with open(filename, 'wb') as img_file:
-                img_file.write(http_reply.content)
-            return len(http_reply.content)
+            url, part = self.__prepare(target, resume)
+            stored = self.__from_store(target, url, part)
+            if stored is not None:
+                transfer, path = stored
+            elif self.__tile_pool is not None and self.__is_tiled(target):
+                transfer, path = self.__fetch_tiled(target, part, resume), part
+            else:
+                transfer, path = http.fetch_to_part(self.session, url, part, self.chunk_size, self.rate_limiter), part
+            self.__commit(target, url, path, transfer)
+            return transfer
         except (RequestException, AntenatiError, OSError, RuntimeError) as ex:
-            logger.warning('Image %s failed: %s', label, ex)
-            raise ThreadError(label) from ex
+            self.__journal_mark(target, CanvasState.FAILED, error=str(ex))
+            raise ThreadError(target.stem) from ex
+
+    def __from_store(self, target: iiif.ImageTarget, url: str, part: Path) -> tuple[http.Transfer, Path] | None:
+        """Link the image at ``url`` from the :attr:`store`, when it is there. Returns the transfer and the link.
+
+        The link gets the final file name: a ``.part`` file left linked to
+        the store by a killed run would be taken for a partial download.
+        Only with an :attr:`archive` is it ``part``, which the archive takes
+        in as a download.
+        """
+        if self.store is None:
+            return None
+        found = self.store.lookup(url)
+        if found is None:
+            return None
+        sha256, extension = found
+        path = part if self.__archive is not None else self.dirname / f'{target.stem}{extension}'
+        size = self.store.link(sha256, path)
+        logger.debug('%s linked from the store', url)
+        return http.Transfer(extension, size, 0, size, sha256), path
+
+    def __is_tiled(self, target: iiif.ImageTarget) -> bool:
+        """Return True when ``target`` is the full-size image of a canvas larger than a tile."""
+        canvas = target.canvas
+        if self.tile_size is None or canvas.width is None or canvas.height is None:
+            return False
+        full_size = (target.width, target.height) == (canvas.width, canvas.height)
+        return full_size and max(canvas.width, canvas.height) > self.tile_size
+
+    def __fetch_tiled(self, target: iiif.ImageTarget, part: Path, resume: bool) -> http.Transfer:
+        """Fetch the image of ``target`` as tiles on the tile pool and stitch them into ``part``."""
+        from antenati import tiles
+
+        assert self.__tile_pool is not None and self.tile_size is not None
+        canvas = target.canvas
+        assert canvas.width is not None and canvas.height is not None
+        directory = tiles.tiles_dir(self.dirname, target.stem)
+        if not resume:
+            tiles.discard(directory)
+        regions = iiif.tile_regions(canvas.width, canvas.height, self.tile_size)
+        received = tiles.fetch_tiles(self.session, canvas.require_image_url(), regions, directory, self.__tile_pool, self.chunk_size, self.rate_limiter)
+        tiles.stitch(directory, regions, canvas.width, canvas.height, part)
+        tiles.discard(directory)
+        size = part.stat().st_size
+        return http.Transfer(tiles.STITCHED_EXTENSION, size, received, size, storage.hash_file(part).hexdigest())
+
+    async def __task_main(self, session: aiohttp.ClientSession, target: iiif.ImageTarget, resume: bool) -> http.Transfer:
+        from antenati import aio
+
+        errors: tuple[type[Exception], ...] = (*aio.CLIENT_ERRORS, AntenatiError, OSError, RuntimeError)
+        self.__journal_mark(target, CanvasState.IN_FLIGHT)
+        try:
+            url, part = self.__prepare(target, resume)
+            # The store, the archive and the pipeline block: keep them off
+            # the event loop, where they would stall every transfer.
+            stored = await asyncio.to_thread(self.__from_store, target, url, part)
+            if stored is not None:
+                transfer, path = stored
+            else:
+                transfer, path = await aio.fetch_to_part(session, url, part, self.chunk_size, self.rate_limiter), part
+            await asyncio.to_thread(self.__commit, target, url, path, transfer)
+            return transfer
+        except errors as ex:
+            self.__journal_mark(target, CanvasState.FAILED, error=str(ex))
+            raise ThreadError(target.stem) from ex
+
+    def __commit(self, target: iiif.ImageTarget, url: str, part: Path, transfer: http.Transfer) -> None:
+        """Give a completed ``.part`` file its final name, unless it has it already, index it and journal it.
+
+        With an :attr:`archive`, the file is moved into the archive instead,
+        which keeps its own checksums: the sidecar index lists files on disk.
+        With a :attr:`store`, the file becomes a link into it; with a
+        :attr:`pipeline`, the file is then submitted to it.
+        """
+        filename = f'{target.stem}{transfer.extension}'
+        if self.__archive is not None:
+            self.__archive.add(filename, part)
+        else:
+            if part != self.dirname / filename:
+                replace(part, self.dirname / filename)
+            if self.store is not None:
+                self.store.add(self.dirname / filename, transfer.sha256, url)
+            self.__index.append(storage.IndexEntry(filename, url, transfer.size, transfer.expected, transfer.sha256))
+        self.__journal_mark(target, CanvasState.DONE, size=transfer.size, sha256=transfer.sha256)
+        if self.pipeline is not None and self.__archive is None:
+            with self.__processing:
+                self.__n_processing += 1
+            try:
+                self.pipeline.submit(self.dirname / filename, functools.partial(self.__processed, filename, url))
+            except BaseException:
+                self.__processed_one()
+                raise
+
+    def __processed(self, filename: str, url: str, future: Future[Processed]) -> None:
+        """Index the result of the :attr:`pipeline` on ``filename``, in place of the download."""
+        try:
+            result = future.result()
+            self.__index.append(storage.IndexEntry(result.path.name, url, result.size, None, result.sha256))
+            if result.path.name != filename:
+                with self.__processing:
+                    self.__replaced.add(filename)
+        except Exception as ex:  # the downloaded file is still there, as it was
+            logger.warning('Processing of %s failed: %s', filename, ex)
+        finally:
+            self.__processed_one()
+
+    def __processed_one(self) -> None:
+        with self.__processing:
+            self.__n_processing -= 1
+            if not self.__n_processing:
+                self.__processing.notify_all()
+
+    def __journal_mark(self, target: iiif.ImageTarget, state: CanvasState, **details: Any) -> None:
+        if self.journal is not None and self.__journal_id is not None:
+            self.journal.mark(self.__journal_id, target.canvas.index, state, **details)
 
     def run(
         self,
@@ -165,35 +579,329 @@ class Downloader:
         size: int,
         progress: ProgressBar,
         cancel: threading.Event | None = None,
+        resume: bool = False,
+        adaptive: bool = False,
+        final_pass: bool = False,
     ) -> int:
         """Download all canvases concurrently. Returns total bytes written.
 
+        With ``resume=True`` the output directory is indexed up front and
+        canvases whose file is already complete are skipped: they count
+        towards the progress bar but not towards the returned total. With
+        a :attr:`journal`, every canvas transition is recorded in it; a
+        gallery restored from it skips the canvases it has as done,
+        without listing the directory, and always resumes.
+
+        With ``adaptive=True``, ``n_workers`` is an upper bound: the number
+        of requests in flight starts at :data:`DEFAULT_N_THREADS` and is
+        tuned to the server by an :class:`antenati.concurrency.AimdController`
+        fed with the TTFB and throttling statuses of every image.
+
+        A canvas that fails with a transient error (a throttling status or
+        a dropped connection) is put back in a :class:`RetryScheduler` and
+        retried after its backoff, while the workers go on with the other
+        canvases. With ``final_pass=True``, the canvases still failed at
+        the end are tried once more at :data:`FINAL_PASS_DIVISOR` times
+        lower concurrency.
+
         Passing ``cancel`` lets a caller (typically the GUI) request early
-        termination: when the event is set, futures that have not started
+        termination: when the event is set, canvases that have not started
         yet are skipped and the call returns the partial total. Already
         running fetches finish naturally — interrupting an in-flight HTTP
         request requires patching :mod:`requests`, which is more invasive
         than the benefit warrants.
+
+        The connection pools are sized to keep one connection per worker
+        alive (at most ``max_host_connections`` per host, in which case
+        workers queue for a free connection); the reuse statistics of the
+        run are then in :attr:`connection_stats` and logged at INFO level.
+
+        With :attr:`tile_size`, full-size images larger than a tile are
+        fetched as tiles, :attr:`tile_workers` at a time on a pool shared
+        by the workers, and stitched into a PNG (see
+        :mod:`antenati.tiles`). A retry fetches only the tiles that failed.
         """
-        with ThreadPoolExecutor(max_workers=n_workers) as executor:
-            future_img = {executor.submit(self.__thread_main, i, size) for i in self.canvases}
-            progress.set_total(self.gallery_length)
-            gallery_size = 0
-            failed: dict[str, str] = {}
-            for future in as_completed(future_img):
-                if cancel is not None and cancel.is_set():
-                    for f in future_img:
-                        f.cancel()
-                    logger.info('Download cancelled by caller')
-                    return gallery_size
-                progress.update()
+        # A restored gallery continues the .part files of the killed run.
+        resume = resume or self.restored
+        self.connection_stats.reset()
+        targets = self.start(size, progress, resume)
+        n_images = len(targets)
+        n_connections = n_workers
+        if self.tile_size is not None:
+            # Fail before the first request if Pillow is missing.
+            from antenati import tiles  # noqa: F401
+
+            self.__tile_pool = ThreadPoolExecutor(max_workers=self.tile_workers, thread_name_prefix='tile')
+            n_connections += self.tile_workers
+        pool_size = self.__host_connections(n_connections)
+        http.size_pools(self.session, pool_size, block=pool_size < n_connections)
+        # From here on retries are scheduled by DownloadPass: urllib3 must not
+        # sleep through backoffs in the worker threads.
+        previous_policy = http.set_retry_policy(self.session, http.transport_retry_policy())
+        controller = AimdController(n_workers, initial=DEFAULT_N_THREADS) if adaptive else None
+
+        def limit() -> int:
+            return controller.limit if controller is not None else n_workers
+
+        state = DownloadPass(RetryScheduler(targets), progress, THREADS_ERRORS, controller, final=not final_pass)
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                cancelled = self.__threads_pass(executor, state, limit, resume, cancel)
+                if not cancelled and state.failed and final_pass:
+                    state = state.final_pass()
+                    reduced = _final_pass_workers(limit())
+                    logger.info('Retrying %d failed images with %d workers', len(state.failed_before), reduced)
+                    # resume=True: the .part files left by this run are safe to continue.
+                    cancelled = self.__threads_pass(executor, state, lambda: reduced, True, cancel)
+            received = state.outcome(cancelled)
+            if self.pdf and not cancelled:
+                # The PDF embeds the images as the pipeline left them.
+                self.close()
+                self.write_pdf()
+            return received
+        finally:
+            # The session may be the caller's: give it back as it was.
+            http.restore_retry_policy(previous_policy)
+            self.close()
+            if self.__tile_pool is not None:
+                self.__tile_pool.shutdown()
+                self.__tile_pool = None
+            if self.journal is not None:
+                self.journal.flush()
+            logger.info('Connections: %s', self.connection_stats.describe(n_images))
+            if controller is not None:
+                logger.info('Final concurrency: %d requests in flight', controller.limit)
+
+    def __threads_pass(
+        self,
+        executor: ThreadPoolExecutor,
+        state: DownloadPass,
+        limit: Callable[[], int],
+        resume: bool,
+        cancel: threading.Event | None,
+    ) -> bool:
+        """Run ``state`` to completion on ``executor``. Returns True if cancelled."""
+        # Canvases are submitted as slots free up, rather than all at
+        # once, so that retries can be interleaved and the controller can
+        # change the number of requests in flight while the run progresses.
+        in_flight: dict[Future[http.Transfer], tuple[iiif.ImageTarget, int]] = {}
+        while state.scheduler or in_flight:
+            if cancel is not None and cancel.is_set():
+                return True
+            while len(in_flight) < limit() and (item := state.scheduler.pop_ready()) is not None:
+                target, attempt = item
+                # A retry continues the .part file of the failed attempt.
+                in_flight[executor.submit(self.download_canvas, target, resume or attempt > 0)] = item
+            timeout = None if len(in_flight) >= limit() else state.scheduler.wait_time()
+            if not in_flight:
+                # Only retries waiting for their backoff are left.
+                if cancel is not None:
+                    cancel.wait(timeout)
+                else:
+                    time.sleep(timeout or 0)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                target, attempt = in_flight.pop(future)
                 try:
-                    gallery_size += future.result()
+                    transfer = future.result()
                 except ThreadError as ex:
-                    failed[ex.label] = str(ex.__cause__)
+                    state.attempt_failed(target, attempt, ex)
+                else:
+                    state.succeeded(transfer)
+        return cancel is not None and cancel.is_set()
+
+    async def run_async(
+        self,
+        n_workers: int,
+        size: int,
+        progress: ProgressBar,
+        cancel: threading.Event | None = None,
+        resume: bool = False,
+        final_pass: bool = False,
+    ) -> int:
+        """asyncio counterpart of :meth:`run`, built on :mod:`aiohttp`.
+
+        Up to ``n_workers`` transfers are kept in flight as tasks on the
+        calling thread, so it can be set to the hundreds without paying
+        for an OS thread each. Progress, ``cancel``, ``resume``, retries,
+        ``final_pass``, the per-host connection cap, :attr:`connection_stats`
+        and the failure summary behave exactly as in :meth:`run`.
+
+        Requires the optional ``aiohttp`` dependency (``antenati[async]``).
+        Tiles (:attr:`tile_size`) are not supported.
+        """
+        from antenati import aio
+
+        if self.tile_size is not None:
+            raise ValueError('tile_size is only supported by run')
+
+        resume = resume or self.restored
+        self.connection_stats.reset()
+        targets = self.start(size, progress, resume)
+        n_images = len(targets)
+        errors = ErrorKinds(aio.is_transient_error, aio.retry_after_from_error, aio.is_throttling_error)
+        state = DownloadPass(RetryScheduler(targets), progress, errors, final=not final_pass)
+        limit_per_host = self.__host_connections(n_workers)
+        try:
+            async with aio.open_session(n_workers, self.chunk_size, self.connection_stats, limit_per_host, self.rate_limiter) as session:
+                cancelled = await self.__async_pass(session, state, n_workers, resume, cancel)
+                if not cancelled and state.failed and final_pass:
+                    state = state.final_pass()
+                    reduced = _final_pass_workers(n_workers)
+                    logger.info('Retrying %d failed images with %d workers', len(state.failed_before), reduced)
+                    cancelled = await self.__async_pass(session, state, reduced, True, cancel)
+        finally:
+            self.close()
+        if self.journal is not None:
+            self.journal.flush()
+        logger.info('Connections: %s', self.connection_stats.describe(n_images))
+        received = state.outcome(cancelled)
+        if self.pdf and not cancelled:
+            self.write_pdf()
+        return received
+
+    async def __async_pass(
+        self,
+        session: aiohttp.ClientSession,
+        state: DownloadPass,
+        limit: int,
+        resume: bool,
+        cancel: threading.Event | None,
+    ) -> bool:
+        """Run ``state`` to completion on the event loop. Returns True if cancelled."""
+        in_flight: dict[asyncio.Task[http.Transfer], tuple[iiif.ImageTarget, int]] = {}
+        while state.scheduler or in_flight:
+            if cancel is not None and cancel.is_set():
+                if in_flight:
+                    await asyncio.wait(in_flight)
+                return True
+            while len(in_flight) < limit and (item := state.scheduler.pop_ready()) is not None:
+                target, attempt = item
+                task = asyncio.create_task(self.__task_main(session, target, resume or attempt > 0))
+                in_flight[task] = item
+            timeout = None if len(in_flight) >= limit else state.scheduler.wait_time()
+            if not in_flight:
+                # ``cancel`` is a threading.Event: poll it while idle.
+                await asyncio.sleep(min(timeout or 0, _CANCEL_POLL_INTERVAL))
+                continue
+            done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                target, attempt = in_flight.pop(task)
+                try:
+                    transfer = task.result()
+                except ThreadError as ex:
+                    state.attempt_failed(target, attempt, ex)
+                else:
+                    state.succeeded(transfer)
+        return cancel is not None and cancel.is_set()
+
+    def __host_connections(self, n_workers: int) -> int:
+        if self.max_host_connections is None:
+            return n_workers
+        return min(n_workers, self.max_host_connections)
+
+    def start(self, size: int, progress: ProgressBar, resume: bool) -> list[iiif.ImageTarget]:
+        """Open the sidecar index, announce the total and return the work list.
+
+        :meth:`run` and :meth:`run_async` start with this; callers that
+        schedule the canvases themselves call it, then
+        :meth:`download_canvas` with each target it returns, then
+        :meth:`close`.
+        """
+        self.__index = storage.GalleryIndex(self.dirname)
+        targets = self.targets(size)
+        self.__planned = targets
+        archive_path = self.archive_path
+        if archive_path is not None:
+            self.__archive = GalleryArchive(archive_path, {target.stem: target.canvas.index for target in targets}, append=resume)
+        if self.journal is not None and self.__journal_id is not None:
+            if self.__archive is not None:
+                # The archive, not the journal, says what is done: the
+                # images lost with the tail of an archive left unclosed
+                # are marked done in the journal all the same.
+                archived = self.__archive.stems()
+                targets = [target for target in targets if target.stem not in archived]
+                logger.info('Skipping %d canvases already in the archive', self.gallery_length - len(targets))
+            else:
+                unfinished = set(self.journal.unfinished(self.__journal_id))
+                targets = [target for target in targets if target.canvas.index in unfinished]
+                logger.info('Skipping %d canvases done according to the journal', self.gallery_length - len(targets))
+        else:
+            all_targets = targets
+            if resume:
+                targets = self.__pending_targets(targets)
+                logger.info('Skipping %d canvases already on disk', self.gallery_length - len(targets))
+            if self.journal is not None:
+                self.__journal_id = self.__journal_gallery(self.journal, all_targets, targets)
+        progress.set_total(self.gallery_length)
+        for _ in range(self.gallery_length - len(targets)):
+            progress.update()
+        return targets
+
+    def close(self) -> None:
+        """Close the :attr:`archive` of the gallery, writing its central directory.
+
+        With a :attr:`pipeline`, wait for it to process the files of this
+        gallery, not those of other galleries sharing it, and update the
+        sidecar index. :meth:`run` and :meth:`run_async`
+        close on return; callers of :meth:`start` call this once the
+        canvases are all done.
+        """
+        if self.__archive is not None:
+            self.__archive.close()
+            self.__archive = None
+        if self.pipeline is not None:
+            with self.__processing:
+                self.__processing.wait_for(lambda: not self.__n_processing)
+                replaced, self.__replaced = self.__replaced, set()
+            if replaced:
+                self.__index.discard(replaced)
+
+    def write_pdf(self) -> Path:
+        """Assemble the images of the selected canvases on disk into :attr:`pdf_path`, in canvas order.
+
+        The images are embedded as they are (see :mod:`antenati.pdf`), on
+        pages with the proportions of their canvases. Canvases without an
+        image on disk, or with one that cannot be embedded, are left out
+        with a warning. :meth:`run` and :meth:`run_async` call this when
+        :attr:`pdf` is set and every image was downloaded. Returns the path.
+        """
+        targets = self.__planned if self.__planned is not None else self.targets(0)
+        on_disk = storage.scan_dir(self.dirname)
+        path = self.pdf_path
+        part = path.with_name(f'{path.name}{storage.PART_SUFFIX}')
+        left_out = 0
+        with pdf.PdfWriter(part, str(self.manifest.get('label', self.dirname.name))) as writer:
+            for target in targets:
+                image = on_disk.get(target.stem)
+                if image is None:
+                    left_out += 1
                     continue
-            if failed:
-                msg = f'Failed to download {len(failed)} images:\n'
-                msg += '\n - '.join(f'{k}: {v}' for k, v in failed.items())
-                raise RuntimeError(msg)
-            return gallery_size
+                try:
+                    writer.add_page(image, target.canvas.width, target.canvas.height)
+                except ValueError as ex:
+                    logger.warning('%s left out of the PDF: %s', image.name, ex)
+                    left_out += 1
+        replace(part, path)
+        if left_out:
+            logger.warning('%d of %d canvases left out of %s', left_out, len(targets), path)
+        logger.info('PDF of %d pages written to %s', writer.pages, path)
+        return path
+
+    def __journal_gallery(self, journal: Journal, targets: list[iiif.ImageTarget], pending: list[iiif.ImageTarget]) -> int:
+        """Record the gallery in ``journal``, with the targets not ``pending`` as done."""
+        assert self.__full_manifest is not None
+        labels = {canvas.index: canvas.label for canvas in self.canvases}
+        gallery_id = journal.add_gallery(self.url, self.__first, self.__last, self.dirname, self.manifest_url, self.__full_manifest, labels, self.__shard)
+        self.__full_manifest = None
+        pending_indexes = {target.canvas.index for target in pending}
+        for target in targets:
+            if target.canvas.index not in pending_indexes:
+                journal.mark(gallery_id, target.canvas.index, CanvasState.DONE)
+        journal.flush()
+        return gallery_id
+
+
+def _final_pass_workers(n_workers: int) -> int:
+    return max(n_workers // FINAL_PASS_DIVISOR, 1)
@@ -6,7 +6,12 @@ Enables ``python -m antenati.gui`` and serves as the PyInstaller target,
 replacing the old ``antenati_gui.py`` shim at the repository root.
 """
 
+import multiprocessing
+
 from antenati.gui import main
 
 if __name__ == '__main__':
+    # The download processes are spawned: a frozen executable must run
+    # them instead of the GUI when it is started as one of them.
+    multiprocessing.freeze_support()
     main()
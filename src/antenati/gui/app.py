@@ -45,6 +45,8 @@ class App:
         self._first = tk.IntVar(value=0)
         self._last = tk.StringVar(value='')
         self._path = tk.StringVar()
+        self._resume = tk.BooleanVar(value=False)
+        self._processes = tk.IntVar(value=1)
 
         self._menu = tk.Menu(self._root)
         self._root.configure(menu=self._menu)
@@ -90,6 +92,15 @@ class App:
         ttk.Entry(options, textvariable=self._last, width=10).grid(row=2, column=1, sticky=tk.W, padx=6, pady=2)
         tk.Label(options, text='Index NOT to download; leave empty to download all').grid(row=2, column=2, sticky=tk.W, padx=6, pady=2)
 
+        ttk.Checkbutton(options, text='Resume', variable=self._resume).grid(row=3, column=0, columnspan=2, sticky=tk.W, padx=6, pady=2)
+        tk.Label(options, text='Continue an interrupted download into an existing folder').grid(row=3, column=2, sticky=tk.W, padx=6, pady=2)
+
+        tk.Label(options, text='Processes:').grid(row=4, column=0, sticky=tk.W, padx=6, pady=2)
+        ttk.Spinbox(options, textvariable=self._processes, width=10, from_=1, to=64, increment=1).grid(row=4, column=1, sticky=tk.W, padx=6, pady=2)
+        tk.Label(options, text='Split the gallery between this many processes, for when one uses a whole CPU core').grid(
+            row=4, column=2, sticky=tk.W, padx=6, pady=2
+        )
+
         tk.Label(entry_frame, text='Destination folder').grid(row=2, column=0, padx=10, pady=5, sticky=tk.EW)
         ttk.Entry(entry_frame, textvariable=self._path, width=100).grid(row=2, column=1, padx=10, pady=5, columnspan=2, sticky=tk.EW)
         ttk.Button(entry_frame, text='Browse', command=self._browse_path).grid(row=2, column=3, padx=10, pady=5, sticky=tk.EW)
@@ -143,11 +154,13 @@ class App:
             size=self._size.get(),
             first=int(self._first.get()),
             last=last_val,
+            resume=self._resume.get(),
+            n_processes=int(self._processes.get()),
         )
 
+        self._worker.start(params)
         self._progress = TkProgress(self._progress_bar)
         self._set_running(True)
-        self._worker.start(params)
         self._root.after(_POLL_INTERVAL_MS, self._drain_events)
 
     def _on_cancel(self) -> None:
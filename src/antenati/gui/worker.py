@@ -19,6 +19,11 @@ wait_variable`` pattern this gives us three things:
    only needs a ``DownloaderFactory`` callable and a ``ProgressBar`` to
    pump events into a queue, so unit tests can exercise the state
    machine without any Tk import.
+
+With ``n_processes`` above one, the worker thread splits the gallery
+into that many shards and downloads them with
+:func:`antenati.processes.run_processes`, whose merged progress feeds
+the same events.
 """
 
 from __future__ import annotations
@@ -26,10 +31,15 @@ from __future__ import annotations
 import logging
 import queue
 import threading
+from collections.abc import Callable, Sequence
 from dataclasses import dataclass
 from typing import Protocol
 
+from antenati.arkindex import ArkIndex
+from antenati.batch import GalleryReport
+from antenati.cache import ResponseCache
 from antenati.downloader import DEFAULT_N_THREADS, Downloader, ProgressBar
+from antenati.processes import ProcessOptions, Unit, run_processes, shard_gallery
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +88,8 @@ class DownloadParams:
     first: int
     last: int | None
     n_workers: int = DEFAULT_N_THREADS
+    resume: bool = False
+    n_processes: int = 1
 
 
 class DownloaderFactory(Protocol):
@@ -86,15 +98,30 @@ class DownloaderFactory(Protocol):
     def __call__(self, url: str, first: int, last: int | None) -> Downloader: ...
 
 
+class ProcessRunner(Protocol):
+    """Callable running units of work in processes, like :func:`antenati.processes.run_processes`. Tests inject a fake here."""
+
+    def __call__(
+        self,
+        units: Sequence[Unit],
+        n_processes: int,
+        options: ProcessOptions,
+        progress: ProgressBar,
+        on_gallery: Callable[[GalleryReport], None] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> list[GalleryReport]: ...
+
+
 def _default_factory(url: str, first: int, last: int | None) -> Downloader:
-    return Downloader(url, first, last)
+    return Downloader(url, first, last, cache=ResponseCache(), index=ArkIndex())
 
 
 class DownloadWorker:
     """Run a download on a background thread, surface events on a Queue."""
 
-    def __init__(self, factory: DownloaderFactory = _default_factory) -> None:
+    def __init__(self, factory: DownloaderFactory = _default_factory, runner: ProcessRunner = run_processes) -> None:
         self._factory = factory
+        self._runner = runner
         self.events: queue.Queue[WorkerEvent] = queue.Queue()
         self._cancel = threading.Event()
         self._thread: threading.Thread | None = None
@@ -103,6 +130,10 @@ class DownloadWorker:
         """Spawn the download thread. Returns immediately."""
         if self._thread is not None and self._thread.is_alive():
             raise RuntimeError('A download is already in progress')
+        if params.n_processes < 1:
+            raise ValueError('The number of processes must be positive')
+        if params.n_processes > 1 and (params.first != 0 or params.last is not None):
+            raise ValueError('Several processes download the whole gallery: leave First and Last at their defaults')
         self._cancel.clear()
         self._thread = threading.Thread(target=self._run, args=(params,), name='antenati-download', daemon=True)
         self._thread.start()
@@ -120,15 +151,17 @@ class DownloadWorker:
             self._thread.join(timeout)
 
     def _run(self, params: DownloadParams) -> None:
+        progress = ProgressBar(
+            set_total=lambda total: self.events.put(Progress(total=total)),
+            update=lambda: self.events.put(Tick()),
+        )
         try:
-            downloader = self._factory(params.url, params.first, params.last)
-            downloader.check_dir(params.parent_dir, interactive=False)
-
-            progress = ProgressBar(
-                set_total=lambda total: self.events.put(Progress(total=total)),
-                update=lambda: self.events.put(Tick()),
-            )
-            total_bytes = downloader.run(params.n_workers, params.size, progress, cancel=self._cancel)
+            if params.n_processes > 1:
+                total_bytes = self._run_processes(params, progress)
+            else:
+                downloader = self._factory(params.url, params.first, params.last)
+                downloader.check_dir(params.parent_dir, interactive=False, resume=params.resume)
+                total_bytes = downloader.run(params.n_workers, params.size, progress, cancel=self._cancel, resume=params.resume)
         except Exception as ex:
             logger.exception('Download worker failed')
             self.events.put(Failed(message=str(ex)))
@@ -138,3 +171,13 @@ class DownloadWorker:
             self.events.put(Cancelled())
         else:
             self.events.put(Done(total_bytes=total_bytes))
+
+    def _run_processes(self, params: DownloadParams, progress: ProgressBar) -> int:
+        """Download the shards of the gallery in ``params.n_processes`` processes. Returns the total bytes written."""
+        options = ProcessOptions(n_workers=params.n_workers, size=params.size, parentdir=params.parent_dir, resume=params.resume)
+        units = shard_gallery(params.url, params.n_processes, options)
+        reports = self._runner(units, params.n_processes, options, progress, cancel=self._cancel)
+        errors = sorted({report.error for report in reports if report.error is not None})
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+        return sum(report.received for report in reports)
@@ -8,10 +8,23 @@ without re-implementing the SAN-server quirks:
 - :func:`build_session` returns a :class:`requests.Session` preconfigured
   with the browser-like headers required by the SAN reverse proxy and an
   ``urllib3.util.Retry`` adapter that transparently retries on transient
-  5xx and rate-limit responses.
+  5xx and rate-limit responses. Its connection pools are sized with
+  :func:`size_pools` and count the connections they open in a
+  :class:`ConnectionStats` (:func:`connection_stats`), so keep-alive
+  reuse can be checked.
 - :func:`fetch` performs a ``GET`` and turns the AWS WAF challenge
   response (HTTP 202 with ``x-amzn-waf-action: challenge``) into a typed
-  :class:`antenati.errors.WafChallengeError`.
+  :class:`antenati.errors.WafChallengeError`. With ``stream=True`` the
+  body is left on the wire so large images can be consumed in chunks
+  (see :func:`iter_body`), and with ``offset`` it asks for the tail of
+  the body only (``Range: bytes=N-``) so an interrupted transfer can be
+  continued; :func:`resumed_offset` tells whether the server honoured it.
+- :func:`fetch_to_part` builds on both to download an image into its
+  ``.part`` file, hashing it on the way and surviving dropped connections.
+- Both honour an optional :class:`antenati.ratelimit.RateLimiter`, the
+  request and bandwidth budget shared by all the runs on the machine.
+- :func:`fetch_document` fetches a gallery page or a manifest, through
+  the optional on-disk :class:`antenati.cache.ResponseCache`.
 - :func:`get_content_type` / :func:`get_content_charset` parse a
   response's ``Content-Type`` header.
 
@@ -23,14 +36,31 @@ the root logger (see :mod:`antenati`'s ``--verbose`` flag).
 from __future__ import annotations
 
 import logging
+import threading
+from collections.abc import Iterator, Mapping
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
 from email.message import Message
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from mimetypes import guess_extension
+from pathlib import Path
+from re import search
+from typing import Any
 
-from requests import Response, Session
+from requests import ConnectionError as RequestsConnectionError
+from requests import HTTPError, PreparedRequest, Response, Session
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, Timeout
 from requests.utils import default_headers
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.poolmanager import PoolManager
 from urllib3.util.retry import Retry
 
+from antenati import storage
+from antenati.cache import CacheEntry, ResponseCache
 from antenati.errors import WafChallengeError
+from antenati.ratelimit import RateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -49,17 +79,43 @@ RETRY_TOTAL: int = 5
 RETRY_BACKOFF_FACTOR: float = 0.5
 RETRYABLE_STATUSES: tuple[int, ...] = (429, 500, 502, 503, 504)
 
+# Size of the blocks read from a streamed response body. Full-resolution
+# scans are 10-40 MB; reading them in 64 KiB blocks keeps the per-thread
+# memory footprint independent of the image size.
+DEFAULT_CHUNK_SIZE: int = 64 * 1024
+
+# How many times a transfer cut mid-body is continued with a range
+# request before giving up on the image.
+MAX_RESUME_ATTEMPTS: int = 3
+
+# requests keeps at most 10 idle connections per host: with more workers
+# than that, connections returned to a full pool are closed and the next
+# request pays a new TCP and TLS handshake. Downloader.run resizes the
+# pools from its worker count with size_pools().
+DEFAULT_POOL_MAXSIZE: int = 10
+# Number of per-host pools kept: the gallery page, the manifest and the
+# images are served by at most three hosts.
+DEFAULT_POOL_CONNECTIONS: int = 10
+
 # Mimic a current Edge-on-Windows fingerprint. The SAN reverse proxy 403s
 # requests that look automated, so this header is part of the contract.
 _USER_AGENT: str = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36 Edg/138.0.0.0'
 _REFERER: str = 'https://antenati.cultura.gov.it/'
 
 
+def browser_headers() -> dict[str, str]:
+    """Return the headers that make a request look like the portal's viewer.
+
+    Shared with the asyncio engine (:mod:`antenati.aio`), which does not
+    go through :func:`build_session`.
+    """
+    return {'User-Agent': _USER_AGENT, 'Referer': _REFERER}
+
+
 def _http_headers():
     """Build the header set required to reach the Portale Antenati."""
     headers = default_headers()
-    headers['User-Agent'] = _USER_AGENT
-    headers['Referer'] = _REFERER
+    headers.update(browser_headers())
     return headers
 
 
@@ -74,19 +130,215 @@ def _retry_policy() -> Retry:
     )
 
 
-def build_session() -> Session:
-    """Return a Session preconfigured for Portale Antenati requests."""
+def transport_retry_policy() -> Retry:
+    """Return a Retry policy for callers that schedule their own retries.
+
+    Only a connection that fails before any reply (typically a kept-alive
+    socket the server closed meanwhile) is retried, straight away. Read
+    errors, status retries and backoff are left to the caller, such as
+    :class:`antenati.scheduler.RetryScheduler`, so no thread sleeps in
+    urllib3.
+    """
+    return Retry(total=RETRY_TOTAL, read=0, status=0, backoff_factor=0, allowed_methods=frozenset(['GET']), raise_on_status=False)
+
+
+def set_retry_policy(session: Session, retry: Retry) -> dict[HTTPAdapter, Retry]:
+    """Replace the Retry policy of the adapters mounted on ``session``.
+
+    Returns the policies replaced, to put back with :func:`restore_retry_policy`.
+    """
+    previous = {}
+    for adapter in session.adapters.values():
+        # One adapter may be mounted on both schemes.
+        if isinstance(adapter, HTTPAdapter) and adapter not in previous:
+            previous[adapter] = adapter.max_retries
+            adapter.max_retries = retry
+    return previous
+
+
+def restore_retry_policy(previous: Mapping[HTTPAdapter, Retry]) -> None:
+    """Put back the Retry policies returned by :func:`set_retry_policy`."""
+    for adapter, retry in previous.items():
+        adapter.max_retries = retry
+
+
+@dataclass
+class ConnectionStats:
+    """Counters of the requests sent and of the connections opened for them.
+
+    Every connection opened costs a TCP handshake, plus a TLS handshake
+    over ``https``; requests beyond that count were sent on a kept-alive
+    connection. Updated from the worker threads (and by the asyncio
+    engine), hence the lock.
+    """
+
+    requests: int = 0
+    connections: int = 0
+    tls_handshakes: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self, tls: bool) -> None:
+        with self._lock:
+            self.connections += 1
+            self.tls_handshakes += tls
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.connections = self.tls_handshakes = 0
+
+    @property
+    def reused(self) -> int:
+        """Requests sent on a connection that was already open."""
+        return max(self.requests - self.connections, 0)
+
+    def describe(self, n_images: int) -> str:
+        """Return a one-line summary, with handshakes per downloaded image."""
+        per_image = self.connections / n_images if n_images else 0.0
+        return (
+            f'{self.requests} requests, {self.connections} new connections, {self.reused} reused, '
+            f'{self.tls_handshakes} TLS handshakes, {per_image:.2f} handshakes per image'
+        )
+
+
+def _instrumented_connection(connection_cls: type[Any], stats: ConnectionStats, tls: bool, limiter: RateLimiter | None) -> type[Any]:
+    """Subclass ``connection_cls`` to count the sockets it opens.
+
+    With a ``limiter``, every request sent on the connection also waits
+    for the shared budget, including the retries urllib3 sends on its own.
+    """
+
+    class InstrumentedConnection(connection_cls):
+        def connect(self) -> None:
+            stats.record_connection(tls)
+            super().connect()
+
+        def request(self, *args: Any, **kwargs: Any) -> None:
+            if limiter is not None:
+                limiter.wait_request()
+            super().request(*args, **kwargs)
+
+    return InstrumentedConnection
+
+
+class _InstrumentedPoolManager(PoolManager):
+    """PoolManager whose connections report to a :class:`ConnectionStats`."""
+
+    def __init__(self, *args: Any, stats: ConnectionStats, limiter: RateLimiter | None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats = stats
+        self._limiter = limiter
+
+    def _new_pool(self, scheme: str, host: str, port: int, request_context: dict[str, Any] | None = None) -> HTTPConnectionPool:
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.ConnectionCls = _instrumented_connection(pool.ConnectionCls, self._stats, scheme == 'https', self._limiter)
+        return pool
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter with resizable pools, connection accounting and rate limiting."""
+
+    def __init__(
+        self,
+        stats: ConnectionStats,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        limiter: RateLimiter | None = None,
+    ) -> None:
+        # Set first: HTTPAdapter.__init__ calls init_poolmanager().
+        self.stats = stats
+        self.limiter = limiter
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=_retry_policy())
+
+    @property
+    def pool_maxsize(self) -> int:
+        return self._pool_maxsize
+
+    @property
+    def pool_block(self) -> bool:
+        return self._pool_block
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: Any) -> None:
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _InstrumentedPoolManager(num_pools=connections, maxsize=maxsize, block=block, stats=self.stats, limiter=self.limiter, **pool_kwargs)
+
+    def send(self, request: PreparedRequest, *args: Any, **kwargs: Any) -> Response:
+        self.stats.record_request()
+        return super().send(request, *args, **kwargs)
+
+    def resize(self, maxsize: int, block: bool = False) -> None:
+        """Replace the pools with pools of ``maxsize`` connections per host.
+
+        Idle connections of the old pools are closed.
+        """
+        self.poolmanager.clear()
+        self.init_poolmanager(self._pool_connections, maxsize, block)
+
+
+def build_session(
+    stats: ConnectionStats | None = None,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    limiter: RateLimiter | None = None,
+) -> Session:
+    """Return a Session preconfigured for Portale Antenati requests.
+
+    ``pool_maxsize`` is the number of connections kept alive per host and
+    ``pool_connections`` the number of hosts they are kept for. Connections
+    opened by the session are counted in ``stats`` when given, and every
+    request waits for the request budget of ``limiter`` when given.
+    """
     session = Session()
     session.headers = _http_headers()
-    adapter = HTTPAdapter(max_retries=_retry_policy())
+    adapter = PooledAdapter(stats if stats is not None else ConnectionStats(), pool_maxsize, pool_connections, limiter)
     session.mount('https://', adapter)
     session.mount('http://', adapter)
     return session
 
 
-def fetch(session: Session, url: str) -> Response:
+def connection_stats(session: Session) -> ConnectionStats:
+    """Return the statistics of the connections opened by a :func:`build_session` session."""
+    adapter = session.get_adapter('https://')
+    if not isinstance(adapter, PooledAdapter):
+        raise TypeError('The session was not built by build_session')
+    return adapter.stats
+
+
+def size_pools(session: Session, maxsize: int, block: bool = False) -> None:
+    """Resize the pools of ``session`` to keep ``maxsize`` connections per host.
+
+    Size them to the number of workers, so that every worker returns its
+    connection to the pool instead of having it discarded. With ``block``
+    a worker waits for a free connection rather than opening an extra one
+    that would be closed right after: use it when capping connections per
+    host below the number of workers.
+    """
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        if not isinstance(adapter, PooledAdapter):
+            continue
+        if adapter.pool_maxsize != maxsize or adapter.pool_block != block:
+            logger.debug('Resizing connection pools to %d per host (block=%s)', maxsize, block)
+            adapter.resize(maxsize, block)
+
+
+def fetch(session: Session, url: str, stream: bool = False, offset: int = 0, headers: Mapping[str, str] | None = None) -> Response:
     """GET ``url`` through ``session`` and turn known soft-failures into errors.
 
+    ``headers`` are added to the request. A positive ``offset`` requests
+    the body from that byte onwards. Servers are free to ignore the
+    ``Range`` header and send the whole body: check :func:`resumed_offset`
+    before appending the reply to partial data.
+
+    With ``stream=True`` only the headers are read: the caller owns the
+    returned response and must consume it with :func:`iter_body` (or
+    close it) to release the connection back to the pool. On error the
+    response is closed before raising.
+
     Raises
     ------
     requests.HTTPError
@@ -98,20 +350,266 @@ def fetch(session: Session, url: str) -> Response:
         are behind the WAF: the error message points the user at the
         manifest-URL workaround.
     """
-    logger.debug('GET %s', url)
-    reply = session.get(url)
-    reply.raise_for_status()
-    if reply.status_code == WAF_CHALLENGE_STATUS and reply.headers.get(WAF_CHALLENGE_HEADER) == WAF_CHALLENGE_VALUE:
+    request_headers = dict(headers or {})
+    if offset > 0:
+        request_headers['Range'] = f'bytes={offset}-'
+        logger.debug('GET %s (from byte %d)', url, offset)
+    else:
+        logger.debug('GET %s', url)
+    reply = session.get(url, stream=stream, headers=request_headers)
+    try:
+        reply.raise_for_status()
+    except HTTPError:
+        reply.close()
+        raise
+    if is_waf_challenge(reply.status_code, reply.headers):
         logger.warning('WAF challenge received from %s', reply.url)
-        raise WafChallengeError(
-            f'{reply.url}: AWS WAF challenge cannot be bypassed. '
-            'Workaround: open the gallery page in a browser, copy the "IIIF manifest" link '
-            'at the bottom of the left panel and pass that URL to this tool instead. '
-            'See https://github.com/gcerretani/antenati/issues/25 for details.'
-        )
+        reply.close()
+        raise waf_challenge_error(reply.url)
     return reply
 
 
+def is_waf_challenge(status: int, headers: Mapping[str, str]) -> bool:
+    """Return True for the AWS WAF challenge reply of the SAN server."""
+    return status == WAF_CHALLENGE_STATUS and headers.get(WAF_CHALLENGE_HEADER) == WAF_CHALLENGE_VALUE
+
+
+def waf_challenge_error(url: str) -> WafChallengeError:
+    """Build the error raised on a WAF challenge, with the known workaround."""
+    return WafChallengeError(
+        f'{url}: AWS WAF challenge cannot be bypassed. '
+        'Workaround: open the gallery page in a browser, copy the "IIIF manifest" link '
+        'at the bottom of the left panel and pass that URL to this tool instead. '
+        'See https://github.com/gcerretani/antenati/issues/25 for details.'
+    )
+
+
+def iter_body(reply: Response, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the body of a streamed response in blocks of ``chunk_size`` bytes.
+
+    The response is closed once the body is exhausted or the consumer
+    stops iterating, so the connection goes back to the pool either way.
+    """
+    with reply:
+        yield from reply.iter_content(chunk_size)
+
+
+def resumed_offset(status: int, headers: Mapping[str, str]) -> int:
+    """Return the byte offset the body of a reply starts at.
+
+    That is the first byte of the ``Content-Range`` of a 206 Partial
+    Content reply, and 0 for any other reply (including a server that
+    ignored the ``Range`` header and sent the full body with a 200).
+    Takes the status and headers rather than a Response so that the
+    asyncio engine can share it.
+    """
+    if status != HTTPStatus.PARTIAL_CONTENT:
+        return 0
+    match = search(r'bytes\s+(\d+)-', headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else 0
+
+
+def expected_length(status: int, headers: Mapping[str, str]) -> int | None:
+    """Return the full size of the body announced by a reply, if known.
+
+    For a 206 reply this is the total after the ``/`` of ``Content-Range``;
+    otherwise it is ``Content-Length``, unless the body is compressed on
+    the wire (its decoded size is then unknown).
+    """
+    if status == HTTPStatus.PARTIAL_CONTENT:
+        match = search(r'/(\d+)\s*$', headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    if headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    length = headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    """Return the delay requested by a ``Retry-After`` header, in seconds.
+
+    Both forms allowed by RFC 9110 are understood: a number of seconds
+    and an HTTP date. Returns None when the header is missing or invalid.
+    """
+    value = headers.get('Retry-After', '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+@dataclass(frozen=True)
+class Transfer:
+    """Outcome of downloading an image into its ``.part`` file.
+
+    ``ttfb`` (time to first byte, in seconds) and ``retried`` (statuses
+    retried before the reply that was kept) describe the last request;
+    they feed :class:`antenati.concurrency.AimdController`.
+    """
+
+    extension: str
+    size: int
+    received: int
+    expected: int | None
+    sha256: str
+    ttfb: float | None = None
+    retried: tuple[int, ...] = ()
+
+    @property
+    def throttled(self) -> bool:
+        return any(status in RETRYABLE_STATUSES for status in self.retried)
+
+
+def guess_image_extension(url: str, content_type: str) -> str:
+    """Return the file extension for ``content_type``, or raise RuntimeError."""
+    extension = guess_extension(content_type)
+    if not extension:
+        raise RuntimeError(f'{url}: Unable to guess extension "{content_type}"')
+    return extension
+
+
+def fetch_to_part(session: Session, url: str, part: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, limiter: RateLimiter | None = None) -> Transfer:
+    """Stream ``url`` into the ``part`` file, continuing what it already holds.
+
+    An existing ``part`` is continued with a range request; a transfer
+    dropped mid-body is continued the same way up to
+    :data:`MAX_RESUME_ATTEMPTS` times. If the server answers with the full
+    body (200) the file is rewritten from scratch, and if it rejects the
+    range (416) the file is discarded and the image fetched again.
+
+    With a ``limiter``, the body is read no faster than its bandwidth
+    budget allows.
+
+    The caller moves ``part`` to its final name: this function only
+    guarantees that on return it holds the complete body.
+    """
+    received = 0
+    attempts = 0
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        try:
+            transfer = _fetch_once(session, url, part, offset, chunk_size, limiter)
+        except (ChunkedEncodingError, RequestsConnectionError) as ex:
+            attempts += 1
+            if attempts > MAX_RESUME_ATTEMPTS:
+                raise
+            received += max(part.stat().st_size - offset, 0) if part.exists() else 0
+            logger.info('Transfer of %s interrupted, resuming: %s', url, ex)
+        except HTTPError as ex:
+            if ex.response is None or ex.response.status_code != HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                raise
+            # The partial file does not match the remote image any more
+            # (e.g. it is longer): start over from byte zero.
+            logger.info('Range rejected for %s, restarting: %s', url, ex)
+            part.unlink(missing_ok=True)
+        else:
+            return replace(transfer, received=received + transfer.received)
+
+
+def _fetch_once(session: Session, url: str, part: Path, offset: int, chunk_size: int, limiter: RateLimiter | None) -> Transfer:
+    # Stream the body straight to disk: each worker holds at most one
+    # chunk in memory instead of a whole full-resolution scan.
+    with fetch(session, url, stream=True, offset=offset) as reply:
+        extension = guess_image_extension(url, get_content_type(reply))
+        start = resumed_offset(reply.status_code, reply.headers)
+        if start != offset:
+            logger.info('Server ignored the range request for %s, downloading it again', url)
+        expected = expected_length(reply.status_code, reply.headers)
+        with storage.PartFile(part, start) as part_file:
+            for chunk in iter_body(reply, chunk_size):
+                part_file.write(chunk)
+                if limiter is not None:
+                    limiter.wait_bytes(len(chunk))
+    part_file.check_length(url, expected)
+    # Response.elapsed stops when the headers are parsed: a TTFB.
+    ttfb = reply.elapsed.total_seconds()
+    return Transfer(extension, part_file.size, part_file.size - start, expected, part_file.sha256, ttfb, _retried_statuses(reply))
+
+
+def _retried_statuses(reply: Response) -> tuple[int, ...]:
+    """Return the statuses urllib3 retried before ``reply`` was received."""
+    retries = getattr(reply.raw, 'retries', None)
+    if retries is None:
+        return ()
+    return tuple(h.status for h in retries.history if h.status is not None)
+
+
+def is_throttling_error(ex: BaseException | None) -> bool:
+    """Return True when ``ex`` is an HTTPError for a throttling status."""
+    return isinstance(ex, HTTPError) and ex.response is not None and ex.response.status_code in RETRYABLE_STATUSES
+
+
+def is_transient_error(ex: BaseException | None) -> bool:
+    """Return True when the request that raised ``ex`` is worth retrying later.
+
+    That is a throttling status or a connection that failed or dropped;
+    any other error (404, WAF challenge, a full disk) would fail again.
+    """
+    return is_throttling_error(ex) or isinstance(ex, (RequestsConnectionError, ChunkedEncodingError, Timeout))
+
+
+def retry_after_from_error(ex: BaseException | None) -> float | None:
+    """Return the ``Retry-After`` delay of the reply that raised ``ex``, if any."""
+    if isinstance(ex, HTTPError) and ex.response is not None:
+        return retry_after(ex.response.headers)
+    return None
+
+
+@dataclass(frozen=True)
+class Document:
+    """A small response (gallery page, manifest) read whole."""
+
+    url: str
+    content: bytes
+    content_type: str
+    from_cache: bool = False
+
+    @property
+    def text(self) -> str:
+        """Return the body decoded with its declared charset, UTF-8 by default."""
+        return self.content.decode(_charset(self.content_type) or 'utf-8')
+
+
+def fetch_document(session: Session, url: str, cache: ResponseCache | None = None) -> Document:
+    """GET a gallery page or a manifest, revalidating the copy in ``cache``.
+
+    With a cached copy the request is conditional (``If-None-Match``,
+    ``If-Modified-Since``) and a ``304 Not Modified`` reply is answered
+    from the cache. Replies carrying a validator are stored for next
+    time; without one they could never be revalidated, so they are not.
+    Errors are raised as by :func:`fetch`.
+    """
+    entry = cache.get(url) if cache is not None else None
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    reply = fetch(session, url, headers=headers)
+    if entry is not None and reply.status_code == HTTPStatus.NOT_MODIFIED:
+        logger.debug('%s not modified, using the cached copy', url)
+        return Document(url, entry.content, entry.content_type, from_cache=True)
+    content_type = reply.headers.get('Content-Type', '')
+    document = Document(url, reply.content, content_type)
+    etag = reply.headers.get('ETag')
+    last_modified = reply.headers.get('Last-Modified')
+    if cache is not None and reply.status_code == HTTPStatus.OK and (etag or last_modified):
+        cache.put(CacheEntry(url, content_type, etag, last_modified, document.content))
+    return document
+
+
+def _charset(content_type: str) -> str | None:
+    msg = Message()
+    msg['Content-Type'] = content_type
+    return msg.get_content_charset()
+
+
 def get_content_type(reply: Response) -> str:
     """Return the bare content-type (no parameters) from a response."""
     msg = Message()
@@ -121,6 +619,4 @@ def get_content_type(reply: Response) -> str:
 
 def get_content_charset(reply: Response) -> str | None:
     """Return the charset declared in a response's Content-Type, if any."""
-    msg = Message()
-    msg['Content-Type'] = reply.headers['Content-Type']
-    return msg.get_content_charset()
+    return _charset(reply.headers['Content-Type'])
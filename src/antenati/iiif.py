@@ -15,10 +15,15 @@ failures.
 
 from __future__ import annotations
 
+import math
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
 from re import findall, search
 from typing import Any
 from urllib.parse import urlsplit
 
+from slugify import slugify
+
 from antenati.errors import ManifestError
 
 # The gallery HTML embeds the IIIF manifest URL inside a JavaScript
@@ -34,6 +39,15 @@ _MANIFEST_KEYWORD: str = 'manifestId'
 # variants the SAN server still serves.
 _FULL_SIZE_TEMPLATE: str = '/full/full/0/'
 
+# How image servers round the dimensions of an image divided by a scale
+# factor: the IIIF Image API computes tiles with ceil, but some servers
+# list their ready ``sizes`` rounded down or to the nearest pixel.
+_ROUNDINGS: dict[str, Callable[[float], int]] = {
+    'ceil': math.ceil,
+    'floor': math.floor,
+    'round': lambda x: math.floor(x + 0.5),
+}
+
 # Metadata labels we expect in every Antenati IIIF manifest.
 META_CONTEXT: str = 'Contesto archivistico'
 META_TITLE: str = 'Titolo'
@@ -161,6 +175,56 @@ def slice_canvases(manifest: dict[str, Any], first: int, last: int | None) -> li
     return canvases[first:last]
 
 
+def manifest_header(manifest: dict[str, Any]) -> dict[str, Any]:
+    """Return the manifest without its ``sequences``, i.e. without its canvases."""
+    return {key: value for key, value in manifest.items() if key != 'sequences'}
+
+
+@dataclass(frozen=True, slots=True)
+class Canvas:
+    """What a download needs of an IIIF canvas, without its dict tree.
+
+    A canvas in the manifest nests its image, the image resource and the
+    image service in dicts of their own, a few kilobytes per canvas once
+    decoded. A gallery keeps one of these records per canvas instead.
+    ``index`` is the position of the canvas in the manifest,
+    ``image_url`` is None when the canvas declares no image (see
+    :meth:`require_image_url`), and ``width`` and ``height`` are the
+    full-size dimensions, None when not declared.
+    """
+
+    index: int
+    label: str
+    image_url: str | None
+    width: int | None
+    height: int | None
+
+    @classmethod
+    def from_iiif(cls, canvas: dict[str, Any], index: int) -> Canvas:
+        """Return the record of an IIIF canvas."""
+        if not isinstance(canvas, dict) or 'label' not in canvas:
+            raise ManifestError("Canvas has no 'label' field")
+        try:
+            image_url: str | None = image_url_for_canvas(canvas)
+        except ManifestError:
+            image_url = None
+        width, height = canvas.get('width'), canvas.get('height')
+        if not isinstance(width, int) or not isinstance(height, int) or width <= 0 or height <= 0:
+            width = height = None
+        return cls(index, str(canvas['label']), image_url, width, height)
+
+    def require_image_url(self) -> str:
+        """Return the image URL, raising :class:`ManifestError` if the canvas declares none."""
+        if self.image_url is None:
+            raise ManifestError(f"Canvas {self.label} has no 'images[0].resource.@id' field")
+        return self.image_url
+
+    @property
+    def image_id(self) -> str:
+        """Return the IIIF image identifier (see :func:`get_image_id_from_url`)."""
+        return get_image_id_from_url(self.require_image_url())
+
+
 def image_url_for_canvas(canvas: dict[str, Any]) -> str:
     """Return the image URL declared by an IIIF canvas."""
     try:
@@ -182,3 +246,200 @@ def manipulate_image_url(url: str, size: int) -> str:
     """
     size_str = f'/full/!{size},{size}/0/' if size > 0 else '/full/pct:100/0/'
     return url.replace(_FULL_SIZE_TEMPLATE, size_str)
+
+
+@dataclass(frozen=True, slots=True)
+class ImageTarget:
+    """Where the image of a canvas is downloaded from, and the file it is saved to.
+
+    ``url`` is None when it cannot be computed, ``error`` telling why.
+    ``renamed`` flags a ``stem`` disambiguated by :func:`build_plan`.
+    """
+
+    canvas: Canvas
+    stem: str
+    url: str | None
+    error: str | None = None
+    renamed: bool = False
+    width: int | None = None
+    height: int | None = None
+
+
+def file_stem(canvas: Canvas, descriptive_names: bool = False, ark_id: str = '') -> str:
+    """Return the file name, without extension, of the image of a canvas.
+
+    It is the slug of the label; ``descriptive_names`` appends the ark
+    ID and the image ID.
+    """
+    label = slugify(canvas.label)
+    if descriptive_names:
+        return f'{label}+{ark_id}+{canvas.image_id}'
+    return label
+
+
+def build_plan(
+    canvases: Sequence[Canvas],
+    size: int,
+    descriptive_names: bool = False,
+    ark_id: str = '',
+    downscales: Downscales | None = None,
+) -> list[ImageTarget]:
+    """Return the image URL, the file stem and the dimensions of every canvas, in one pass.
+
+    Labels that slug to the same stem would make their images overwrite
+    each other: every canvas after the first gets a ``-2``, ``-3``...
+    suffix, in manifest order, and is flagged as ``renamed``. Plan the
+    whole manifest, even to download part of it, so the names do not
+    depend on the part. A canvas whose URL or stem cannot be computed is
+    planned without a URL, with the error, and its stem is not reserved.
+
+    With ``downscales``, the image of a canvas is requested at the largest
+    size the server has ready that fits the ``size`` box, with its exact
+    dimensions (see :meth:`Downscales.fit`); otherwise it is requested
+    with the box, as :func:`manipulate_image_url` does.
+    """
+    taken: set[str] = set()
+    targets = []
+    for canvas in canvases:
+        try:
+            image_url = canvas.require_image_url()
+            stem = file_stem(canvas, descriptive_names, ark_id)
+        except ManifestError as ex:
+            targets.append(ImageTarget(canvas, slugify(canvas.label), None, str(ex)))
+            continue
+        unique = stem
+        n = 1
+        while unique in taken:
+            n += 1
+            unique = f'{stem}-{n}'
+        taken.add(unique)
+        ready = None
+        if downscales is not None and size > 0 and canvas.width and canvas.height:
+            ready = downscales.fit(canvas.width, canvas.height, size)
+        dimensions: tuple[int | None, int | None]
+        if ready is not None:
+            url, dimensions = image_url.replace(_FULL_SIZE_TEMPLATE, f'/full/{ready[0]},{ready[1]}/0/'), ready
+        else:
+            url, dimensions = manipulate_image_url(image_url, size), expected_size(canvas, size)
+        targets.append(ImageTarget(canvas, unique, url, renamed=unique != stem, width=dimensions[0], height=dimensions[1]))
+    return targets
+
+
+def expected_size(canvas: Canvas, size: int) -> tuple[int | None, int | None]:
+    """Return the width and height of the image requested with ``size``.
+
+    The canvas declares the full-size dimensions. ``size > 0`` asks for
+    the best fit in a ``size`` x ``size`` box (see
+    :func:`manipulate_image_url`), which the server does not upscale.
+    Returns ``(None, None)`` when the canvas declares no dimensions.
+    """
+    width, height = canvas.width, canvas.height
+    if width is None or height is None:
+        return None, None
+    if size <= 0:
+        return width, height
+    scale = min(size / width, size / height, 1.0)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def tile_regions(width: int, height: int, tile_size: int) -> list[tuple[int, int, int, int]]:
+    """Split a ``width`` x ``height`` image into ``x, y, w, h`` regions of at most ``tile_size`` pixels a side, row by row."""
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y)) for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+
+def region_url(url: str, region: tuple[int, int, int, int]) -> str:
+    """Rewrite an IIIF image URL to request a region of the image at full resolution."""
+    x, y, w, h = region
+    return url.replace(_FULL_SIZE_TEMPLATE, f'/{x},{y},{w},{h}/pct:100/0/')
+
+
+def info_url(image_url: str) -> str:
+    """Return the URL of the ``info.json`` of the image service serving ``image_url``.
+
+    An image URL is ``{service}/{region}/{size}/{rotation}/{quality}.{format}``.
+    """
+    parts = image_url.rsplit('/', 4)
+    if len(parts) != 5 or not urlsplit(parts[0]).path.strip('/'):
+        raise ManifestError(f'Not an IIIF image URL: {image_url}')
+    return f'{parts[0]}/info.json'
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """What the ``info.json`` of an image tells about it.
+
+    ``width`` and ``height`` are those of the full-size image, ``sizes``
+    the reduced versions the server has ready, and ``scale_factors`` the
+    divisors its tiles are available at.
+    """
+
+    width: int
+    height: int
+    sizes: tuple[tuple[int, int], ...] = ()
+    scale_factors: tuple[int, ...] = ()
+
+
+def parse_image_info(info: dict[str, Any]) -> ImageInfo:
+    """Return the dimensions and the ready sizes declared by an ``info.json``."""
+    try:
+        width, height = int(info['width']), int(info['height'])
+        sizes = tuple((int(s['width']), int(s['height'])) for s in info.get('sizes', ()))
+        scale_factors = tuple(int(f) for tile in info.get('tiles', ()) for f in tile.get('scaleFactors', ()))
+    except (KeyError, TypeError, ValueError, AttributeError) as exc:
+        raise ManifestError(f'Malformed info.json: {exc!r}') from exc
+    if width <= 0 or height <= 0 or any(w <= 0 or h <= 0 for w, h in sizes):
+        raise ManifestError(f'Malformed info.json: non-positive dimensions in {width}x{height}, {sizes}')
+    return ImageInfo(width, height, sizes, tuple(f for f in scale_factors if f > 0))
+
+
+@dataclass(frozen=True)
+class Downscales:
+    """The reductions of its full-size images that an image server has ready.
+
+    A reduction divides the full-size dimensions by one of ``divisors``,
+    rounding them by ``rounding`` (``'ceil'``, ``'floor'`` or
+    ``'round'``). The images of a gallery are stored alike, so
+    :func:`downscales_from` learns this from a sample of them.
+    """
+
+    divisors: tuple[int, ...]
+    rounding: str
+
+    def fit(self, width: int, height: int, size: int) -> tuple[int, int] | None:
+        """Return the largest ready size of a ``width`` x ``height`` image that fits a ``size`` x ``size`` box.
+
+        The full size counts as ready. Returns None if even the smallest
+        reduction does not fit.
+        """
+        rounding = _ROUNDINGS[self.rounding]
+        for divisor in (1, *self.divisors):
+            scaled = rounding(width / divisor), rounding(height / divisor)
+            if max(scaled) <= size:
+                return scaled
+        return None
+
+
+def _ready_divisors(info: ImageInfo, rounding: Callable[[float], int]) -> set[int]:
+    """Return the divisors of the reductions of ``info``, assuming ``rounding``."""
+    divisors = set(info.scale_factors)
+    for w, h in info.sizes:
+        divisor = round(info.width / w)
+        if divisor > 1 and rounding(info.width / divisor) == w and rounding(info.height / divisor) == h:
+            divisors.add(divisor)
+    divisors.discard(1)
+    return divisors
+
+
+def downscales_from(infos: Sequence[ImageInfo]) -> Downscales | None:
+    """Return the reductions every image of ``infos`` has ready, or None if there are none.
+
+    The rounding is the one that explains most of the ``sizes`` listed;
+    with only tiles to go by, it is ``ceil``, as the IIIF Image API
+    computes tile dimensions.
+    """
+    best: Downscales | None = None
+    for name, rounding in _ROUNDINGS.items():
+        common = set.intersection(*(_ready_divisors(info, rounding) for info in infos)) if infos else set()
+        if common and (best is None or len(common) > len(best.divisors)):
+            best = Downscales(tuple(sorted(common)), name)
+    return best
@@ -0,0 +1,213 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Crash-safe journal of download jobs, so a killed run restarts where it stopped.
+
+``--resume`` recovers from an interruption by fetching the manifest
+again and listing the output directory. For jobs that run for days and
+get killed by host reboots, even that repeat work adds up. A
+:class:`Journal` is a SQLite database that records every gallery of a
+job, with its manifest and output directory, and every planned canvas
+with its state: pending, in flight, done (with its size and SHA-256) or
+failed (with the error).
+
+A :class:`antenati.Downloader` given a journal restores a gallery it
+already knows from there, without any network round-trip, and
+downloads only the canvases that are not done, without listing the
+directory. Canvas transitions are buffered and committed in batches, so
+the journal costs one transaction per :data:`DEFAULT_FLUSH_EVERY`
+images or :data:`DEFAULT_FLUSH_INTERVAL` seconds rather than one per
+image. A crash loses at most the last batch: those images are just
+downloaded again, continuing their ``.part`` files.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Transitions buffered before a commit, and the longest they wait.
+DEFAULT_FLUSH_EVERY: int = 64
+DEFAULT_FLUSH_INTERVAL: float = 5.0
+
+# Seconds to wait for another process committing to the same journal.
+_BUSY_TIMEOUT: float = 30.0
+
+_SCHEMA: tuple[str, ...] = (
+    """CREATE TABLE IF NOT EXISTS galleries (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        first INTEGER NOT NULL,
+        last INTEGER,
+        shard TEXT NOT NULL,
+        dirname TEXT NOT NULL,
+        manifest_url TEXT NOT NULL,
+        manifest TEXT NOT NULL
+    )""",
+    'CREATE UNIQUE INDEX IF NOT EXISTS galleries_job ON galleries (url, first, ifnull(last, -1), shard)',
+    """CREATE TABLE IF NOT EXISTS canvases (
+        gallery INTEGER NOT NULL REFERENCES galleries (id),
+        seq INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        state TEXT NOT NULL,
+        size INTEGER,
+        sha256 TEXT,
+        error TEXT,
+        PRIMARY KEY (gallery, seq)
+    )""",
+)
+
+
+class CanvasState(str, Enum):
+    """Where a planned canvas stands."""
+
+    PENDING = 'pending'
+    IN_FLIGHT = 'in-flight'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+@dataclass(frozen=True)
+class JournalGallery:
+    """A gallery recorded in the journal."""
+
+    id: int
+    dirname: Path
+    manifest_url: str
+    manifest: dict[str, Any]
+
+
+class Journal:
+    """The galleries and canvases of a job, in a SQLite database at ``path``.
+
+    Safe to share between the threads of a run. Use it as a context
+    manager, or call :meth:`close`, so the last transitions are committed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        flush_every: int = DEFAULT_FLUSH_EVERY,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer: list[tuple[str, int | None, str | None, str | None, int, int]] = []
+        self._last_flush = clock()
+        self._conn = sqlite3.connect(path, timeout=_BUSY_TIMEOUT, check_same_thread=False)
+        # WAL keeps a commit to a few appends to the log, and a commit
+        # survives a crash of the process; NORMAL only risks the last
+        # batches on a power loss, which then get downloaded again.
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    def gallery(self, url: str, first: int, last: int | None, shard: str = '') -> JournalGallery | None:
+        """Return the gallery recorded for these arguments of a Downloader, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, dirname, manifest_url, manifest FROM galleries WHERE url = ? AND first = ? AND ifnull(last, -1) = ifnull(?, -1) AND shard = ?',
+                (url, first, last, shard),
+            ).fetchone()
+        if row is None:
+            return None
+        return JournalGallery(row[0], Path(row[1]), row[2], json.loads(row[3]))
+
+    def add_gallery(
+        self,
+        url: str,
+        first: int,
+        last: int | None,
+        dirname: Path,
+        manifest_url: str,
+        manifest: dict[str, Any],
+        labels: Mapping[int, str],
+        shard: str = '',
+    ) -> int:
+        """Record a gallery and its canvases, all pending. Returns the gallery ID.
+
+        ``labels`` are those of the canvases to download, by their
+        position in the manifest.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO galleries (url, first, last, shard, dirname, manifest_url, manifest) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, first, last, shard, str(dirname.absolute()), manifest_url, json.dumps(manifest)),
+            )
+            gallery_id = cursor.lastrowid
+            assert gallery_id is not None
+            self._conn.executemany(
+                'INSERT INTO canvases (gallery, seq, label, state) VALUES (?, ?, ?, ?)',
+                ((gallery_id, seq, label, CanvasState.PENDING.value) for seq, label in labels.items()),
+            )
+        return gallery_id
+
+    def unfinished(self, gallery_id: int) -> list[int]:
+        """Return the positions of the canvases of a gallery that are not done."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq FROM canvases WHERE gallery = ? AND state != ? ORDER BY seq',
+                (gallery_id, CanvasState.DONE.value),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def states(self, gallery_id: int) -> dict[CanvasState, int]:
+        """Return how many canvases of a gallery are in each state (committed ones only)."""
+        with self._lock:
+            rows = self._conn.execute('SELECT state, count(*) FROM canvases WHERE gallery = ? GROUP BY state', (gallery_id,)).fetchall()
+        return {CanvasState(state): n for state, n in rows}
+
+    def mark(
+        self,
+        gallery_id: int,
+        seq: int,
+        state: CanvasState,
+        size: int | None = None,
+        sha256: str | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Record a transition of a canvas. It is committed with the next batch."""
+        with self._lock:
+            self._buffer.append((state.value, size, sha256, error, gallery_id, seq))
+            if len(self._buffer) >= self.flush_every or self._clock() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        """Commit the buffered transitions now."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            with self._conn:
+                self._conn.executemany('UPDATE canvases SET state = ?, size = ?, sha256 = ?, error = ? WHERE gallery = ? AND seq = ?', self._buffer)
+            logger.debug('Journal: %d transitions committed', len(self._buffer))
+            self._buffer.clear()
+        self._last_flush = self._clock()
+
+    def close(self) -> None:
+        """Commit the buffered transitions and close the database."""
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self) -> Journal:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None) -> None:
+        self.close()
@@ -0,0 +1,33 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Per-user locations for state shared by all antenati runs on a machine.
+
+Galleries go wherever the user asks; this module only answers where the
+tool keeps its own bookkeeping (the shared rate-limiter state, caches).
+The platform conventions are followed without pulling in a dependency
+for them, and ``ANTENATI_CACHE_DIR`` overrides the choice, e.g. to give
+a group of runs a private budget or to keep tests out of the home.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+CACHE_DIR_ENV: str = 'ANTENATI_CACHE_DIR'
+
+
+def user_cache_dir() -> Path:
+    """Return the antenati cache directory, creating it if needed."""
+    override = os.environ.get(CACHE_DIR_ENV)
+    if override:
+        cache_dir = Path(override)
+    elif sys.platform == 'win32':
+        cache_dir = Path(os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local') / 'antenati' / 'Cache'
+    elif sys.platform == 'darwin':
+        cache_dir = Path.home() / 'Library' / 'Caches' / 'antenati'
+    else:
+        cache_dir = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'antenati'
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
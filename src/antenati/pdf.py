@@ -0,0 +1,254 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Assemble the images of a gallery into one PDF, in constant memory.
+
+A PDF can carry a JPEG file as it is: an image XObject with the
+``DCTDecode`` filter is the JPEG bytes, which the reader decodes. The
+:class:`PdfWriter` copies each image into its own page in blocks,
+reading only the JPEG header for the pixel dimensions and color
+components, so neither the images nor the document are ever held in
+memory: only the offset of each object is kept, for the cross-reference
+table written at the end. A register of thousands of pages takes a few
+kilobytes.
+
+The PNGs stitched from tiles (see :mod:`antenati.tiles`) are embedded
+the same way: their compressed ``IDAT`` data is a ``FlateDecode`` stream
+with the PNG predictors.
+
+The page of a canvas has the proportions of the canvas in the manifest,
+at :data:`PAGE_DPI`; the image fills it.
+"""
+
+from __future__ import annotations
+
+import logging
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+# Resolution the pages are sized at: only the nominal paper size depends
+# on it, the images are embedded at their own resolution.
+PAGE_DPI: float = 300.0
+
+# Block size of the copy of an image into the document.
+_COPY_BLOCK_SIZE: int = 1024 * 1024
+
+# JPEG Start Of Frame markers (baseline, progressive, lossless...), which
+# carry the dimensions: every marker from C0 to CF but DHT, JPG and DAC.
+_SOF_MARKERS: frozenset[int] = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_PNG_SIGNATURE: bytes = b'\x89PNG\r\n\x1a\n'
+_COLOR_SPACES: dict[int, str] = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+# PNG color types embedded as they are: grayscale and RGB, without alpha.
+_PNG_COMPONENTS: dict[int, int] = {0: 1, 2: 3}
+
+# Objects 1 and 2 are written last, when the pages are all known.
+_CATALOG, _PAGES = 1, 2
+
+
+class PdfWriter:
+    """A PDF being written at ``path``, one page per :meth:`add_page`.
+
+    Pages are in the order they are added. :meth:`close` it, or use it as
+    a context manager, to write the page tree and the cross-reference
+    table; ``title`` goes in the document information.
+    """
+
+    def __init__(self, path: Path, title: str = '') -> None:
+        self.path = path
+        self.title = title
+        self.pages = 0
+        self._file: BinaryIO = open(path, 'wb')  # noqa: SIM115 - closed by close()
+        self._offsets: dict[int, int] = {}
+        self._kids: list[int] = []
+        self._next = _PAGES + 1
+        # The binary comment tells transfer tools the file is not text.
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def add_page(self, image: Path, width: int | None = None, height: int | None = None) -> None:
+        """Add a page with the JPEG or PNG ``image``, sized by the ``width`` x ``height`` of its canvas.
+
+        Without the canvas dimensions the page has those of the image.
+        Raises ValueError when the image is neither, is damaged or cannot
+        be read; the document is then left as it was.
+        """
+        try:
+            f = open(image, 'rb')  # noqa: SIM115 - closed below
+        except OSError as ex:
+            raise ValueError(f'Cannot read the image: {ex}') from ex
+        with f:
+            try:
+                head = f.read(len(_PNG_SIGNATURE))
+                f.seek(0)
+                if head.startswith(_PNG_SIGNATURE):
+                    columns, rows, dictionary, blocks = _png_image(f)
+                else:
+                    columns, rows, dictionary, blocks = _jpeg_image(f)
+            except (struct.error, OSError) as ex:
+                raise ValueError(f'Damaged or unreadable image header: {ex}') from ex
+            xobject = self._stream(dictionary, blocks)
+        if not width or not height:
+            width, height = columns, rows
+        page_width, page_height = width * 72 / PAGE_DPI, height * 72 / PAGE_DPI
+        content = f'q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q'.encode()
+        contents = self._stream(b'', iter((content,)))
+        page = self._object(
+            f'<< /Type /Page /Parent {_PAGES} 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {xobject} 0 R >> >> /Contents {contents} 0 R >>'.encode()
+        )
+        self._kids.append(page)
+        self.pages += 1
+
+    def close(self) -> None:
+        """Write the page tree, the cross-reference table and the trailer."""
+        if self._file.closed:
+            return
+        kids = ' '.join(f'{kid} 0 R' for kid in self._kids)
+        self._object(f'<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>'.encode(), _PAGES)
+        self._object(f'<< /Type /Catalog /Pages {_PAGES} 0 R >>'.encode(), _CATALOG)
+        info = self._object(f'<< /Producer (antenati) /Title {_text(self.title)} >>'.encode())
+        xref = self._file.tell()
+        size = self._next
+        self._file.write(f'xref\n0 {size}\n0000000000 65535 f \n'.encode())
+        for number in range(1, size):
+            # An object left unwritten by an image that failed halfway is free.
+            offset = self._offsets.get(number)
+            self._file.write(b'0000000000 65535 f \n' if offset is None else f'{offset:010d} 00000 n \n'.encode())
+        self._file.write(f'trailer\n<< /Size {size} /Root {_CATALOG} 0 R /Info {info} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+        self._file.close()
+        logger.debug('PDF %s closed: %d pages', self.path, self.pages)
+
+    def _object(self, body: bytes, number: int | None = None) -> int:
+        if number is None:
+            number = self._allocate()
+        self._offsets[number] = self._file.tell()
+        self._file.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        return number
+
+    def _stream(self, dictionary: bytes, blocks: Iterator[bytes]) -> int:
+        """Write a stream object from ``blocks``, with its length in an object of its own, written after it.
+
+        When ``blocks`` raises ValueError, the document is truncated back to
+        where the object started and its numbers are released, so the
+        cross-reference table never lists a stream left halfway.
+        """
+        offset = self._file.tell()
+        number = self._allocate()
+        length = self._allocate()
+        self._file.write(b'%d 0 obj\n<< %s /Length %d 0 R >>\nstream\n' % (number, dictionary, length))
+        start = self._file.tell()
+        try:
+            for block in blocks:
+                self._file.write(block)
+        except ValueError:
+            self._file.seek(offset)
+            self._file.truncate()
+            self._next = number
+            raise
+        size = self._file.tell() - start
+        self._file.write(b'\nendstream\nendobj\n')
+        self._offsets[number] = offset
+        self._object(b'%d' % size, length)
+        return number
+
+    def _allocate(self) -> int:
+        number = self._next
+        self._next += 1
+        return number
+
+    def __enter__(self) -> PdfWriter:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None) -> None:
+        self.close()
+
+
+def _read(f: BinaryIO, size: int) -> bytes:
+    try:
+        return f.read(size)
+    except OSError as ex:
+        raise ValueError(f'Cannot read the image: {ex}') from ex
+
+
+def _blocks(f: BinaryIO) -> Iterator[bytes]:
+    while block := _read(f, _COPY_BLOCK_SIZE):
+        yield block
+
+
+def _jpeg_image(f: BinaryIO) -> tuple[int, int, bytes, Iterator[bytes]]:
+    """Read the header of a JPEG: its dimensions, its XObject dictionary and its bytes."""
+    if f.read(2) != b'\xff\xd8':
+        raise ValueError('Not a JPEG or PNG image')
+    adobe = False
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError('JPEG without a frame header')
+        if marker[1] == 0xFF:  # fill byte
+            f.seek(-1, 1)
+            continue
+        (length,) = struct.unpack('>H', f.read(2))
+        segment = f.read(length - 2)
+        if marker[1] == 0xEE and segment.startswith(b'Adobe'):
+            adobe = True
+        if marker[1] in _SOF_MARKERS:
+            bits, rows, columns, components = struct.unpack('>BHHB', segment[:6])
+            break
+    if components not in _COLOR_SPACES:
+        raise ValueError(f'JPEG with {components} color components')
+    # Adobe CMYK JPEGs store the inks inverted.
+    decode = ' /Decode [1 0 1 0 1 0 1 0]' if components == 4 and adobe else ''
+    dictionary = (
+        f'/Type /XObject /Subtype /Image /Width {columns} /Height {rows} /ColorSpace {_COLOR_SPACES[components]} '
+        f'/BitsPerComponent {bits} /Filter /DCTDecode{decode}'
+    ).encode()
+    f.seek(0)
+    return columns, rows, dictionary, _blocks(f)
+
+
+def _png_image(f: BinaryIO) -> tuple[int, int, bytes, Iterator[bytes]]:
+    """Read the header of a PNG: its dimensions, its XObject dictionary and its ``IDAT`` data."""
+    f.seek(len(_PNG_SIGNATURE))
+    length, kind = struct.unpack('>I4s', f.read(8))
+    if kind != b'IHDR':
+        raise ValueError('PNG without a header')
+    columns, rows, bits, color_type, _compression, _filter, interlace = struct.unpack('>IIBBBBB', f.read(length))
+    f.read(4)  # CRC
+    if color_type not in _PNG_COMPONENTS or interlace:
+        raise ValueError(f'PNG of color type {color_type}, interlace {interlace} cannot be embedded as it is')
+    components = _PNG_COMPONENTS[color_type]
+    dictionary = (
+        f'/Type /XObject /Subtype /Image /Width {columns} /Height {rows} /ColorSpace {_COLOR_SPACES[components]} '
+        f'/BitsPerComponent {bits} /Filter /FlateDecode '
+        f'/DecodeParms << /Predictor 15 /Colors {components} /BitsPerComponent {bits} /Columns {columns} >>'
+    ).encode()
+    return columns, rows, dictionary, _idat_blocks(f)
+
+
+def _idat_blocks(f: BinaryIO) -> Iterator[bytes]:
+    while True:
+        header = _read(f, 8)
+        if len(header) < 8:
+            raise ValueError('Truncated PNG')
+        length, kind = struct.unpack('>I4s', header)
+        if kind == b'IEND':
+            return
+        if kind != b'IDAT':
+            f.seek(length + 4, 1)
+            continue
+        remaining = length
+        while remaining:
+            block = _read(f, min(_COPY_BLOCK_SIZE, remaining))
+            if not block:
+                raise ValueError('Truncated PNG')
+            remaining -= len(block)
+            yield block
+        _read(f, 4)  # CRC
+
+
+def _text(value: str) -> str:
+    """Return ``value`` as a PDF text string: UTF-16 with a byte order mark, in hex."""
+    return f'<FEFF{value.encode("utf-16-be").hex().upper()}>'
@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Process the downloaded images in a pool of worker processes, while the download goes on.
+
+Shrinking or converting the images of a gallery used to be a separate
+script, run once the download was over. A :class:`Pipeline` runs the
+same work as soon as each image is saved: :class:`antenati.Downloader`
+submits the file, and a worker process runs the processors on it while
+the threads go on downloading. At most ``max_pending`` files wait for a
+worker. Beyond that, :meth:`Pipeline.submit` blocks the download thread,
+so a slow pipeline slows the download rather than piling up work.
+
+A processor is a function that takes the path of an image and returns
+the path of the result: the same one when it rewrites the file in
+place, another one when it changes its format and removes the original.
+It runs in a worker process, so it must be defined at the top level of
+a module. :data:`PROCESSORS` holds those built in:
+
+- ``optimize``: lossless optimization of the Huffman tables of a JPEG,
+  with ``jpegtran``;
+- ``grayscale``: drop the color of a JPEG, keeping the luminance as it
+  is, with ``jpegtran``;
+- ``webp``: convert the image to WebP at :data:`WEBP_QUALITY`, with
+  Pillow (``pip install antenati[images]``).
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from os import cpu_count, replace
+from pathlib import Path
+from types import TracebackType
+
+from antenati import storage
+
+logger = logging.getLogger(__name__)
+
+Processor = Callable[[Path], Path]
+
+# WebP quality: visually lossless for scanned documents, about a third
+# of the size of the JPEG served by the portal.
+WEBP_QUALITY: int = 90
+
+_JPEG_SUFFIXES: frozenset[str] = frozenset({'.jpg', '.jpeg'})
+
+
+@dataclass(frozen=True)
+class Processed:
+    """A file once through the processors: where it is, its size and its SHA-256."""
+
+    path: Path
+    size: int
+    sha256: str
+
+
+def _jpegtran(path: Path, *options: str) -> Path:
+    if path.suffix.lower() not in _JPEG_SUFFIXES:
+        return path
+    tmp = path.with_name(f'{path.name}{storage.PART_SUFFIX}')
+    subprocess.run(['jpegtran', '-copy', 'all', *options, '-outfile', str(tmp), str(path)], check=True, capture_output=True)
+    replace(tmp, path)
+    return path
+
+
+def optimize(path: Path) -> Path:
+    """Optimize the Huffman tables of a JPEG, without touching its pixels."""
+    return _jpegtran(path, '-optimize')
+
+
+def grayscale(path: Path) -> Path:
+    """Drop the color components of a JPEG, keeping its luminance as it is."""
+    return _jpegtran(path, '-optimize', '-grayscale')
+
+
+def webp(path: Path) -> Path:
+    """Convert an image to WebP, removing the original."""
+    from PIL import Image
+
+    target = path.with_suffix('.webp')
+    tmp = target.with_name(f'{target.name}{storage.PART_SUFFIX}')
+    with Image.open(path) as image:
+        image.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+    replace(tmp, target)
+    path.unlink()
+    return target
+
+
+PROCESSORS: dict[str, Processor] = {'optimize': optimize, 'grayscale': grayscale, 'webp': webp}
+
+
+def processors(names: Sequence[str], derivative_sizes: Sequence[int] = ()) -> list[Processor]:
+    """Return the built-in processors ``names``, after the derivatives at ``derivative_sizes`` when given.
+
+    The derivatives come first, so they are made from the image as it
+    was downloaded (see :mod:`antenati.derivatives`).
+    """
+    selected: list[Processor] = []
+    if derivative_sizes:
+        from antenati.derivatives import Derivatives
+
+        selected.append(Derivatives(tuple(derivative_sizes)))
+    selected.extend(PROCESSORS[name] for name in names)
+    return selected
+
+
+def missing_requirement(name: str) -> str | None:
+    """Return what the built-in processor ``name`` needs and is not installed, or None."""
+    if name in ('optimize', 'grayscale') and shutil.which('jpegtran') is None:
+        return 'jpegtran (from libjpeg or libjpeg-turbo)'
+    if name == 'webp':
+        try:
+            from PIL import features
+        except ImportError:
+            return 'Pillow: pip install "antenati[images]"'
+        if not features.check('webp'):
+            return 'Pillow built with WebP support'
+    return None
+
+
+def process_file(path: Path, processors: Sequence[Processor]) -> Processed:
+    """Run ``processors`` on ``path``, in a worker process."""
+    for processor in processors:
+        path = processor(path)
+    return Processed(path, path.stat().st_size, storage.hash_file(path).hexdigest())
+
+
+class Pipeline:
+    """A pool of ``n_processes`` worker processes running ``processors`` on each file submitted.
+
+    Safe to share between the threads of a run, and between the
+    galleries of a :class:`antenati.Batch`. Use it as a context manager,
+    or call :meth:`close`, to wait for the files submitted and stop the
+    workers.
+    """
+
+    def __init__(self, processors: Sequence[Processor], n_processes: int | None = None, max_pending: int | None = None) -> None:
+        if not processors:
+            raise ValueError('A pipeline needs at least one processor')
+        self.processors = tuple(processors)
+        n_processes = n_processes or cpu_count() or 1
+        self._executor = ProcessPoolExecutor(n_processes, mp_context=multiprocessing.get_context('spawn'))
+        # Two files per worker keep every worker busy between two submits.
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * n_processes)
+        self._idle = threading.Condition()
+        self._pending = 0
+
+    def submit(self, path: Path, on_done: Callable[[Future[Processed]], None] | None = None) -> Future[Processed]:
+        """Queue ``path`` for the processors, waiting while ``max_pending`` files are queued.
+
+        ``on_done`` is called with the future of the result when it is
+        done, on a thread of the pool, before :meth:`join` returns.
+        """
+        self._slots.acquire()
+        with self._idle:
+            self._pending += 1
+        try:
+            future = self._executor.submit(process_file, path, self.processors)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda done: self._finished(done, on_done))
+        return future
+
+    def _finished(self, future: Future[Processed], on_done: Callable[[Future[Processed]], None] | None) -> None:
+        try:
+            if on_done is not None:
+                on_done(future)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        self._slots.release()
+        with self._idle:
+            self._pending -= 1
+            if not self._pending:
+                self._idle.notify_all()
+
+    def join(self) -> None:
+        """Wait for the files submitted so far, and their ``on_done``."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending)
+
+    def close(self) -> None:
+        """Wait for the files submitted and stop the worker processes."""
+        self.join()
+        self._executor.shutdown()
+
+    def __enter__(self) -> Pipeline:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None) -> None:
+        self.close()
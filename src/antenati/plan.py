@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Download plans, and shards to share a gallery out between machines.
+
+A plan lists, for every canvas of a gallery, the image URL as it will be
+requested, the file it will be saved to and the dimensions the server
+is expected to return. :meth:`antenati.Downloader.plan` builds it from
+the manifest, and :func:`write_plan` exports it as NDJSON (one item per
+line) or as a JSON array: a dry-run listing (``--export-plan``) to
+review or feed to other tools, which antenati does not read back.
+
+:func:`shard` splits a plan into ``n`` disjoint shards, so that ``n``
+machines, each with its own network egress, can share one huge register
+or a whole archive. Every machine runs with ``--shard i/n`` (or
+``Downloader(shard=(i, n))``) and the union of their outputs is the
+whole gallery. Canvases are dealt round-robin rather than in contiguous
+ranges: neighbouring pages have similar sizes, so the shards get
+similar amounts of work. File names do not depend on the shard, so
+merging the outputs is a plain copy.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from re import fullmatch
+from typing import TypeVar
+
+T = TypeVar('T')
+
+# Suffix of the plan files written as a single JSON array; any other
+# suffix gets NDJSON.
+JSON_SUFFIX: str = '.json'
+
+
+@dataclass(frozen=True)
+class PlanItem:
+    """One canvas of a download plan."""
+
+    dirname: str
+    index: int
+    label: str
+    url: str
+    stem: str
+    width: int | None
+    height: int | None
+
+
+def shard(items: Sequence[T], i: int, n: int) -> list[T]:
+    """Return shard ``i`` of ``n`` (1-based) of ``items``, dealt round-robin."""
+    if not 1 <= i <= n:
+        raise ValueError(f'Invalid shard {i}/{n}: expected 1 <= i <= n')
+    return list(items[i - 1 :: n])
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """Parse an ``i/n`` shard specification."""
+    match = fullmatch(r'(\d+)/(\d+)', text.strip())
+    if not match:
+        raise ValueError(f'Invalid shard {text!r}: expected i/n, e.g. 2/4')
+    i, n = int(match.group(1)), int(match.group(2))
+    if not 1 <= i <= n:
+        raise ValueError(f'Invalid shard {text!r}: expected 1 <= i <= n')
+    return i, n
+
+
+def write_plan(items: Iterable[PlanItem], path: Path) -> int:
+    """Write ``items`` to ``path``, as a JSON array if it ends in ``.json``, NDJSON otherwise.
+
+    Returns the number of items written.
+    """
+    records = [asdict(item) for item in items]
+    with open(path, 'w', encoding='utf-8') as f:
+        if path.suffix == JSON_SUFFIX:
+            json.dump(records, f, indent=1)
+            f.write('\n')
+        else:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+    return len(records)
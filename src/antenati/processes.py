@@ -0,0 +1,250 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Download galleries, or shards of a gallery, in several processes.
+
+A single process spends its CPU time on one core under the GIL: JSON
+decoding of large manifests, ``slugify``, header processing in requests
+and urllib3, and TLS. :func:`run_processes` gives each of ``n_processes``
+worker processes a unit of work at a time: a gallery, or a shard of one
+(see :mod:`antenati.plan`). Each worker downloads its unit with its own
+:class:`antenati.Downloader` and ``n_workers`` threads.
+
+Workers report their progress through a queue, and the calling thread
+merges it into one :class:`antenati.ProgressBar` and calls
+``on_gallery`` with a :class:`antenati.batch.GalleryReport` per unit. The
+CLI and the GUI can then show a multi-process job like any other.
+Everything the workers share goes through the file system: the
+:class:`antenati.ratelimit.RateLimiter` budget, the caches in the user
+cache directory and the :class:`antenati.journal.Journal`.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Empty
+from typing import Any
+
+from antenati import http
+from antenati.arkindex import ArkIndex
+from antenati.batch import GalleryReport
+from antenati.cache import ResponseCache
+from antenati.downloader import DEFAULT_N_THREADS, Downloader, ProgressBar
+from antenati.journal import Journal
+from antenati.pipeline import Pipeline, processors
+from antenati.ratelimit import RateLimiter
+from antenati.store import ContentStore
+
+logger = logging.getLogger(__name__)
+
+# How often the calling thread checks ``cancel`` while waiting for events.
+_POLL_INTERVAL: float = 0.2
+
+# The queue and the cancel event of a worker process, set by _init_worker.
+_events: Any = None
+_cancel: Any = None
+
+
+@dataclass(frozen=True)
+class Unit:
+    """A gallery, or a shard of one, downloaded by one worker process.
+
+    ``checked`` is set on the shards of :func:`shard_gallery`, whose
+    directory was checked once for all of them: they accept it existing.
+    """
+
+    url: str
+    shard: tuple[int, int] | None = None
+    checked: bool = False
+
+
+@dataclass(frozen=True)
+class ProcessOptions:
+    """What every worker process needs to build and run its Downloader.
+
+    The options of :class:`antenati.Downloader`, :meth:`~antenati.Downloader.check_dir`
+    and :meth:`~antenati.Downloader.run`, in a picklable form: limits and
+    paths instead of the objects that hold them.
+    """
+
+    n_workers: int = DEFAULT_N_THREADS
+    size: int = 0
+    parentdir: str | None = None
+    resume: bool = False
+    descriptive_names: bool = False
+    chunk_size: int = http.DEFAULT_CHUNK_SIZE
+    max_host_connections: int | None = None
+    max_rate: float | None = None
+    max_bandwidth: float | None = None
+    cache: bool = True
+    index: bool = True
+    journal: Path | None = None
+    probe_sizes: bool = False
+    tile_size: int | None = None
+    archive: str | None = None
+    pdf: bool = False
+    # Names of antenati.pipeline.PROCESSORS: each worker process runs
+    # them in a pipeline of its own, of process_workers processes.
+    process: tuple[str, ...] = ()
+    derivatives: tuple[int, ...] = ()
+    process_workers: int = 1
+    store: Path | None = None
+    log_level: int = logging.WARNING
+
+
+def shard_units(url: str, n: int, checked: bool = False) -> list[Unit]:
+    """Return the ``n`` shards of the gallery at ``url``, as units of work."""
+    return [Unit(url, (i, n), checked) for i in range(1, n + 1)]
+
+
+def shard_gallery(url: str, n: int, options: ProcessOptions, interactive: bool = False) -> list[Unit]:
+    """Check the directory of the gallery at ``url``, then return its ``n`` shards, as units of work.
+
+    The directory is checked as :meth:`antenati.Downloader.check_dir`
+    checks it for a single process: an existing one is only accepted
+    with ``options.resume``, or after asking when ``interactive``. The
+    shards then share it.
+    """
+    journal = Journal(options.journal) if options.journal is not None else None
+    try:
+        # As a shard, to find the gallery a journal restores the shards from.
+        downloader = Downloader(
+            url,
+            0,
+            None,
+            descriptive_names=options.descriptive_names,
+            cache=ResponseCache() if options.cache else None,
+            index=ArkIndex() if options.index else None,
+            journal=journal,
+            shard=(1, n),
+        )
+        downloader.check_dir(parentdir=options.parentdir, interactive=interactive, resume=options.resume)
+    finally:
+        if journal is not None:
+            journal.close()
+    return shard_units(url, n, checked=True)
+
+
+def run_processes(
+    units: Sequence[Unit],
+    n_processes: int,
+    options: ProcessOptions,
+    progress: ProgressBar,
+    on_gallery: Callable[[GalleryReport], None] | None = None,
+    cancel: threading.Event | None = None,
+) -> list[GalleryReport]:
+    """Download ``units`` in ``n_processes`` worker processes. Returns a report per unit.
+
+    ``progress`` counts the images of all the units, and its total grows
+    as they start. ``on_gallery`` is called from the calling thread as
+    each unit finishes. Setting ``cancel`` stops the workers as it stops
+    :meth:`antenati.Downloader.run`; units not started yet are skipped.
+    """
+    reports = [GalleryReport(unit.url, shard=unit.shard) for unit in units]
+    if not reports:
+        return reports
+    # Spawned rather than forked: the calling process has threads (the
+    # GUI, the progress bar), and a fork would copy their locks.
+    context = multiprocessing.get_context('spawn')
+    events = context.Queue()
+    worker_cancel = context.Event()
+    grand_total = 0
+    with ProcessPoolExecutor(n_processes, mp_context=context, initializer=_init_worker, initargs=(events, worker_cancel)) as executor:
+        futures: dict[Future[None], int] = {executor.submit(_run_unit, uid, unit, options): uid for uid, unit in enumerate(units)}
+        unfinished = set(range(len(units)))
+        while unfinished:
+            if cancel is not None and cancel.is_set() and not worker_cancel.is_set():
+                logger.info('Cancelling the worker processes')
+                worker_cancel.set()
+                for future in futures:
+                    future.cancel()
+            try:
+                kind, uid, *payload = events.get(timeout=_POLL_INTERVAL)
+            except Empty:
+                # A unit whose process died, or that was cancelled before
+                # starting, sends nothing more.
+                for future, uid in futures.items():
+                    if uid in unfinished and future.done() and (future.cancelled() or future.exception() is not None):
+                        unfinished.discard(uid)
+                        if not future.cancelled():
+                            reports[uid].error = str(future.exception())
+                            _finish(reports[uid], on_gallery)
+                continue
+            report = reports[uid]
+            if kind == 'total':
+                report.total = payload[0]
+                grand_total += report.total
+                progress.set_total(grand_total)
+            elif kind == 'update':
+                report.done += 1
+                progress.update()
+            elif kind == 'finished':
+                report.dirname, report.received, report.error = payload
+                unfinished.discard(uid)
+                _finish(report, on_gallery)
+    return reports
+
+
+def _finish(report: GalleryReport, on_gallery: Callable[[GalleryReport], None] | None) -> None:
+    report.finished = True
+    if on_gallery is not None:
+        on_gallery(report)
+
+
+def _init_worker(events: Any, cancel: Any) -> None:
+    global _events, _cancel
+    _events, _cancel = events, cancel
+
+
+def _run_unit(uid: int, unit: Unit, options: ProcessOptions) -> None:
+    """Download one unit, in a worker process, reporting on the event queue."""
+    logging.basicConfig(level=options.log_level)
+    dirname: Path | None = None
+    received = 0
+    error: str | None = None
+    progress = ProgressBar(lambda total: _events.put(('total', uid, total)), lambda: _events.put(('update', uid)))
+    limiter = None
+    if options.max_rate is not None or options.max_bandwidth is not None:
+        limiter = RateLimiter(options.max_rate, options.max_bandwidth)
+    journal = Journal(options.journal) if options.journal is not None else None
+    stage = processors(options.process, options.derivatives)
+    pipeline = Pipeline(stage, options.process_workers) if stage else None
+    try:
+        downloader = Downloader(
+            unit.url,
+            0,
+            None,
+            descriptive_names=options.descriptive_names,
+            chunk_size=options.chunk_size,
+            max_host_connections=options.max_host_connections,
+            rate_limiter=limiter,
+            cache=ResponseCache() if options.cache else None,
+            index=ArkIndex() if options.index else None,
+            journal=journal,
+            shard=unit.shard,
+            probe_sizes=options.probe_sizes,
+            tile_size=options.tile_size,
+            archive=options.archive,
+            pdf=options.pdf,
+            pipeline=pipeline,
+            store=ContentStore(options.store) if options.store is not None else None,
+        )
+        # The shards of shard_gallery share the directory it checked.
+        downloader.check_dir(parentdir=options.parentdir, interactive=False, resume=options.resume or unit.checked)
+        dirname = downloader.dirname
+        received = downloader.run(options.n_workers, options.size, progress, cancel=_cancel, resume=options.resume)
+    except Exception as ex:  # whatever it is, the parent reports it with the unit
+        error = str(ex)
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        if journal is not None:
+            journal.close()
+        if limiter is not None:
+            limiter.close()
+    _events.put(('finished', uid, dirname, received, error))
@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Request-rate and bandwidth budget shared by all antenati runs on a host.
+
+Each process has its own retry policy and knows nothing of the others,
+so several galleries downloaded side by side can add up to more than
+the SAN servers tolerate. A :class:`RateLimiter` keeps two token buckets,
+one for requests and one for bytes, in a small file under
+:func:`antenati.paths.user_cache_dir`. Every process that uses the same
+file takes from the same buckets, and an exclusive lock on the file
+(``flock`` on POSIX, ``msvcrt.locking`` on Windows) serialises updates.
+
+Tokens are reserved rather than waited for: a reservation may drive a
+bucket negative, and the caller then sleeps for the debt outside the
+lock. Waiters thus queue in the order they arrived, and the lock is only
+held for a read and a write of 32 bytes. :meth:`RateLimiter.reserve_request`
+and :meth:`RateLimiter.reserve_bytes` return the delay, so the asyncio
+engine can ``await asyncio.sleep`` it; :meth:`RateLimiter.wait_request`
+and :meth:`RateLimiter.wait_bytes` sleep in the calling thread.
+
+The budget is whatever each process was given: runs sharing a file
+should be started with the same limits.
+"""
+
+from __future__ import annotations
+
+import logging
+import struct
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO
+
+from antenati.paths import user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME: str = 'ratelimit.bin'
+
+# Tokens and last refill time of the request bucket, then of the byte
+# bucket. Wall-clock time: it must mean the same to every process.
+_STATE = struct.Struct('<4d')
+
+# A bucket holds at most this many seconds of budget, so a run starting
+# after a quiet period can burst only briefly.
+BURST_SECONDS: float = 1.0
+
+if sys.platform == 'win32':  # pragma: no cover - exercised on Windows only
+    import msvcrt
+
+    def _lock(state_file: BinaryIO) -> None:
+        state_file.seek(0)
+        msvcrt.locking(state_file.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock(state_file: BinaryIO) -> None:
+        state_file.seek(0)
+        msvcrt.locking(state_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(state_file: BinaryIO) -> None:
+        fcntl.flock(state_file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(state_file: BinaryIO) -> None:
+        fcntl.flock(state_file.fileno(), fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """Token buckets for requests per second and bytes per second.
+
+    Either limit may be None to leave that dimension unlimited. ``path``
+    defaults to :data:`STATE_FILENAME` in the user cache directory, which
+    is what makes the budget global to the machine.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float | None = None,
+        bytes_per_second: float | None = None,
+        path: Path | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        for name, value in (('requests_per_second', requests_per_second), ('bytes_per_second', bytes_per_second)):
+            if value is not None and value <= 0:
+                raise ValueError(f'{name} must be positive, got {value}')
+        self.requests_per_second = requests_per_second
+        self.bytes_per_second = bytes_per_second
+        self.path = path if path is not None else user_cache_dir() / STATE_FILENAME
+        self._clock = clock
+        # One open file per process: flock() excludes other processes,
+        # the thread lock the other threads of this one.
+        self._thread_lock = threading.Lock()
+        self._file = open(self.path, 'a+b')  # noqa: SIM115 - closed by close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> RateLimiter:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    @contextmanager
+    def _locked(self) -> Iterator[BinaryIO]:
+        with self._thread_lock:
+            _lock(self._file)
+            try:
+                yield self._file
+            finally:
+                _unlock(self._file)
+
+    def _update(self, change: Callable[[list[float]], None]) -> None:
+        with self._locked() as state_file:
+            state_file.seek(0)
+            raw = state_file.read(_STATE.size)
+            # A new (or damaged) file starts with full buckets.
+            state = list(_STATE.unpack(raw)) if len(raw) == _STATE.size else [0.0] * 4
+            change(state)
+            # Opened for appending: empty the file, then write the record.
+            state_file.truncate(0)
+            state_file.write(_STATE.pack(*state))
+            state_file.flush()
+
+    def _reserve(self, index: int, rate: float, amount: float) -> float:
+        now = self._clock()
+        tokens = 0.0
+
+        def take(state: list[float]) -> None:
+            nonlocal tokens
+            available, last = state[index], state[index + 1]
+            capacity = max(rate * BURST_SECONDS, 1.0)
+            # A last refill in the future means the clock was set back.
+            available = min(available + max(now - last, 0.0) * rate, capacity)
+            tokens = available - amount
+            state[index], state[index + 1] = tokens, now
+
+        self._update(take)
+        return max(-tokens / rate, 0.0)
+
+    def reserve_request(self) -> float:
+        """Take a request from the budget; return the seconds to wait before sending it."""
+        if self.requests_per_second is None:
+            return 0.0
+        return self._reserve(0, self.requests_per_second, 1)
+
+    def reserve_bytes(self, n_bytes: int) -> float:
+        """Take ``n_bytes`` from the budget; return the seconds to wait before reading more."""
+        if self.bytes_per_second is None or n_bytes <= 0:
+            return 0.0
+        return self._reserve(2, self.bytes_per_second, n_bytes)
+
+    def wait_request(self) -> None:
+        _sleep(self.reserve_request())
+
+    def wait_bytes(self, n_bytes: int) -> None:
+        _sleep(self.reserve_bytes(n_bytes))
+
+
+def _sleep(delay: float) -> None:
+    if delay > 0:
+        logger.debug('Rate limit: waiting %.3f s', delay)
+        time.sleep(delay)
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Work queue of :class:`antenati.downloader.Downloader`, with delayed retries.
+
+Left to urllib3, a retry sleeps through its backoff inside the worker
+thread that made the request, and that worker downloads nothing in the
+meantime. During an evening slowdown most workers can be asleep like
+this. Instead, :class:`RetryScheduler` hands out canvases and takes back
+the ones that failed with a transient error. It holds them in a delayed
+queue until their backoff has elapsed, and meanwhile the free workers
+pull fresh canvases.
+
+The delay honours the server's ``Retry-After`` when there is one, up to
+:data:`MAX_RETRY_AFTER`. Otherwise it is the usual exponential backoff of
+:data:`antenati.http.RETRY_BACKOFF_FACTOR` with "equal jitter": half
+fixed and half random, so canvases failed by the same hiccup do not all
+come back at the same instant.
+
+:class:`DownloadPass` keeps the book of a pass over the canvases: it
+feeds the failures with a transient cause back to the scheduler, and
+sums up the others. Both engines of :class:`antenati.Downloader` use it,
+and so does :class:`antenati.Batch`, one per gallery.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from itertools import count
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+from antenati import http
+
+if TYPE_CHECKING:
+    from antenati.concurrency import AimdController
+    from antenati.downloader import ProgressBar
+    from antenati.errors import ThreadError
+    from antenati.iiif import ImageTarget
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Longest backoff between two attempts on a canvas, as urllib3's default.
+MAX_BACKOFF: float = 120.0
+
+# Longest Retry-After honoured: a server asking for hours (or a
+# misconfigured one) must not park a canvas for the rest of the run.
+MAX_RETRY_AFTER: float = 600.0
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None, rng: Callable[[], float] = random.random) -> float:
+    """Return the delay before retry number ``attempt`` (0-based) of a canvas."""
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_AFTER)
+    base = min(http.RETRY_BACKOFF_FACTOR * 2**attempt, MAX_BACKOFF)
+    return base / 2 + rng() * base / 2
+
+
+class RetryScheduler(Generic[T]):
+    """Canvases still to download: fresh ones, and failed ones waiting to be retried.
+
+    Each canvas is handed out with its attempt number, which the caller
+    gives back to :meth:`defer` if the attempt fails. Not thread-safe: the
+    orchestrating thread (or event loop) owns it.
+    """
+
+    def __init__(
+        self,
+        canvases: Iterable[T],
+        max_retries: int = http.RETRY_TOTAL,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.max_retries = max_retries
+        self._fresh = deque(canvases)
+        # (due time, tie-breaker, canvas, attempt), ordered by due time.
+        self._delayed: list[tuple[float, int, T, int]] = []
+        self._sequence = count()
+        self._clock = clock
+        self._rng = rng
+
+    def __len__(self) -> int:
+        return len(self._fresh) + len(self._delayed)
+
+    def pop_ready(self) -> tuple[T, int] | None:
+        """Return a canvas to download now and its attempt number, or None.
+
+        Retries that are due go first: they have waited already.
+        """
+        if self._delayed and self._delayed[0][0] <= self._clock():
+            _due, _seq, canvas, attempt = heapq.heappop(self._delayed)
+            return canvas, attempt
+        if self._fresh:
+            return self._fresh.popleft(), 0
+        return None
+
+    def defer(self, canvas: T, attempt: int, retry_after: float | None = None) -> float | None:
+        """Queue a failed canvas for a later attempt.
+
+        Returns the delay, or None when the canvas is out of retries.
+        """
+        if attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt, retry_after, self._rng)
+        heapq.heappush(self._delayed, (self._clock() + delay, next(self._sequence), canvas, attempt + 1))
+        return delay
+
+    def wait_time(self) -> float | None:
+        """Return the seconds until a canvas is ready: 0 if one is, None if none is queued."""
+        if self._fresh:
+            return 0.0
+        if not self._delayed:
+            return None
+        return max(self._delayed[0][0] - self._clock(), 0.0)
+
+
+@dataclass(frozen=True)
+class ErrorKinds:
+    """How an engine tells apart the errors its transfers fail with."""
+
+    is_transient: Callable[[BaseException | None], bool]
+    retry_after: Callable[[BaseException | None], float | None]
+    is_throttling: Callable[[BaseException | None], bool]
+
+
+# The errors of the threads engine, which downloads with requests.
+THREADS_ERRORS = ErrorKinds(http.is_transient_error, http.retry_after_from_error, http.is_throttling_error)
+
+
+@dataclass
+class DownloadPass:
+    """Book-keeping of one pass over the canvases, shared by both engines.
+
+    Failures are only final (and ticked on the progress bar) when
+    ``final`` is set: otherwise a final pass will try them again.
+    """
+
+    scheduler: RetryScheduler[ImageTarget]
+    progress: ProgressBar
+    errors: ErrorKinds
+    controller: AimdController | None = None
+    final: bool = True
+    received: int = 0
+    # Keyed by file stem: canvases may share a label, not a stem.
+    failed: dict[str, tuple[ImageTarget, str]] = field(default_factory=dict)
+    failed_before: dict[str, tuple[ImageTarget, str]] = field(default_factory=dict)
+
+    def succeeded(self, transfer: http.Transfer) -> None:
+        self.received += transfer.received
+        self.progress.update()
+        if self.controller is not None:
+            self.controller.record(transfer.ttfb, transfer.throttled)
+
+    def attempt_failed(self, target: ImageTarget, attempt: int, ex: ThreadError) -> None:
+        cause = ex.__cause__
+        if self.controller is not None:
+            self.controller.record(None, self.errors.is_throttling(cause))
+        if self.errors.is_transient(cause):
+            delay = self.scheduler.defer(target, attempt, self.errors.retry_after(cause))
+            if delay is not None:
+                logger.info('Image %s failed (%s), retrying in %.1f s', ex.label, cause, delay)
+                return
+        logger.warning('Image %s failed: %s', ex.label, cause)
+        self.failed[target.stem] = (target, str(cause))
+        if self.final:
+            self.progress.update()
+
+    def final_pass(self) -> DownloadPass:
+        """Return the pass that tries the failed canvases once more."""
+        targets = [target for target, _message in self.failed.values()]
+        return DownloadPass(RetryScheduler(targets), self.progress, self.errors, received=self.received, failed_before=self.failed)
+
+    def outcome(self, cancelled: bool) -> int:
+        """Return the bytes received, or raise the summary of the failures."""
+        if cancelled:
+            logger.info('Download cancelled by caller')
+            return self.received
+        if self.failed:
+            raise _failure_summary({label: message for label, (_target, message) in self.failed.items()})
+        return self.received
+
+
+def _failure_summary(failed: dict[str, str]) -> RuntimeError:
+    msg = f'Failed to download {len(failed)} images:\n'
+    msg += '\n - '.join(f'{k}: {v}' for k, v in failed.items())
+    return RuntimeError(msg)
@@ -0,0 +1,231 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""On-disk layout helpers for downloaded galleries.
+
+:class:`antenati.downloader.Downloader` saves each canvas as
+``{stem}{extension}`` inside the gallery directory. The helpers here let
+a resumed run find out, with a single directory listing, which of those
+files are already complete so that only the missing or truncated ones
+are fetched again.
+
+Completeness is judged from cheap markers only (non-empty file and, for
+JPEG, the SOI/EOI markers at both ends): no image is decoded.
+
+Images in flight are written to ``{stem}.part`` and renamed to their
+final name only once the body has been fully received, so a crash never
+leaves a truncated file under a final name; the ``.part`` file is kept
+so the next attempt can continue it with an HTTP range request.
+
+Every completed image is also recorded in a sidecar index (one JSON
+line per file in :data:`INDEX_FILENAME`) with its size, the length the
+server announced and the SHA-256 computed while the body was streamed.
+:mod:`antenati.verify` checks files against it without re-downloading.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+import threading
+from dataclasses import asdict, dataclass
+from hashlib import sha256
+from os import replace, scandir
+from os.path import splitext
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hashlib import _Hash
+
+logger = logging.getLogger(__name__)
+
+# Every JPEG starts with the Start Of Image marker and a complete one
+# ends with the End Of Image marker: a transfer cut short misses the EOI.
+JPEG_SOI: bytes = b'\xff\xd8'
+JPEG_EOI: bytes = b'\xff\xd9'
+_JPEG_EXTENSIONS: frozenset[str] = frozenset({'.jpg', '.jpeg', '.jpe'})
+
+PART_SUFFIX: str = '.part'
+
+# Hidden, so that scan_dir() never mistakes it for an image.
+INDEX_FILENAME: str = '.antenati-index.jsonl'
+
+_HASH_BLOCK_SIZE: int = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """What was recorded about an image when its download completed."""
+
+    filename: str
+    url: str
+    size: int
+    content_length: int | None
+    sha256: str
+
+
+class GalleryIndex:
+    """Append-only sidecar index of the images saved in a gallery directory.
+
+    Entries are appended as JSON lines, one ``write`` each, so concurrent
+    workers (and processes writing the same directory) never interleave
+    partial records. When a file appears more than once the last entry
+    wins.
+    """
+
+    def __init__(self, dirname: Path) -> None:
+        self.path = dirname / INDEX_FILENAME
+        self._lock = threading.Lock()
+
+    def load(self) -> dict[str, IndexEntry]:
+        """Return the recorded entries keyed by file name."""
+        entries: dict[str, IndexEntry] = {}
+        try:
+            with open(self.path, encoding='utf-8') as index_file:
+                for line in index_file:
+                    try:
+                        entry = IndexEntry(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # A line cut short by a crash: ignore it, the
+                        # image it described is simply not indexed.
+                        logger.debug('Skipping malformed index line in %s', self.path)
+                        continue
+                    entries[entry.filename] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def append(self, entry: IndexEntry) -> None:
+        """Record ``entry``; safe to call from several threads."""
+        line = json.dumps(asdict(entry), separators=(',', ':')) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as index_file:
+            index_file.write(line)
+
+    def discard(self, filenames: set[str]) -> None:
+        """Drop the entries of ``filenames``, compacting the index file."""
+        with self._lock:
+            kept = [e for e in self.load().values() if e.filename not in filenames]
+            tmp = self.path.with_name(f'{self.path.name}.tmp')
+            with open(tmp, 'w', encoding='utf-8') as index_file:
+                index_file.writelines(json.dumps(asdict(e), separators=(',', ':')) + '\n' for e in kept)
+            replace(tmp, self.path)
+
+
+def hash_file(filename: Path, length: int | None = None) -> _Hash:
+    """Return a SHA-256 object fed with the first ``length`` bytes of a file.
+
+    Used to seed the hash of a transfer continued from a ``.part`` file,
+    and by :mod:`antenati.verify` to re-hash whole files.
+    """
+    digest = sha256()
+    remaining = length
+    with open(filename, 'rb') as img_file:
+        while remaining is None or remaining > 0:
+            block = img_file.read(_HASH_BLOCK_SIZE if remaining is None else min(_HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest
+
+
+def part_path(dirname: Path, stem: str) -> Path:
+    """Return the path an image is written to while it is downloading.
+
+    The final extension depends on the ``Content-Type`` of the reply, so
+    the partial file is named after the stem only: it can be located
+    before the request is sent.
+    """
+    return dirname / f'{stem}{PART_SUFFIX}'
+
+
+class PartFile:
+    """A ``.part`` file being written, hashed as the bytes go to disk.
+
+    ``start`` is where the new bytes go: the existing content up to that
+    offset is kept (and fed to the hash first), anything after it is cut.
+    A file hard-linked elsewhere, such as into a
+    :class:`antenati.store.ContentStore`, is never written in place: it
+    is replaced by a file of its own first.
+    """
+
+    def __init__(self, path: Path, start: int = 0) -> None:
+        self.path = path
+        if not start:
+            path.unlink(missing_ok=True)
+        elif path.stat().st_nlink > 1:
+            tmp = path.with_name(f'{path.name}.copy')
+            shutil.copyfile(path, tmp)
+            replace(tmp, path)
+        self._digest = hash_file(path, start) if start else sha256()
+        self._file = open(path, 'r+b' if start else 'wb')  # noqa: SIM115 - closed by close()
+        self._file.seek(start)
+        self._file.truncate()
+        self.size = start
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._digest.update(chunk)
+        self.size += len(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> PartFile:
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self.close()
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def check_length(self, url: str, expected: int | None) -> None:
+        """Raise RuntimeError when the file is shorter or longer than announced."""
+        if expected is not None and self.size != expected:
+            raise RuntimeError(f'{url}: received {self.size} bytes, expected {expected}')
+
+
+def scan_dir(dirname: Path) -> dict[str, Path]:
+    """Index the regular files of ``dirname`` by stem.
+
+    Returns an empty mapping when the directory does not exist. Hidden
+    files and ``.part`` files are skipped, so neither bookkeeping files
+    nor partial downloads shadow an image.
+    """
+    try:
+        entries = list(scandir(dirname))
+    except FileNotFoundError:
+        return {}
+    found: dict[str, Path] = {}
+    for entry in entries:
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        stem, extension = splitext(entry.name)
+        if extension == PART_SUFFIX:
+            continue
+        found[stem] = Path(entry.path)
+    logger.debug('Found %d files in %s', len(found), dirname)
+    return found
+
+
+def is_complete(filename: Path) -> bool:
+    """Return True when ``filename`` looks like a fully written image."""
+    try:
+        size = filename.stat().st_size
+        if size == 0:
+            return False
+        if filename.suffix.lower() not in _JPEG_EXTENSIONS:
+            return True
+        if size < len(JPEG_SOI) + len(JPEG_EOI):
+            return False
+        with open(filename, 'rb') as img_file:
+            head = img_file.read(len(JPEG_SOI))
+            img_file.seek(-len(JPEG_EOI), 2)
+            tail = img_file.read(len(JPEG_EOI))
+    except OSError:
+        return False
+    return head == JPEG_SOI and tail == JPEG_EOI
@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Content-addressed store of downloaded images, linked into the galleries.
+
+Blank separator pages, covers repeated from register to register and
+galleries downloaded again into another folder all put the same bytes
+on disk more than once, and download them more than once. A
+:class:`ContentStore` keeps one copy of each image, named after the
+SHA-256 the download computes while streaming, and every gallery file
+with those bytes becomes a hard link to it, or a reflink on a
+copy-on-write filesystem.
+
+The store also remembers the image URL each object was downloaded from.
+Before an image is requested, :meth:`ContentStore.lookup` checks its URL:
+an image already in the store is linked into the gallery without any
+request. The URL names the exact bytes, size included, so the same
+canvas at another ``--size`` is another object.
+
+A gallery on another filesystem than the store can share nothing with
+it: its images are not stored, with a warning, since every object would
+be one more copy. Images already in the store are still copied into it
+rather than downloaded again.
+
+A gallery file linked to an object is the object: rewriting it in place
+would change it for every gallery. Tools that rewrite images (see
+:mod:`antenati.pipeline`) write a new file and replace the link, which
+leaves the object as it is. The store directory holds the objects, in
+``objects/<first two hex digits>/<sha256>``, and the SQLite database of
+the URLs, which concurrent runs can safely share.
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import sqlite3
+import sys
+import threading
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from os import getpid, link, replace
+from pathlib import Path
+
+if sys.platform != 'win32':
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILENAME: str = 'store.sqlite3'
+OBJECTS_SUBDIR: str = 'objects'
+
+# Linux ioctl that clones a file into another sharing its extents (a
+# reflink), on Btrfs, XFS and other copy-on-write filesystems.
+_FICLONE: int = 0x40049409
+
+# Seconds to wait for a concurrent run holding the database lock.
+_BUSY_TIMEOUT: float = 30.0
+
+_SCHEMA: str = 'CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, extension TEXT NOT NULL)'
+
+
+class ContentStore:
+    """The store of images in the directory ``root``, created if missing.
+
+    Safe to share between the threads of a run and between runs. For
+    the galleries to be hard links, ``root`` must be on their filesystem.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        # Directories already warned about, that cannot share files with the store.
+        self._unshared: set[Path] = set()
+        self._lock = threading.Lock()
+        (root / OBJECTS_SUBDIR).mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation, as in antenati.arkindex.
+        with closing(sqlite3.connect(self.root / DATABASE_FILENAME, timeout=_BUSY_TIMEOUT)) as conn, conn:
+            yield conn
+
+    def object_path(self, sha256: str) -> Path:
+        """Return where the object with checksum ``sha256`` is kept."""
+        return self.root / OBJECTS_SUBDIR / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> tuple[str, str] | None:
+        """Return the SHA-256 and the file extension of the image at ``url``, when its object is in the store."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT sha256, extension FROM images WHERE url = ?', (url,)).fetchone()
+        if row is None or not self.object_path(row[0]).exists():
+            return None
+        return str(row[0]), str(row[1])
+
+    def link(self, sha256: str, dest: Path) -> int:
+        """Make ``dest`` a link to the object ``sha256``, or a copy of it on another filesystem. Returns its size."""
+        obj = self.object_path(sha256)
+        if not _share(obj, dest):
+            self._warn_unshared(dest.parent)
+            _copy(obj, dest)
+        return obj.stat().st_size
+
+    def add(self, path: Path, sha256: str, url: str) -> None:
+        """Put the image at ``path``, downloaded from ``url``, in the store, and make ``path`` a link to it.
+
+        When the store holds those bytes already, ``path`` is replaced by
+        a link to them: the duplicate takes no space. When ``path`` cannot
+        share its bytes with the store, it is left as it is, not stored.
+        """
+        obj = self.object_path(sha256)
+        if not obj.exists():
+            obj.parent.mkdir(exist_ok=True)
+            staged = obj.with_name(f'.{obj.name}.{getpid()}.{threading.get_ident()}')
+            if not _share(path, staged):
+                self._warn_unshared(path.parent)
+                return
+            try:
+                # Of the threads and runs adding the same bytes at once,
+                # one creates the object and the others link to it below.
+                link(staged, obj)
+            except FileExistsError:
+                pass
+            finally:
+                staged.unlink()
+        if not path.samefile(obj) and not _share(obj, path):
+            self._warn_unshared(path.parent)
+            return
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO images (url, sha256, extension) VALUES (?, ?, ?)', (url, sha256, path.suffix))
+
+    def _warn_unshared(self, directory: Path) -> None:
+        with self._lock:
+            if directory in self._unshared:
+                return
+            self._unshared.add(directory)
+        logger.warning('%s cannot share files with the store %s (another filesystem?): its images are not stored', directory, self.root)
+
+
+def _share(source: Path, dest: Path) -> bool:
+    """Replace ``dest`` with a hard link to ``source``, else a reflink. Returns False when neither is possible."""
+    tmp = dest.with_name(f'.{dest.name}.link')
+    tmp.unlink(missing_ok=True)
+    try:
+        link(source, tmp)
+    except OSError:
+        # Another filesystem, or one without hard links.
+        if not _reflink(source, tmp):
+            return False
+    replace(tmp, dest)
+    return True
+
+
+def _reflink(source: Path, dest: Path) -> bool:
+    if sys.platform == 'win32':
+        return False
+    try:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError:
+        dest.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _copy(source: Path, dest: Path) -> None:
+    tmp = dest.with_name(f'.{dest.name}.link')
+    shutil.copyfile(source, tmp)
+    replace(tmp, dest)
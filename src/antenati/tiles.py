@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Download a huge image as region tiles fetched in parallel, then stitch them.
+
+A full-resolution map or an oversized register is one ``pct:100``
+request: a single TCP stream, bound by the throughput of one connection,
+that sometimes times out and then has to start over. :func:`fetch_tiles`
+requests the image as ``x,y,w,h`` regions instead (see
+:func:`antenati.iiif.tile_regions`), on a thread pool that shares the
+session of the downloader and so its connection pool. Each tile is kept
+in a hidden directory next to the image as soon as it is complete: when
+a tile fails, the retry of the image fetches only the tiles still
+missing.
+
+:func:`stitch` pastes the tiles together with Pillow and saves the
+result as PNG, so stitching adds no loss to the pixels the server sent,
+as encoding them again as JPEG would. It works on paths only, so it can
+also run in a worker process.
+
+Pillow is an optional dependency (``pip install antenati[images]``):
+this module is only imported when tiling is enabled.
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+from collections.abc import Sequence
+from concurrent.futures import Executor
+from os import replace
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError as exc:  # pragma: no cover - depends on the environment
+    raise ImportError('Downloading images by tiles requires Pillow: pip install "antenati[images]"') from exc
+
+from requests import Session
+
+from antenati import http, iiif
+from antenati.ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# The extension of stitched images: PNG is lossless.
+STITCHED_EXTENSION: str = '.png'
+
+Region = tuple[int, int, int, int]
+
+
+def tiles_dir(dirname: Path, stem: str) -> Path:
+    """Return the hidden directory the tiles of an image are kept in until stitched."""
+    return dirname / f'.{stem}.tiles'
+
+
+def _tile_path(directory: Path, region: Region) -> Path:
+    return directory / '_'.join(map(str, region))
+
+
+def fetch_tiles(
+    session: Session,
+    image_url: str,
+    regions: Sequence[Region],
+    directory: Path,
+    executor: Executor,
+    chunk_size: int = http.DEFAULT_CHUNK_SIZE,
+    limiter: RateLimiter | None = None,
+) -> int:
+    """Fetch the ``regions`` of ``image_url`` missing from ``directory``, in parallel on ``executor``.
+
+    Returns the bytes received. Every tile is waited for, so the tiles
+    that succeed are kept when others fail; the first error is then
+    raised.
+    """
+    directory.mkdir(exist_ok=True)
+    missing = [region for region in regions if not _tile_path(directory, region).exists()]
+    if len(missing) < len(regions):
+        logger.debug('%s: %d of %d tiles already fetched', image_url, len(regions) - len(missing), len(regions))
+    futures = [executor.submit(_fetch_tile, session, image_url, region, directory, chunk_size, limiter) for region in missing]
+    received = 0
+    error: BaseException | None = None
+    for future in futures:
+        try:
+            received += future.result()
+        except Exception as ex:  # re-raised below, once the other tiles are done
+            error = error or ex
+    if error is not None:
+        raise error
+    return received
+
+
+def _fetch_tile(session: Session, image_url: str, region: Region, directory: Path, chunk_size: int, limiter: RateLimiter | None) -> int:
+    tile = _tile_path(directory, region)
+    part = tile.with_name(f'{tile.name}.part')
+    transfer = http.fetch_to_part(session, iiif.region_url(image_url, region), part, chunk_size, limiter)
+    replace(part, tile)
+    return transfer.received
+
+
+def stitch(directory: Path, regions: Sequence[Region], width: int, height: int, out: Path) -> None:
+    """Paste the tiles of ``regions`` from ``directory`` into a ``width`` x ``height`` PNG at ``out``.
+
+    Raises RuntimeError when a tile does not have the size of its region.
+    """
+    image: Image.Image | None = None
+    try:
+        for region in regions:
+            x, y, w, h = region
+            with Image.open(_tile_path(directory, region)) as tile:
+                if tile.size != (w, h):
+                    raise RuntimeError(f'Tile {x},{y},{w},{h} is {tile.size[0]}x{tile.size[1]} pixels')
+                if image is None:
+                    image = Image.new(tile.mode, (width, height))
+                image.paste(tile, (x, y))
+        if image is None:
+            raise RuntimeError('No tiles to stitch')
+        image.save(out, 'PNG')
+    finally:
+        if image is not None:
+            image.close()
+
+
+def discard(directory: Path) -> None:
+    """Remove the tiles of an image, once stitched or when they are stale."""
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: 2018 Giovanni Cerretani
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Integrity checks for galleries saved by :class:`antenati.Downloader`.
+
+Each file of a gallery directory is checked against the sidecar index
+written at download time (see :class:`antenati.storage.GalleryIndex`):
+
+- the JPEG SOI/EOI markers must be in place;
+- the size must match both the recorded size and the ``Content-Length``
+  the server announced;
+- unless ``quick`` is set, the SHA-256 of the file must match the one
+  computed while the body was streamed.
+
+Files are checked in a process pool, so hashing a large archive uses all
+the cores of the machine. Files saved by older versions, which have no
+index entry, can only be checked for their markers. Bad files can then
+be handed to :func:`requeue`, which removes them so that the next
+``--resume`` run downloads exactly those canvases again.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from os import walk
+from pathlib import Path
+
+from antenati import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_N_PROCESSES: int | None = None  # one per CPU, as ProcessPoolExecutor
+
+# Files handed to each worker process at a time: large enough to amortise
+# the inter-process round-trip over many small files.
+_CHUNKSIZE: int = 64
+
+
+@dataclass
+class VerifyReport:
+    """Outcome of :func:`verify_galleries` for a single gallery directory."""
+
+    dirname: Path
+    checked: int = 0
+    bad: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.bad
+
+
+def find_galleries(root: Path) -> Iterator[Path]:
+    """Yield ``root`` and its sub-directories that hold a sidecar index.
+
+    ``root`` itself is always yielded when it has no gallery below it, so
+    a directory saved by an older version can still be checked directly.
+    """
+    found = False
+    for dirpath, _dirnames, filenames in walk(root):
+        if storage.INDEX_FILENAME in filenames:
+            found = True
+            yield Path(dirpath)
+    if not found:
+        yield root
+
+
+def check_file(filename: Path, entry: storage.IndexEntry | None, quick: bool = False) -> str | None:
+    """Return why ``filename`` is damaged, or None when it looks fine."""
+    if not storage.is_complete(filename):
+        return 'missing, empty or truncated image'
+    if entry is None:
+        return None
+    size = filename.stat().st_size
+    if size != entry.size:
+        return f'size is {size} bytes, {entry.size} recorded'
+    if entry.content_length is not None and size != entry.content_length:
+        return f'size is {size} bytes, server announced {entry.content_length}'
+    if not quick and storage.hash_file(filename).hexdigest() != entry.sha256:
+        return 'SHA-256 mismatch'
+    return None
+
+
+def _check_task(task: tuple[Path, storage.IndexEntry | None, bool]) -> str | None:
+    return check_file(*task)
+
+
+def _gallery_tasks(dirname: Path, quick: bool) -> Iterator[tuple[Path, storage.IndexEntry | None, bool]]:
+    recorded = storage.GalleryIndex(dirname).load()
+    on_disk = {p.name: p for p in storage.scan_dir(dirname).values()}
+    for name in sorted(on_disk.keys() | recorded.keys()):
+        yield dirname / name, recorded.get(name), quick
+
+
+def verify_galleries(dirnames: Iterable[Path], n_processes: int | None = DEFAULT_N_PROCESSES, quick: bool = False) -> list[VerifyReport]:
+    """Check every file of ``dirnames`` in a process pool.
+
+    ``quick`` skips hashing: the check is then a directory listing plus an
+    index lookup per file, with no image read beyond its two markers.
+    """
+    reports = [VerifyReport(Path(d)) for d in dirnames]
+    tasks = [(report, task) for report in reports for task in _gallery_tasks(report.dirname, quick)]
+    with ProcessPoolExecutor(max_workers=n_processes) as executor:
+        outcomes = executor.map(_check_task, (task for _, task in tasks), chunksize=_CHUNKSIZE)
+        for (report, (filename, _entry, _quick)), reason in zip(tasks, outcomes, strict=True):
+            report.checked += 1
+            if reason is not None:
+                logger.warning('%s: %s', filename, reason)
+                report.bad[filename.name] = reason
+    return reports
+
+
+def requeue(report: VerifyReport) -> None:
+    """Remove the bad files of ``report`` so a resumed run fetches them again."""
+    for name in report.bad:
+        (report.dirname / name).unlink(missing_ok=True)
+    storage.GalleryIndex(report.dirname).discard(set(report.bad))
+    logger.info('Re-queued %d files in %s', len(report.bad), report.dirname)
@@ -9,7 +9,9 @@ orchestration of :class:`antenati.Downloader` entirely offline.
 from __future__ import annotations
 
 import json
+from collections.abc import Callable
 from pathlib import Path
+from typing import Any
 
 import pytest
 import responses as responses_module
@@ -30,6 +32,10 @@ MANIFEST_URL = 'https://iiif.example.org/ark/12657/iiif-19944535/manifest'
 # Tests don't decode the downloaded payload; any byte sequence is fine.
 TINY_JPEG = b'\xff\xd8\xff\xd9'  # SOI + EOI (smallest "valid" JPEG)
 
+# What the ``make_downloader`` fixture returns: manifest URL and
+# Downloader options in, Downloader ready to run out.
+MakeDownloader = Callable[..., antenati.Downloader]
+
 
 @pytest.fixture
 def gallery_html() -> str:
@@ -76,3 +82,23 @@ def mocked_http(gallery_html: str, manifest_text: str):
 def downloader(mocked_http) -> antenati.Downloader:
     """Build a Downloader against the mocked gallery+manifest."""
     return antenati.Downloader(GALLERY_URL, first=0, last=None)
+
+
+@pytest.fixture
+def null_progress() -> antenati.ProgressBar:
+    """A progress bar that ignores the progress."""
+    return antenati.ProgressBar(set_total=lambda _t: None, update=lambda: None)
+
+
+@pytest.fixture
+def make_downloader(tmp_path: Path) -> MakeDownloader:
+    """Return a factory of Downloaders of a whole gallery, e.g. of a ``StandInServer``, writing into ``tmp_path``."""
+
+    def make(
+        manifest_url: str, first: int = 0, last: int | None = None, parentdir: Path | None = None, resume: bool = False, **kwargs: Any
+    ) -> antenati.Downloader:
+        dl = antenati.Downloader(manifest_url, first, last, **kwargs)
+        dl.check_dir(parentdir=str(parentdir or tmp_path), interactive=False, resume=resume)
+        return dl
+
+    return make
@@ -0,0 +1,223 @@
+"""A local stand-in for the Portale Antenati IIIF servers.
+
+``responses`` mocks the :mod:`requests` transport only, so anything that
+needs real sockets (the asyncio engine, connection pooling, benchmarks)
+talks to this threaded HTTP/1.1 server instead. It serves a synthetic
+manifest with ``n_images`` canvases and their JPEG-shaped images and
+``info.json`` (with the sizes ready at 1/2, 1/4 and 1/8), honours
+``Range`` requests, can inject failing statuses and latency, and counts
+the requests it sees. Subclasses serve regions of the images by
+overriding :meth:`StandInServer.region`.
+
+Also used by the scripts under ``benchmarks/``.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from re import fullmatch
+from types import TracebackType
+
+ARCHIVE_ID = 19944535
+ARCHIVE_PATH = f'/ark/12657/iiif-{ARCHIVE_ID}'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 makes bursts of concurrent connects wait
+    # for SYN retransmits, which would skew the concurrency tests.
+    request_queue_size = 256
+
+
+def _archive_path(gallery: int) -> str:
+    return f'/ark/12657/iiif-{ARCHIVE_ID + gallery}'
+
+
+def image_payload(index: int, size: int) -> bytes:
+    """Return the deterministic JPEG-shaped body of image ``index``."""
+    pattern = bytes((index + i) % 251 for i in range(251))
+    filler = (pattern * (size // 251 + 1))[: max(size - 4, 0)]
+    return b'\xff\xd8' + filler + b'\xff\xd9'
+
+
+class StandInServer:
+    """Serve a synthetic gallery on ``http://localhost:<port>``.
+
+    ``failures`` maps an image index to the statuses returned by its first
+    requests, before the image is served normally; they carry a
+    ``Retry-After`` header when ``retry_after`` is set. ``log`` records
+    the paths requested, in order. With ``n_galleries`` the server has as
+    many manifests (:attr:`manifest_urls`), of consecutive years and
+    with the same images.
+    """
+
+    def __init__(
+        self,
+        n_images: int = 3,
+        image_size: int = 1024,
+        latency: float = 0.0,
+        failures: dict[int, list[int]] | None = None,
+        retry_after: int | None = None,
+        n_galleries: int = 1,
+    ) -> None:
+        self.n_images = n_images
+        self.n_galleries = n_galleries
+        self.image_size = image_size
+        self.latency = latency
+        self.failures = {k: list(v) for k, v in (failures or {}).items()}
+        self.retry_after = retry_after
+        self.requests: Counter[str] = Counter()
+        self.log: list[str] = []
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._payloads: dict[int, bytes] = {}
+        self._httpd = _Server(('localhost', 0), self._handler_class())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://localhost:{self._httpd.server_address[1]}'
+
+    @property
+    def manifest_url(self) -> str:
+        return f'{self.base_url}{ARCHIVE_PATH}/manifest'
+
+    @property
+    def manifest_urls(self) -> list[str]:
+        return [f'{self.base_url}{_archive_path(g)}/manifest' for g in range(self.n_galleries)]
+
+    def image_url(self, index: int, size_part: str = 'pct:100') -> str:
+        return f'{self.base_url}/iiif/img{index}/full/{size_part}/0/default.jpg'
+
+    def payload(self, index: int) -> bytes:
+        with self._lock:
+            if index not in self._payloads:
+                self._payloads[index] = image_payload(index, self.image_size)
+            return self._payloads[index]
+
+    def manifest(self, gallery: int = 0) -> dict:
+        canvases = [
+            {
+                '@id': f'{self.base_url}{_archive_path(gallery)}/canvas/p{i}',
+                '@type': 'sc:Canvas',
+                'label': f'{i:04d}',
+                'width': 2000,
+                'height': 3000,
+                'images': [{'resource': {'@id': f'{self.base_url}/iiif/img{i}/full/full/0/default.jpg', 'format': 'image/jpeg'}}],
+            }
+            for i in range(1, self.n_images + 1)
+        ]
+        return {
+            '@id': self.manifest_urls[gallery],
+            'label': 'Stand-in gallery',
+            'metadata': [
+                {'label': 'Contesto archivistico', 'value': 'Archivio di Test'},
+                {'label': 'Titolo', 'value': str(1900 + gallery)},
+                {'label': 'Tipologia', 'value': 'Nati'},
+            ],
+            'sequences': [{'canvases': canvases}],
+        }
+
+    def region(self, index: int, region: tuple[int, int, int, int]) -> tuple[bytes, str] | None:
+        """Return the body and content type of a region of image ``index``; None (a 404) unless overridden."""
+        return None
+
+    def info_json(self, index: int) -> dict:
+        return {
+            '@context': 'http://iiif.io/api/image/2/context.json',
+            '@id': f'{self.base_url}/iiif/img{index}',
+            'width': 2000,
+            'height': 3000,
+            'sizes': [{'width': 250, 'height': 375}, {'width': 500, 'height': 750}, {'width': 1000, 'height': 1500}],
+            'tiles': [{'width': 512, 'scaleFactors': [1, 2, 4, 8]}],
+        }
+
+    def __enter__(self) -> StandInServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in two writes: without TCP_NODELAY the
+            # body waits for the delayed ACK of the headers on keep-alive.
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.requests[self.path] += 1
+                    server.log.append(self.path)
+                    server._in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server._in_flight)
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    self._serve()
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+
+            def _serve(self) -> None:
+                manifest_match = fullmatch(r'/ark/12657/iiif-(\d+)/manifest', self.path)
+                if manifest_match and 0 <= (gallery := int(manifest_match.group(1)) - ARCHIVE_ID) < server.n_galleries:
+                    self._reply(200, json.dumps(server.manifest(gallery)).encode(), 'application/json; charset=utf-8')
+                    return
+                info_match = fullmatch(r'/iiif/img(\d+)/info\.json', self.path)
+                if info_match and 1 <= (index := int(info_match.group(1))) <= server.n_images:
+                    self._reply(200, json.dumps(server.info_json(index)).encode(), 'application/json', {'ETag': f'"info{index}"'})
+                    return
+                match = fullmatch(r'/iiif/img(\d+)/(full|(\d+),(\d+),(\d+),(\d+))/[^/]+/0/default\.jpg', self.path)
+                if not match or not 1 <= int(match.group(1)) <= server.n_images:
+                    self._reply(404, b'not found', 'text/plain')
+                    return
+                index = int(match.group(1))
+                region = None
+                if match.group(2) != 'full':
+                    x, y, w, h = (int(match.group(i)) for i in range(3, 7))
+                    region = server.region(index, (x, y, w, h))
+                    if region is None:
+                        self._reply(404, b'not found', 'text/plain')
+                        return
+                with server._lock:
+                    pending = server.failures.get(index)
+                    status = pending.pop(0) if pending else None
+                if status is not None:
+                    headers = {'Retry-After': str(server.retry_after)} if server.retry_after is not None else None
+                    self._reply(status, b'failure', 'text/plain', headers)
+                    return
+                body, content_type = region if region is not None else (server.payload(index), 'image/jpeg')
+                range_match = fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                if range_match:
+                    start = int(range_match.group(1))
+                    if start >= len(body):
+                        self._reply(416, b'', 'text/plain', {'Content-Range': f'bytes */{len(body)}'})
+                        return
+                    content_range = f'bytes {start}-{len(body) - 1}/{len(body)}'
+                    self._reply(206, body[start:], content_type, {'Content-Range': content_range})
+                    return
+                self._reply(200, body, content_type)
+
+            def _reply(self, status: int, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,103 @@
+"""Tests for writing galleries into a ZIP/CBZ archive."""
+
+from __future__ import annotations
+
+import multiprocessing
+import time
+from pathlib import Path
+from zipfile import ZIP_STORED, BadZipFile, ZipFile
+
+import pytest
+
+from antenati import Downloader, ProgressBar
+from antenati.archive import GalleryArchive
+from antenati.journal import Journal
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+def _download_journaled(url: str, parentdir: Path) -> None:
+    """Download the gallery at ``url`` into a ZIP, with a journal: the run the tests kill."""
+    with Journal(parentdir / 'job.sqlite3', flush_every=1) as journal:
+        dl = Downloader(url, first=0, last=None, archive='zip', journal=journal)
+        dl.check_dir(parentdir=str(parentdir), interactive=False, resume=True)
+        dl.run(n_workers=1, size=0, progress=ProgressBar(lambda _t: None, lambda: None), resume=True)
+
+
+def test_central_directory_is_in_canvas_order(tmp_path: Path) -> None:
+    for name in ('0003', '0001', '0002'):
+        (tmp_path / name).write_bytes(name.encode())
+    with GalleryArchive(tmp_path / 'g.cbz', {'0001': 0, '0002': 1, '0003': 2}) as archive:
+        for name in ('0003', '0001', '0002'):
+            archive.add(f'{name}.jpg', tmp_path / name)
+    with ZipFile(tmp_path / 'g.cbz') as zf:
+        assert zf.namelist() == ['0001.jpg', '0002.jpg', '0003.jpg']
+        assert zf.read('0003.jpg') == b'0003'
+    assert not (tmp_path / '0003').exists()
+
+
+def test_gallery_into_archive(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=5) as server:
+        dl = make_downloader(server.manifest_url, archive='cbz')
+        dl.run(n_workers=3, size=0, progress=null_progress)
+    assert dl.archive_path is not None and dl.archive_path.name == f'{dl.dirname.name}.cbz'
+    assert sorted(p.name for p in dl.dirname.iterdir()) == [dl.archive_path.name]
+    with ZipFile(dl.archive_path) as zf:
+        assert zf.namelist() == [f'{i:04}.jpg' for i in range(1, 6)]
+        assert all(info.compress_type == ZIP_STORED for info in zf.infolist())
+        assert zf.read('0004.jpg') == server.payload(4)
+
+
+def test_resume_appends_missing_images(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=4) as server:
+        first = make_downloader(server.manifest_url, first=2, archive='zip')
+        first.run(n_workers=2, size=0, progress=null_progress)
+        dl = make_downloader(server.manifest_url, archive='zip', resume=True)
+        dl.run(n_workers=2, size=0, progress=null_progress, resume=True)
+    assert server.requests[server.image_url(3).removeprefix(server.base_url)] == 1
+    assert dl.archive_path is not None
+    with ZipFile(dl.archive_path) as zf:
+        assert zf.namelist() == [f'{i:04}.jpg' for i in range(1, 5)]
+        assert zf.testzip() is None
+
+
+def test_killed_run_is_recovered(tmp_path: Path, caplog: pytest.LogCaptureFixture) -> None:
+    with StandInServer(n_images=12, latency=0.1) as server:
+        run = multiprocessing.get_context('spawn').Process(target=_download_journaled, args=(server.manifest_url, tmp_path))
+        run.start()
+        deadline = time.monotonic() + 60
+        archives: list[Path] = []
+        while time.monotonic() < deadline and not any(path.stat().st_size > 4 * server.image_size for path in archives):
+            time.sleep(0.02)
+            archives = list(tmp_path.rglob('*.zip'))
+        run.kill()
+        run.join()
+        assert len(archives) == 1
+        with pytest.raises(BadZipFile):
+            ZipFile(archives[0])
+        _download_journaled(server.manifest_url, tmp_path)
+    with ZipFile(archives[0]) as zf:
+        assert zf.namelist() == [f'{i:04}.jpg' for i in range(1, 13)]
+        assert zf.testzip() is None
+        assert zf.read('0012.jpg') == server.payload(12)
+    assert any('was not closed' in record.message for record in caplog.records)
+
+
+def test_recovery_drops_the_damaged_entries(tmp_path: Path) -> None:
+    for name in ('0001', '0002', '0003'):
+        (tmp_path / name).write_bytes(name.encode() * 100)
+    archive = GalleryArchive(tmp_path / 'g.zip', {'0001': 0, '0002': 1, '0003': 2})
+    for name in ('0001', '0002', '0003'):
+        archive.add(f'{name}.jpg', tmp_path / name)
+    archive.close()
+    data = bytearray((tmp_path / 'g.zip').read_bytes())
+    # The third entry cut short and the second one corrupted, with no central directory.
+    third = data.index(b'PK\x03\x04', data.index(b'0002.jpg'))
+    del data[third + 100 :]
+    data[data.index(b'0002.jpg') + 50] ^= 0xFF
+    (tmp_path / 'g.zip').write_bytes(data)
+    with GalleryArchive(tmp_path / 'g.zip', {'0001': 0, '0002': 1, '0003': 2}, append=True) as archive:
+        assert archive.stems() == {'0001'}
+    with ZipFile(tmp_path / 'g.zip') as zf:
+        assert zf.namelist() == ['0001.jpg']
+        assert zf.read('0001.jpg') == b'0001' * 100
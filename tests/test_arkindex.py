@@ -0,0 +1,62 @@
+"""Tests for the index of manifest URLs by ark ID and archive ID."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+import responses
+
+import antenati
+from antenati.arkindex import ArkIndex
+from tests.conftest import GALLERY_URL, MANIFEST_URL
+
+
+def test_lookup_by_ark_id_then_archive_id(tmp_path: Path) -> None:
+    index = ArkIndex(tmp_path / 'index')
+    index.record('https://example.org/a/manifest', ark_id='an_ua1')
+    index.record('https://example.org/b/manifest', archive_id='22')
+    assert index.lookup('https://antenati.cultura.gov.it/ark:/12657/an_ua1/x7') == 'https://example.org/a/manifest'
+    assert index.lookup('https://antenati.cultura.gov.it/ark:/12657/an_ud22/gallery') == 'https://example.org/b/manifest'
+    assert index.lookup('https://antenati.cultura.gov.it/ark:/12657/an_ua3/gallery') is None
+
+
+def test_forget_drops_all_keys(tmp_path: Path) -> None:
+    index = ArkIndex(tmp_path / 'index')
+    index.record('https://example.org/manifest', ark_id='an_ua1', archive_id='1')
+    index.forget('https://example.org/manifest')
+    assert index.lookup('https://antenati.cultura.gov.it/ark:/12657/an_ua1/gallery') is None
+
+
+def test_import_csv(tmp_path: Path) -> None:
+    csv_file = tmp_path / 'arks.csv'
+    csv_file.write_text('ark_id,archive_id,manifest_url,note\nan_ua1,1,https://example.org/1/manifest,x\n,2,https://example.org/2/manifest,\nan_ua3,,,\n')
+    index = ArkIndex(tmp_path / 'index')
+    assert index.import_csv(csv_file) == 3
+    assert index.lookup('https://antenati.cultura.gov.it/ark:/12657/an_ud2/gallery') == 'https://example.org/2/manifest'
+
+
+def test_import_csv_requires_columns(tmp_path: Path) -> None:
+    csv_file = tmp_path / 'arks.csv'
+    csv_file.write_text('ark_id,url\nan_ua1,https://example.org/1/manifest\n')
+    with pytest.raises(ValueError, match='manifest_url'):
+        ArkIndex(tmp_path / 'index').import_csv(csv_file)
+
+
+def test_downloader_skips_gallery_page_of_indexed_gallery(tmp_path: Path, gallery_html: str, manifest_text: str) -> None:
+    index = ArkIndex(tmp_path / 'index')
+    with responses.RequestsMock() as rsps:
+        gallery = rsps.add(responses.GET, GALLERY_URL, body=gallery_html, status=200, content_type='text/html; charset=utf-8')
+        rsps.add(responses.GET, MANIFEST_URL, body=manifest_text, status=200, content_type='application/json')
+        antenati.Downloader(GALLERY_URL, first=0, last=None, index=index)
+        antenati.Downloader(GALLERY_URL, first=0, last=None, index=index)
+    assert gallery.call_count == 1
+
+
+def test_downloader_falls_back_to_gallery_page_on_stale_entry(tmp_path: Path, mocked_http: responses.RequestsMock) -> None:
+    index = ArkIndex(tmp_path / 'index')
+    index.record('https://iiif.example.org/gone/manifest', ark_id='an_ua19944535')
+    mocked_http.add(responses.GET, 'https://iiif.example.org/gone/manifest', status=404)
+    dl = antenati.Downloader(GALLERY_URL, first=0, last=None, index=index)
+    assert dl.manifest_url == MANIFEST_URL
+    assert index.lookup(GALLERY_URL) == MANIFEST_URL
@@ -0,0 +1,103 @@
+"""Tests for the asyncio engine, ``Downloader.run_async``.
+
+They run against the local stand-in server in ``tests/fixtures/server.py``
+because ``responses`` only mocks the :mod:`requests` transport.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from antenati import ProgressBar, storage
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+pytest.importorskip('aiohttp')
+
+
+def test_run_async_downloads_all_images(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=5, image_size=5000) as server:
+        dl = make_downloader(server.manifest_url, chunk_size=1000)
+        total = asyncio.run(dl.run_async(n_workers=3, size=0, progress=null_progress))
+    assert total == 5 * 5000
+    for i in range(1, 6):
+        assert (dl.dirname / f'{i:04d}.jpg').read_bytes() == server.payload(i)
+    recorded = storage.GalleryIndex(dl.dirname).load()
+    assert recorded['0003.jpg'].sha256 == storage.hash_file(dl.dirname / '0003.jpg').hexdigest()
+
+
+def test_run_async_keeps_n_workers_requests_in_flight(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=8, image_size=100, latency=0.2) as server:
+        dl = make_downloader(server.manifest_url)
+        start = time.monotonic()
+        asyncio.run(dl.run_async(n_workers=8, size=0, progress=null_progress))
+        elapsed = time.monotonic() - start
+    assert server.max_in_flight == 8
+    assert elapsed < 8 * 0.2
+
+
+def test_run_async_progress_callbacks_are_invoked(make_downloader: MakeDownloader) -> None:
+    set_total_calls: list[int] = []
+    updates = [0]
+
+    def _update() -> None:
+        updates[0] += 1
+
+    with StandInServer(n_images=4) as server:
+        dl = make_downloader(server.manifest_url)
+        asyncio.run(dl.run_async(n_workers=2, size=0, progress=ProgressBar(set_total_calls.append, _update)))
+    assert set_total_calls == [4]
+    assert updates[0] == 4
+
+
+def test_run_async_retries_transient_statuses(monkeypatch: pytest.MonkeyPatch, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.0)
+    with StandInServer(n_images=2, failures={2: [503, 429]}) as server:
+        dl = make_downloader(server.manifest_url)
+        asyncio.run(dl.run_async(n_workers=2, size=0, progress=null_progress))
+    assert server.requests['/iiif/img2/full/pct:100/0/default.jpg'] == 3
+    assert (dl.dirname / '0002.jpg').read_bytes() == server.payload(2)
+
+
+def test_run_async_aggregates_failures(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=3, failures={2: [404]}) as server:
+        dl = make_downloader(server.manifest_url)
+        with pytest.raises(RuntimeError, match=r'Failed to download 1 image'):
+            asyncio.run(dl.run_async(n_workers=2, size=0, progress=null_progress))
+    assert (dl.dirname / '0001.jpg').exists()
+    assert (dl.dirname / '0003.jpg').exists()
+
+
+def test_run_async_honours_preset_cancel_event(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    cancel = threading.Event()
+    cancel.set()
+    with StandInServer(n_images=3) as server:
+        dl = make_downloader(server.manifest_url)
+        total = asyncio.run(dl.run_async(n_workers=2, size=0, progress=null_progress, cancel=cancel))
+    assert total == 0
+    assert not any(p.startswith('/iiif/') for p in server.requests)
+
+
+def test_run_async_resume_continues_part_file(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=1, image_size=3000) as server:
+        dl = make_downloader(server.manifest_url)
+        (dl.dirname / '0001.part').write_bytes(server.payload(1)[:1000])
+        total = asyncio.run(dl.run_async(n_workers=1, size=0, progress=null_progress, resume=True))
+    assert total == 2000
+    assert (dl.dirname / '0001.jpg').read_bytes() == server.payload(1)
+
+
+def test_threads_and_async_engines_write_identical_galleries(tmp_path: Path, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=3, image_size=2000) as server:
+        (tmp_path / 'threads').mkdir()
+        (tmp_path / 'async').mkdir()
+        threaded = make_downloader(server.manifest_url, parentdir=tmp_path / 'threads')
+        threaded.run(n_workers=2, size=0, progress=null_progress)
+        asynced = make_downloader(server.manifest_url, parentdir=tmp_path / 'async')
+        asyncio.run(asynced.run_async(n_workers=2, size=0, progress=null_progress))
+    assert storage.GalleryIndex(threaded.dirname).load() == storage.GalleryIndex(asynced.dirname).load()
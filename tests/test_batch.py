@@ -0,0 +1,121 @@
+"""Tests for downloading many galleries through one worker pool."""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from antenati import Downloader, ProgressBar
+from antenati.batch import Batch, GalleryReport, read_batch_file
+from tests.fixtures.server import StandInServer
+
+
+class _Progress:
+    def __init__(self) -> None:
+        self.total = 0
+        self.done = 0
+
+    def bar(self) -> ProgressBar:
+        return ProgressBar(self._set_total, self._update)
+
+    def _set_total(self, total: int) -> None:
+        self.total = total
+
+    def _update(self) -> None:
+        self.done += 1
+
+
+def test_read_batch_file_skips_blanks_and_comments(tmp_path: Path) -> None:
+    batch_file = tmp_path / 'batch.txt'
+    batch_file.write_text('# registers of 1900\nhttps://example.org/a/manifest\n\n  https://example.org/b/manifest  \n')
+    assert read_batch_file(batch_file) == ['https://example.org/a/manifest', 'https://example.org/b/manifest']
+
+
+def test_batch_downloads_every_gallery(tmp_path: Path) -> None:
+    progress = _Progress()
+    finished: list[GalleryReport] = []
+    with StandInServer(n_images=4, n_galleries=3) as server:
+        batch = Batch(server.manifest_urls, parentdir=str(tmp_path))
+        total = batch.run(n_workers=4, size=0, progress=progress.bar(), on_gallery=finished.append)
+    assert total == 3 * 4 * server.image_size
+    assert sorted(r.url for r in finished) == server.manifest_urls
+    assert all(r.ok and r.done == r.total == 4 for r in batch.reports)
+    for report in batch.reports:
+        assert report.dirname is not None
+        assert (report.dirname / '0004.jpg').read_bytes() == server.payload(4)
+    assert (progress.total, progress.done) == (12, 12)
+    # One session: the connections of the workers and of the manifest
+    # loader outlive the galleries.
+    assert batch.connection_stats.connections <= 5
+
+
+def test_next_manifest_loads_before_the_pool_drains(tmp_path: Path) -> None:
+    with StandInServer(n_images=4, n_galleries=2, latency=0.05) as server:
+        Batch(server.manifest_urls, parentdir=str(tmp_path)).run(n_workers=2, size=0, progress=_Progress().bar())
+    # The second manifest was fetched while both workers were busy.
+    assert server.max_in_flight == 3
+
+
+def test_failed_gallery_does_not_stop_the_batch(tmp_path: Path) -> None:
+    with StandInServer(n_images=2, n_galleries=1, failures={2: [404]}) as server:
+        urls = [f'{server.base_url}/ark/12657/iiif-1/manifest', *server.manifest_urls]
+        batch = Batch(urls, parentdir=str(tmp_path))
+        total = batch.run(n_workers=2, size=0, progress=_Progress().bar())
+    missing, partial = batch.reports
+    assert missing.finished and missing.error is not None and '404' in missing.error
+    assert partial.finished and partial.error is not None and 'Failed to download 1 image' in partial.error
+    assert total == server.image_size
+
+
+def test_closing_a_gallery_does_not_hold_up_the_next(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    progress = _Progress()
+    next_done = threading.Event()
+    waited: list[bool] = []
+
+    def update() -> None:
+        progress.done += 1
+        if progress.done == 8:
+            next_done.set()
+
+    def write_pdf(self: Downloader) -> Path:
+        # The PDF of the first gallery is only done once the second one is downloaded.
+        if not waited:
+            waited.append(next_done.wait(timeout=5))
+        return self.pdf_path
+
+    monkeypatch.setattr(Downloader, 'write_pdf', write_pdf)
+    with StandInServer(n_images=4, n_galleries=2) as server:
+        batch = Batch(server.manifest_urls, parentdir=str(tmp_path), pdf=True)
+        batch.run(n_workers=1, size=0, progress=ProgressBar(progress._set_total, update))
+    assert waited == [True]
+    assert all(r.ok and r.finished for r in batch.reports)
+
+
+def test_galleries_start_on_the_loader_thread(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # With probe_sizes, starting a gallery reads info.json files: not on the thread feeding the workers.
+    threads: list[threading.Thread] = []
+    start = Downloader.start
+
+    def record(self: Downloader, *args: Any) -> list[Any]:
+        threads.append(threading.current_thread())
+        return start(self, *args)
+
+    monkeypatch.setattr(Downloader, 'start', record)
+    progress = _Progress()
+    with StandInServer(n_images=2, n_galleries=2) as server:
+        batch = Batch(server.manifest_urls, parentdir=str(tmp_path), probe_sizes=True)
+        batch.run(n_workers=2, size=0, progress=progress.bar())
+    assert len(threads) == 2 and threading.current_thread() not in threads
+    assert all(r.ok and r.done == r.total == 2 for r in batch.reports)
+    assert (progress.total, progress.done) == (4, 4)
+
+
+def test_cancel_stops_the_batch(tmp_path: Path) -> None:
+    cancel = threading.Event()
+    with StandInServer(n_images=2, n_galleries=3) as server:
+        batch = Batch(server.manifest_urls, parentdir=str(tmp_path))
+        batch.run(n_workers=2, size=0, progress=_Progress().bar(), on_gallery=lambda _r: cancel.set(), cancel=cancel)
+    assert [r.finished for r in batch.reports] == [True, False, False]
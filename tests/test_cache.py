@@ -0,0 +1,82 @@
+"""Tests for the on-disk cache of gallery pages and manifests."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+import responses
+
+import antenati
+from antenati import http as antenati_http
+from antenati import paths
+from antenati.cache import CACHE_SUBDIR, CacheEntry, ResponseCache
+from tests.conftest import GALLERY_URL, MANIFEST_URL
+
+URL = 'https://example.org/manifest'
+
+
+def _entry(url: str, content: bytes = b'{}', etag: str | None = '"v1"') -> CacheEntry:
+    return CacheEntry(url, 'application/json', etag, None, content)
+
+
+def test_put_and_get_roundtrip(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path)
+    entry = _entry(URL, b'{"a": 1}')
+    cache.put(entry)
+    assert cache.get(URL) == entry
+    assert cache.get('https://example.org/other') is None
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path, max_bytes=2500)
+    cache.put(_entry('a', b'x' * 1000))
+    cache.put(_entry('b', b'x' * 1000))
+    for record in tmp_path.glob('*.json'):
+        os.utime(record, (0, 0))
+    # A hit on 'a' makes 'b' the least recently used.
+    assert cache.get('a') is not None
+    cache.put(_entry('c', b'x' * 1000))
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+
+def test_cache_defaults_to_user_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(paths.CACHE_DIR_ENV, str(tmp_path))
+    assert ResponseCache().path == tmp_path / CACHE_SUBDIR
+
+
+def test_fetch_document_revalidates_cached_copy(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path)
+    session = antenati_http.build_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, URL, body='{"v": 1}', status=200, content_type='application/json', headers={'ETag': '"v1"'})
+        first = antenati_http.fetch_document(session, URL, cache)
+        rsps.replace(responses.GET, URL, status=304, match=[responses.matchers.header_matcher({'If-None-Match': '"v1"'})])
+        second = antenati_http.fetch_document(session, URL, cache)
+    assert not first.from_cache
+    assert second.from_cache
+    assert second.text == '{"v": 1}'
+
+
+def test_fetch_document_does_not_store_replies_without_validators(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path)
+    session = antenati_http.build_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, URL, body='{}', status=200, content_type='application/json')
+        antenati_http.fetch_document(session, URL, cache)
+    assert cache.get(URL) is None
+
+
+def test_downloader_reuses_unchanged_manifest(tmp_path: Path, gallery_html: str, manifest_text: str) -> None:
+    cache = ResponseCache(tmp_path)
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, GALLERY_URL, body=gallery_html, status=200, content_type='text/html; charset=utf-8')
+        rsps.add(responses.GET, MANIFEST_URL, body=manifest_text, status=200, content_type='application/json', headers={'ETag': '"m"'})
+        first = antenati.Downloader(GALLERY_URL, first=0, last=None, cache=cache)
+        rsps.replace(responses.GET, MANIFEST_URL, status=304)
+        second = antenati.Downloader(GALLERY_URL, first=0, last=None, cache=cache)
+    assert second.manifest == first.manifest
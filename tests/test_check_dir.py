@@ -26,3 +26,10 @@ def test_check_dir_without_parent_uses_cwd(downloader: Downloader, tmp_path: Pat
     monkeypatch.chdir(tmp_path)
     downloader.check_dir(interactive=False)
     assert (tmp_path / downloader.dirname).is_dir()
+
+
+def test_check_dir_resume_accepts_existing_target(downloader: Downloader, tmp_path: Path) -> None:
+    target = tmp_path / str(downloader.dirname)
+    target.mkdir()
+    downloader.check_dir(parentdir=str(tmp_path), interactive=False, resume=True)
+    assert downloader.dirname == target
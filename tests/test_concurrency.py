@@ -0,0 +1,121 @@
+"""Tests for the adaptive concurrency controller and ``Downloader.run(adaptive=True)``."""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import pytest
+
+from antenati import DEFAULT_N_THREADS, ProgressBar, http
+from antenati.concurrency import AimdController
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _complete(controller: AimdController, clock: _Clock, n: int, ttfb: float = 0.1, duration: float = 0.01) -> None:
+    for _ in range(n):
+        clock.now += duration
+        controller.record(ttfb)
+
+
+def test_limit_grows_by_one_per_window_while_server_keeps_up() -> None:
+    clock = _Clock()
+    controller = AimdController(max_limit=6, initial=2, clock=clock)
+    _complete(controller, clock, 2)
+    assert controller.limit == 3
+    _complete(controller, clock, 3)
+    assert controller.limit == 4
+    _complete(controller, clock, 100)
+    assert controller.limit == 6
+
+
+def test_throttling_halves_limit_and_ignores_requests_in_flight() -> None:
+    clock = _Clock()
+    controller = AimdController(max_limit=16, initial=8, clock=clock)
+    controller.record(0.1, throttled=True)
+    assert controller.limit == 4
+    # The other 7 requests were sent at the old limit: even if throttled
+    # too, they do not halve the limit again.
+    for _ in range(7):
+        controller.record(0.1, throttled=True)
+    assert controller.limit == 4
+    controller.record(0.1, throttled=True)
+    assert controller.limit == 2
+
+
+def test_limit_never_drops_below_minimum() -> None:
+    controller = AimdController(max_limit=4, initial=1, clock=_Clock())
+    controller.record(None, throttled=True)
+    assert controller.limit == 1
+
+
+def test_growing_ttfb_halves_limit() -> None:
+    clock = _Clock()
+    controller = AimdController(max_limit=32, initial=8, clock=clock)
+    _complete(controller, clock, 8, ttfb=0.1)
+    assert controller.limit == 9
+    _complete(controller, clock, 9, ttfb=0.5)
+    assert controller.limit == 4
+
+
+def test_limit_holds_when_throughput_drops() -> None:
+    clock = _Clock()
+    controller = AimdController(max_limit=32, initial=4, clock=clock)
+    _complete(controller, clock, 4, duration=0.01)
+    assert controller.limit == 5
+    # Same TTFB, but the window took much longer: more requests did not help.
+    _complete(controller, clock, 5, duration=0.05)
+    assert controller.limit == 5
+
+
+def test_baseline_drifts_towards_a_slower_server() -> None:
+    clock = _Clock()
+    controller = AimdController(max_limit=64, initial=4, clock=clock)
+    _complete(controller, clock, 4, ttfb=0.1)
+    for _ in range(40):
+        _complete(controller, clock, controller.limit, ttfb=0.3)
+    # After backing off, a server that is steadily slower becomes the new
+    # normal and the limit grows again.
+    limit = controller.limit
+    _complete(controller, clock, limit, ttfb=0.3)
+    assert controller.limit == limit + 1
+
+
+def test_invalid_bounds_are_rejected() -> None:
+    with pytest.raises(ValueError, match='concurrency bounds'):
+        AimdController(max_limit=0)
+
+
+def test_fetch_to_part_reports_ttfb_and_retried_statuses(tmp_path: Path) -> None:
+    with StandInServer(failures={1: [503]}, latency=0.05) as server:
+        transfer = http.fetch_to_part(http.build_session(), server.image_url(1), tmp_path / 'img.part')
+    assert transfer.retried == (503,)
+    assert transfer.throttled
+    assert transfer.ttfb is not None
+    assert transfer.ttfb >= 0.05
+
+
+def test_adaptive_run_ramps_up_concurrency(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=60, image_size=100, latency=0.02) as server:
+        dl = make_downloader(server.manifest_url)
+        total = dl.run(n_workers=8, size=0, progress=null_progress, adaptive=True)
+    assert total == 60 * 100
+    assert DEFAULT_N_THREADS < server.max_in_flight <= 8
+
+
+def test_adaptive_run_backs_off_on_throttling(caplog: pytest.LogCaptureFixture, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    failures = {i: [429] for i in range(1, 41)}
+    with StandInServer(n_images=40, image_size=100, failures=failures) as server, caplog.at_level(logging.INFO, logger='antenati.concurrency'):
+        dl = make_downloader(server.manifest_url)
+        dl.run(n_workers=8, size=0, progress=null_progress, adaptive=True)
+    assert any('Concurrency lowered' in r.getMessage() for r in caplog.records)
+    assert len(list(dl.dirname.glob('*.jpg'))) == 40
@@ -0,0 +1,88 @@
+"""Tests for connection pool sizing and the connection reuse statistics.
+
+They run against the local stand-in server in ``tests/fixtures/server.py``
+because ``responses`` replaces the transport adapter, so no connection
+is ever opened under it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from antenati import Downloader, ProgressBar, http
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+def test_build_session_uses_default_pool_size() -> None:
+    adapter = http.build_session().get_adapter('https://example.org/')
+    assert isinstance(adapter, http.PooledAdapter)
+    assert adapter.pool_maxsize == http.DEFAULT_POOL_MAXSIZE
+    assert not adapter.pool_block
+
+
+def test_size_pools_resizes_both_schemes() -> None:
+    session = http.build_session()
+    http.size_pools(session, 32, block=True)
+    for prefix in ('https://example.org/', 'http://example.org/'):
+        adapter = session.get_adapter(prefix)
+        assert isinstance(adapter, http.PooledAdapter)
+        assert adapter.pool_maxsize == 32
+        assert adapter.pool_block
+        assert adapter.poolmanager.connection_pool_kw['maxsize'] == 32
+
+
+def test_connection_stats_counts_requests_and_connections() -> None:
+    stats = http.ConnectionStats()
+    with StandInServer(n_images=3) as server:
+        session = http.build_session(stats)
+        for i in range(1, 4):
+            http.fetch(session, server.image_url(i))
+    assert stats.requests == 3
+    assert stats.connections == 1
+    assert stats.reused == 2
+    assert stats.tls_handshakes == 0
+
+
+def test_connection_stats_describe_reports_handshakes_per_image() -> None:
+    stats = http.ConnectionStats(requests=10, connections=2, tls_handshakes=2)
+    assert stats.describe(10) == '10 requests, 2 new connections, 8 reused, 2 TLS handshakes, 0.20 handshakes per image'
+    assert stats.describe(0).endswith('0.00 handshakes per image')
+
+
+def test_run_keeps_connections_alive_beyond_default_pool_size(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    n_workers = 2 * http.DEFAULT_POOL_MAXSIZE
+    with StandInServer(n_images=4 * n_workers, image_size=100, latency=0.01) as server:
+        dl = make_downloader(server.manifest_url)
+        dl.run(n_workers=n_workers, size=0, progress=null_progress)
+    stats = dl.connection_stats
+    assert stats.requests == 4 * n_workers
+    assert stats.connections <= n_workers
+    assert stats.reused == stats.requests - stats.connections
+
+
+def test_run_caps_connections_per_host(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=12, image_size=100, latency=0.02) as server:
+        dl = make_downloader(server.manifest_url, max_host_connections=2)
+        dl.run(n_workers=6, size=0, progress=null_progress)
+    assert server.max_in_flight <= 2
+    assert dl.connection_stats.connections <= 2
+    assert len(list(dl.dirname.glob('*.jpg'))) == 12
+
+
+def test_run_async_reports_connection_stats(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    pytest.importorskip('aiohttp')
+    with StandInServer(n_images=12, image_size=100, latency=0.01) as server:
+        dl = make_downloader(server.manifest_url, max_host_connections=3)
+        asyncio.run(dl.run_async(n_workers=6, size=0, progress=null_progress))
+    stats = dl.connection_stats
+    assert stats.requests == 12
+    assert 1 <= stats.connections <= 3
+    assert server.max_in_flight <= 3
+
+
+def test_max_host_connections_must_be_positive() -> None:
+    with StandInServer() as server, pytest.raises(ValueError, match='max_host_connections'):
+        Downloader(server.manifest_url, first=0, last=None, max_host_connections=0)
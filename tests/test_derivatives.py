@@ -0,0 +1,42 @@
+"""Tests for making thumbnails and previews of the downloaded images."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+derivatives = pytest.importorskip('antenati.derivatives')
+
+
+def _scan(path: Path, size: tuple[int, int] = (2000, 3000)) -> None:
+    Image.linear_gradient('L').resize(size).convert('RGB').save(path, 'JPEG')
+
+
+def test_each_size_fits_its_box(tmp_path: Path) -> None:
+    image = tmp_path / '0001.jpg'
+    _scan(image)
+    paths = derivatives.make_derivatives(image, [256, 1024, 5000])
+    assert paths == [tmp_path / '5000px/0001.jpg', tmp_path / '1024px/0001.jpg', tmp_path / '256px/0001.jpg']
+    sizes = []
+    for path in paths:
+        with Image.open(path) as derivative:
+            sizes.append(derivative.size)
+    assert sizes == [(2000, 3000), (683, 1024), (171, 256)]
+    assert image.stat().st_size > 0
+    with pytest.raises(ValueError, match='positive'):
+        derivatives.make_derivatives(image, [0])
+
+
+def test_derive_galleries_skips_what_is_done(tmp_path: Path) -> None:
+    for stem in ('0001', '0002'):
+        _scan(tmp_path / f'{stem}.jpg', (300, 400))
+    (tmp_path / 'gallery.pdf').write_bytes(b'%PDF-1.4\n')
+    assert derivatives.derive_galleries([tmp_path], [128], n_processes=1) == (2, {})
+    assert (tmp_path / '128px/0002.jpg').exists()
+    assert derivatives.derive_galleries([tmp_path], [128], n_processes=1) == (0, {})
+    (tmp_path / '0003.jpg').write_bytes(b'not a jpeg')
+    n_images, failed = derivatives.derive_galleries([tmp_path], [128], n_processes=1)
+    assert n_images == 1
+    assert list(failed) == [tmp_path / '0003.jpg']
@@ -14,7 +14,7 @@ import pytest
 import responses
 
 import antenati
-from antenati import Downloader, ProgressBar
+from antenati import Downloader, ProgressBar, storage
 from antenati import cli as antenati_cli
 from tests.conftest import GALLERY_URL, MANIFEST_URL, TINY_JPEG
 
@@ -23,6 +23,11 @@ def _null_progress() -> ProgressBar:
     return ProgressBar(set_total=lambda _t: None, update=lambda: None)
 
 
+def _saved_files(dirname: Path) -> list[str]:
+    """List the gallery directory, leaving out the sidecar index."""
+    return sorted(p.name for p in dirname.iterdir() if p.name != storage.INDEX_FILENAME)
+
+
 def _image_url(canvas_label: str, size: int) -> str:
     """Mirror ``__manipulate_url`` for the IIIF URL each canvas will fetch."""
     base = f'https://iiif.example.org/iiif/img{canvas_label[-1]}'
@@ -47,10 +52,31 @@ def test_run_downloads_all_images_full_size(mocked_http, downloader_in_tmp: Down
         )
     total = downloader_in_tmp.run(n_workers=2, size=0, progress=_null_progress())
     assert total == 3 * len(TINY_JPEG)
-    files = sorted(p.name for p in downloader_in_tmp.dirname.iterdir())
+    files = _saved_files(downloader_in_tmp.dirname)
     assert files == ['0001.jpg', '0002.jpg', '0003.jpg']
 
 
+def test_run_streams_body_in_chunks(mocked_http, tmp_path: Path) -> None:
+    payload = TINY_JPEG[:2] + bytes(1000) + TINY_JPEG[2:]
+    dl = Downloader(GALLERY_URL, first=0, last=1, chunk_size=7)
+    dl.check_dir(parentdir=str(tmp_path), interactive=False)
+    mocked_http.add(
+        responses.GET,
+        _image_url('0001', 0),
+        body=payload,
+        status=200,
+        content_type='image/jpeg',
+    )
+    total = dl.run(n_workers=1, size=0, progress=_null_progress())
+    assert total == len(payload)
+    assert (dl.dirname / '0001.jpg').read_bytes() == payload
+
+
+def test_downloader_rejects_non_positive_chunk_size(mocked_http) -> None:
+    with pytest.raises(ValueError, match='chunk_size'):
+        Downloader(GALLERY_URL, first=0, last=None, chunk_size=0)
+
+
 def test_run_uses_constrained_size_urls(mocked_http, downloader_in_tmp: Downloader) -> None:
     size = 1234
     for label in ('0001', '0002', '0003'):
@@ -65,7 +91,8 @@ def test_run_uses_constrained_size_urls(mocked_http, downloader_in_tmp: Download
     assert total == 3 * len(TINY_JPEG)
 
 
-def test_run_partial_failure_raises_with_summary(mocked_http, downloader_in_tmp: Downloader) -> None:
+def test_run_partial_failure_raises_with_summary(mocked_http, downloader_in_tmp: Downloader, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.0)
     # First image succeeds, second 500s, third succeeds.
     mocked_http.add(
         responses.GET,
@@ -141,7 +168,7 @@ def test_run_with_first_last_range_downloads_subset(mocked_http, tmp_path: Path)
             content_type='image/jpeg',
         )
     dl.run(n_workers=2, size=0, progress=_null_progress())
-    files = sorted(p.name for p in dl.dirname.iterdir())
+    files = _saved_files(dl.dirname)
     assert files == ['0002.jpg', '0003.jpg']
 
 
@@ -209,7 +236,7 @@ def test_run_descriptive_names_embed_ark_and_image_ids(mocked_http, tmp_path: Pa
             content_type='image/jpeg',
         )
     dl.run(n_workers=2, size=0, progress=_null_progress())
-    files = sorted(p.name for p in dl.dirname.iterdir())
+    files = _saved_files(dl.dirname)
     assert files == [
         '0001+an_ua19944535+img1.jpg',
         '0002+an_ua19944535+img2.jpg',
@@ -230,5 +257,58 @@ def test_run_from_manifest_url_downloads_all_images(mocked_http, tmp_path: Path)
         )
     total = dl.run(n_workers=2, size=0, progress=_null_progress())
     assert total == 3 * len(TINY_JPEG)
-    files = sorted(p.name for p in dl.dirname.iterdir())
+    files = _saved_files(dl.dirname)
     assert files == ['0001.jpg', '0002.jpg', '0003.jpg']
+
+
+def test_run_resume_skips_complete_files(mocked_http, downloader_in_tmp: Downloader) -> None:
+    (downloader_in_tmp.dirname / '0001.jpg').write_bytes(TINY_JPEG)
+    (downloader_in_tmp.dirname / '0002.jpg').write_bytes(TINY_JPEG)
+    mocked_http.add(
+        responses.GET,
+        _image_url('0003', 0),
+        body=TINY_JPEG,
+        status=200,
+        content_type='image/jpeg',
+    )
+    update_count = [0]
+
+    def _update() -> None:
+        update_count[0] += 1
+
+    progress = ProgressBar(set_total=lambda _t: None, update=_update)
+    total = downloader_in_tmp.run(n_workers=2, size=0, progress=progress, resume=True)
+    assert total == len(TINY_JPEG)
+    assert update_count[0] == 3
+    image_calls = [c for c in mocked_http.calls if 'default.jpg' in c.request.url]
+    assert [c.request.url for c in image_calls] == [_image_url('0003', 0)]
+
+
+def test_run_resume_refetches_truncated_files(mocked_http, downloader_in_tmp: Downloader) -> None:
+    (downloader_in_tmp.dirname / '0001.jpg').write_bytes(TINY_JPEG)
+    (downloader_in_tmp.dirname / '0002.jpg').write_bytes(TINY_JPEG[:3])
+    (downloader_in_tmp.dirname / '0003.jpg').write_bytes(TINY_JPEG)
+    mocked_http.add(
+        responses.GET,
+        _image_url('0002', 0),
+        body=TINY_JPEG,
+        status=200,
+        content_type='image/jpeg',
+    )
+    total = downloader_in_tmp.run(n_workers=2, size=0, progress=_null_progress(), resume=True)
+    assert total == len(TINY_JPEG)
+    assert (downloader_in_tmp.dirname / '0002.jpg').read_bytes() == TINY_JPEG
+
+
+def test_run_without_resume_downloads_everything_again(mocked_http, downloader_in_tmp: Downloader) -> None:
+    (downloader_in_tmp.dirname / '0001.jpg').write_bytes(TINY_JPEG)
+    for label in ('0001', '0002', '0003'):
+        mocked_http.add(
+            responses.GET,
+            _image_url(label, 0),
+            body=TINY_JPEG,
+            status=200,
+            content_type='image/jpeg',
+        )
+    total = downloader_in_tmp.run(n_workers=2, size=0, progress=_null_progress())
+    assert total == 3 * len(TINY_JPEG)
@@ -15,7 +15,9 @@ from typing import Any
 
 import pytest
 
+from antenati.batch import GalleryReport
 from antenati.downloader import ProgressBar
+from antenati.gui import worker as worker_module
 from antenati.gui.worker import (
     Cancelled,
     Done,
@@ -25,6 +27,7 @@ from antenati.gui.worker import (
     Progress,
     Tick,
 )
+from antenati.processes import ProcessOptions, Unit, shard_units
 
 
 class _FakeDownloader:
@@ -44,11 +47,13 @@ class _FakeDownloader:
         self._raise = raise_in_run
         self._cancel_after = cancel_after
         self.check_dir_called_with: tuple[str, bool] | None = None
+        self.resume: bool | None = None
 
-    def check_dir(self, parent_dir: str, interactive: bool) -> None:
+    def check_dir(self, parent_dir: str, interactive: bool, resume: bool = False) -> None:
         self.check_dir_called_with = (parent_dir, interactive)
 
-    def run(self, n_workers: int, size: int, progress: ProgressBar, cancel=None) -> int:
+    def run(self, n_workers: int, size: int, progress: ProgressBar, cancel=None, resume: bool = False) -> int:
+        self.resume = resume
         if self._raise is not None:
             raise self._raise
         progress.set_total(self._n_canvases)
@@ -107,6 +112,16 @@ def test_check_dir_is_called_with_parent_and_non_interactive() -> None:
     assert fake.check_dir_called_with == ('/tmp/x', False)
 
 
+def test_resume_flag_is_forwarded_to_run() -> None:
+    fake = _FakeDownloader(n_canvases=1)
+    worker = DownloadWorker(factory=lambda url, first, last: fake)
+    params = _params()
+    params.resume = True
+    worker.start(params)
+    _drain_events(worker)
+    assert fake.resume is True
+
+
 def test_constructor_failure_emits_failed_event() -> None:
     def boom(url: str, first: int, last: int | None):
         raise RuntimeError('manifest blew up')
@@ -160,3 +175,61 @@ def test_is_running_flips_around_the_thread_lifetime() -> None:
     worker.start(_params())
     worker.join(timeout=2.0)
     assert worker.is_running() is False
+
+
+class _FakeRunner:
+    """Stand-in for run_processes: records its arguments and reports each shard done."""
+
+    def __init__(self, error: str | None = None) -> None:
+        self.error = error
+        self.units: list[Unit] = []
+        self.options: ProcessOptions | None = None
+
+    def __call__(self, units, n_processes, options, progress, on_gallery=None, cancel=None) -> list[GalleryReport]:
+        self.units, self.options = list(units), options
+        progress.set_total(len(units))
+        for _ in units:
+            progress.update()
+        return [GalleryReport(unit.url, shard=unit.shard, received=10, error=self.error) for unit in units]
+
+
+@pytest.fixture
+def checked_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Split galleries into shards without fetching their manifest to check their directory."""
+    monkeypatch.setattr(worker_module, 'shard_gallery', lambda url, n, options: shard_units(url, n, checked=True))
+
+
+@pytest.mark.usefixtures('checked_shards')
+def test_processes_download_the_shards_of_the_gallery() -> None:
+    runner = _FakeRunner()
+    worker = DownloadWorker(factory=lambda url, first, last: pytest.fail('no Downloader in this process'), runner=runner)
+    params = _params()
+    params.n_processes = 3
+    params.resume = True
+    worker.start(params)
+    events = _drain_events(worker)
+    assert [unit.shard for unit in runner.units] == [(1, 3), (2, 3), (3, 3)]
+    assert runner.options is not None and runner.options.parentdir == '/tmp/x' and runner.options.resume
+    assert events[0] == Progress(total=3)
+    assert sum(1 for e in events if isinstance(e, Tick)) == 3
+    assert events[-1] == Done(total_bytes=30)
+
+
+@pytest.mark.usefixtures('checked_shards')
+def test_failed_shards_emit_failed_event() -> None:
+    worker = DownloadWorker(runner=_FakeRunner(error='HTTP 503'))
+    params = _params()
+    params.n_processes = 2
+    worker.start(params)
+    events = _drain_events(worker)
+    assert events[-1] == Failed(message='HTTP 503')
+
+
+def test_processes_reject_a_range_of_canvases() -> None:
+    worker = DownloadWorker(runner=_FakeRunner())
+    params = _params()
+    params.n_processes = 2
+    params.first = 5
+    with pytest.raises(ValueError, match='whole gallery'):
+        worker.start(params)
+    assert not worker.is_running()
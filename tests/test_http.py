@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import pytest
+import requests
 import responses
 
 from antenati import http as antenati_http
@@ -109,3 +110,61 @@ def test_fetch_does_not_treat_plain_202_as_waf() -> None:
         )
         reply = antenati_http.fetch(session, 'https://example.org/accepted')
     assert reply.status_code == 202
+
+
+def test_fetch_stream_defers_body_and_iter_body_chunks_it() -> None:
+    session = antenati_http.build_session()
+    body = bytes(range(256)) * 4
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            'https://example.org/big.jpg',
+            body=body,
+            status=200,
+            content_type='image/jpeg',
+        )
+        reply = antenati_http.fetch(session, 'https://example.org/big.jpg', stream=True)
+        assert reply._content_consumed is False
+        chunks = list(antenati_http.iter_body(reply, chunk_size=100))
+    assert b''.join(chunks) == body
+    assert max(len(c) for c in chunks) <= 100
+    assert len(chunks) == 11
+
+
+def test_fetch_stream_raises_on_http_error() -> None:
+    session = antenati_http.build_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            'https://example.org/missing.jpg',
+            body='nope',
+            status=404,
+            content_type='text/plain',
+        )
+        with pytest.raises(requests.HTTPError):
+            antenati_http.fetch(session, 'https://example.org/missing.jpg', stream=True)
+
+
+def test_fetch_with_offset_sends_range_header() -> None:
+    session = antenati_http.build_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(
+            responses.GET,
+            'https://example.org/img.jpg',
+            body=b'tail',
+            status=206,
+            headers={'Content-Range': 'bytes 10-13/14'},
+            content_type='image/jpeg',
+        )
+        reply = antenati_http.fetch(session, 'https://example.org/img.jpg', offset=10)
+        assert rsps.calls[0].request.headers['Range'] == 'bytes=10-'
+    assert antenati_http.resumed_offset(reply.status_code, reply.headers) == 10
+
+
+def test_fetch_without_offset_sends_no_range_header() -> None:
+    session = antenati_http.build_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, 'https://example.org/img.jpg', body=b'all', status=200, content_type='image/jpeg')
+        reply = antenati_http.fetch(session, 'https://example.org/img.jpg')
+        assert 'Range' not in rsps.calls[0].request.headers
+    assert antenati_http.resumed_offset(reply.status_code, reply.headers) == 0
@@ -51,3 +51,24 @@ def test_image_url_for_canvas_missing_id_raises() -> None:
 def test_image_url_for_canvas_happy_path() -> None:
     canvas = {'images': [{'resource': {'@id': 'https://example.org/x.jpg'}}]}
     assert antenati_iiif.image_url_for_canvas(canvas) == 'https://example.org/x.jpg'
+
+
+def test_canvas_record_keeps_what_a_download_needs() -> None:
+    canvas = antenati_iiif.Canvas.from_iiif(
+        {'label': 'pag. 1', 'width': 2000, 'height': 3000, 'images': [{'resource': {'@id': 'https://example.org/iiif/2/5gGAbBp/full/full/0/default.jpg'}}]}, 4
+    )
+    assert (canvas.index, canvas.label, canvas.width, canvas.height) == (4, 'pag. 1', 2000, 3000)
+    assert canvas.image_id == '5gGAbBp'
+    assert not hasattr(canvas, '__dict__')
+
+
+def test_canvas_record_without_image_raises_on_use() -> None:
+    canvas = antenati_iiif.Canvas.from_iiif({'label': 'pag. 1', 'width': 'wide'}, 0)
+    assert (canvas.width, canvas.height) == (None, None)
+    with pytest.raises(ManifestError, match=r'images\[0\]\.resource'):
+        canvas.require_image_url()
+
+
+def test_canvas_record_without_label_raises() -> None:
+    with pytest.raises(ManifestError, match='label'):
+        antenati_iiif.Canvas.from_iiif({}, 0)
@@ -39,7 +39,9 @@ def test_constructor_raises_when_url_lacks_two_numbers(mocked_http) -> None:
 
 def test_manifest_is_loaded_from_gallery_html(downloader: Downloader) -> None:
     assert downloader.manifest['@id'] == MANIFEST_URL
-    assert len(downloader.manifest['sequences'][0]['canvases']) == 3
+    # The canvases are kept as records, not in the manifest.
+    assert 'sequences' not in downloader.manifest
+    assert [canvas.label for canvas in downloader.canvases] == ['0001', '0002', '0003']
 
 
 def test_gallery_url_is_recorded(downloader: Downloader) -> None:
@@ -49,7 +51,7 @@ def test_gallery_url_is_recorded(downloader: Downloader) -> None:
 def test_canvases_are_sliced_by_first_last(mocked_http) -> None:
     dl = Downloader(GALLERY_URL, first=1, last=2)
     assert dl.gallery_length == 1
-    assert dl.canvases[0]['label'] == '0002'
+    assert dl.canvases[0].label == '0002'
 
 
 def test_first_last_full_range(mocked_http) -> None:
@@ -0,0 +1,49 @@
+"""Tests for the crash-safe job journal."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from antenati import ProgressBar, storage
+from antenati.journal import CanvasState, Journal
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import ARCHIVE_PATH, StandInServer
+
+
+def test_transitions_are_committed_in_batches(tmp_path: Path) -> None:
+    with Journal(tmp_path / 'job.sqlite3', flush_every=2) as journal:
+        gallery_id = journal.add_gallery('u', 0, None, tmp_path, 'm', {}, {0: 'a', 1: 'b', 2: 'c'})
+        journal.mark(gallery_id, 0, CanvasState.DONE, size=10, sha256='00')
+        assert journal.states(gallery_id) == {CanvasState.PENDING: 3}
+        journal.mark(gallery_id, 1, CanvasState.FAILED, error='boom')
+        assert journal.states(gallery_id) == {CanvasState.DONE: 1, CanvasState.FAILED: 1, CanvasState.PENDING: 1}
+        journal.mark(gallery_id, 2, CanvasState.IN_FLIGHT)
+    with Journal(tmp_path / 'job.sqlite3') as reopened:
+        assert reopened.unfinished(gallery_id) == [1, 2]
+        assert reopened.gallery('u', 0, None) is not None
+        assert reopened.gallery('u', 0, 5) is None
+
+
+def test_restarted_run_continues_from_the_journal(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, null_progress: ProgressBar, make_downloader: MakeDownloader
+) -> None:
+    with StandInServer(n_images=3, failures={2: [404]}) as server:
+        with Journal(tmp_path / 'job.sqlite3') as journal:
+            dl = make_downloader(server.manifest_url, journal=journal)
+            with pytest.raises(RuntimeError, match='Failed to download 1 image'):
+                dl.run(n_workers=2, size=0, progress=null_progress)
+        # A new process: no manifest fetch, no directory listing.
+        monkeypatch.setattr(storage, 'scan_dir', lambda _d: pytest.fail('directory listed'))
+        with Journal(tmp_path / 'job.sqlite3') as journal:
+            restored = make_downloader(server.manifest_url, journal=journal)
+            total = restored.run(n_workers=2, size=0, progress=null_progress)
+            gallery = journal.gallery(server.manifest_url, 0, None)
+            assert gallery is not None
+            assert journal.states(gallery.id) == {CanvasState.DONE: 3}
+    assert restored.restored
+    assert restored.dirname == dl.dirname.absolute()
+    assert total == server.image_size
+    assert server.requests[f'{ARCHIVE_PATH}/manifest'] == 1
+    assert (restored.dirname / '0002.jpg').read_bytes() == server.payload(2)
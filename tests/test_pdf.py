@@ -0,0 +1,94 @@
+"""Tests for assembling galleries into a PDF without re-encoding the images."""
+
+from __future__ import annotations
+
+import re
+import struct
+import zlib
+from pathlib import Path
+
+import pytest
+
+import antenati
+from antenati import ProgressBar
+from antenati.pdf import PdfWriter
+from antenati.pipeline import Pipeline, webp
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+def _jpeg(width: int, height: int, components: int = 3) -> bytes:
+    """Return the header of a baseline JPEG, enough for the writer: it never decodes."""
+    frame = struct.pack('>BHHB', 8, height, width, components) + b''.join(bytes((i + 1, 0x11, 0)) for i in range(components))
+    return b'\xff\xd8\xff\xe0\x00\x04JF' + b'\xff\xc0' + struct.pack('>H', len(frame) + 2) + frame + b'\x00' * 16 + b'\xff\xd9'
+
+
+def _png(width: int, height: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    pixels = zlib.compress(b''.join(b'\x00' + bytes(width) for _ in range(height)))
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', pixels[:5]) + chunk(b'IDAT', pixels[5:]) + chunk(b'IEND', b'')
+
+
+def _objects(document: bytes) -> dict[int, bytes]:
+    """Return the objects of a PDF by number, checking the cross-reference table."""
+    xref = int(re.search(rb'startxref\n(\d+)', document).group(1))  # type: ignore[union-attr]
+    size = int(re.match(rb'xref\n0 (\d+)\n', document[xref:]).group(1))  # type: ignore[union-attr]
+    table = document[xref:].split(b'\n')[3 : 2 + size]
+    objects = {}
+    for number, entry in enumerate(table, start=1):
+        offset = int(entry[:10])
+        assert document[offset:].startswith(b'%d 0 obj' % number)
+        objects[number] = document[offset : document.index(b'endobj', offset)]
+    return objects
+
+
+def test_images_are_embedded_as_they_are(tmp_path: Path) -> None:
+    (tmp_path / 'a.jpg').write_bytes(jpeg := _jpeg(40, 60))
+    (tmp_path / 'b.png').write_bytes(_png(3, 2))
+    with PdfWriter(tmp_path / 'g.pdf', 'Registro è') as writer:
+        writer.add_page(tmp_path / 'a.jpg', 2000, 3000)
+        writer.add_page(tmp_path / 'b.png')
+    objects = _objects((tmp_path / 'g.pdf').read_bytes())
+    assert b'/Count 2' in objects[2]
+    assert b'/Filter /DCTDecode' in objects[3] and objects[3].endswith(b'stream\n' + jpeg + b'\nendstream\n')
+    assert b'/MediaBox [0 0 480.00 720.00]' in objects[7]
+    assert b'/Filter /FlateDecode' in objects[8] and b'/Predictor 15 /Colors 1' in objects[8]
+    assert b'/MediaBox [0 0 0.72 0.48]' in objects[12]
+
+
+class _JpegServer(StandInServer):
+    def payload(self, index: int) -> bytes:
+        return _jpeg(100 + index, 150)
+
+
+def test_gallery_pdf_in_canvas_order(null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    with _JpegServer(n_images=4) as server:
+        dl = make_downloader(server.manifest_url, pdf=True)
+        dl.run(n_workers=4, size=0, progress=null_progress)
+    objects = _objects(dl.pdf_path.read_bytes())
+    kids = [int(n) for n in re.findall(rb'(\d+) 0 R', objects[2].split(b'/Kids')[1])]
+    images = [int(re.search(rb'/Im0 (\d+) 0 R', objects[kid]).group(1)) for kid in kids]  # type: ignore[union-attr]
+    assert [re.search(rb'/Width (\d+)', objects[i]).group(1) for i in images] == [b'101', b'102', b'103', b'104']  # type: ignore[union-attr]
+    assert (dl.dirname / '0001.jpg').exists()
+
+
+def test_damaged_images_leave_the_document_intact(tmp_path: Path) -> None:
+    (tmp_path / 'a.jpg').write_bytes(_jpeg(40, 60))
+    (tmp_path / 'cut.jpg').write_bytes(b'\xff\xd8\xff\xe0\x00')  # segment length cut short
+    (tmp_path / 'cut.png').write_bytes(_png(3, 2)[:-20])  # last IDAT cut short
+    with PdfWriter(tmp_path / 'g.pdf') as writer:
+        for name in ('cut.jpg', 'cut.png', 'missing.jpg'):
+            with pytest.raises(ValueError):
+                writer.add_page(tmp_path / name)
+        writer.add_page(tmp_path / 'a.jpg')
+    objects = _objects((tmp_path / 'g.pdf').read_bytes())
+    assert b'/Count 1' in objects[2]
+    assert b'/Filter /DCTDecode' in objects[3]
+
+
+def test_pdf_is_refused_with_the_webp_processor() -> None:
+    with StandInServer() as server, Pipeline([webp], 1) as pipeline, pytest.raises(ValueError, match='webp'):
+        antenati.Downloader(server.manifest_url, 0, None, pdf=True, pipeline=pipeline)
@@ -0,0 +1,110 @@
+"""Tests for processing the downloaded images in worker processes."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import pytest
+
+from antenati import ProgressBar, storage
+from antenati.pipeline import Pipeline, Processed, process_file, webp
+from antenati.store import ContentStore
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+def reverse(path: Path) -> Path:
+    """Rewrite a file reversed, under another extension: a processor that changes the name."""
+    target = path.with_suffix('.rev')
+    target.write_bytes(path.read_bytes()[::-1])
+    path.unlink()
+    return target
+
+
+def fail(path: Path) -> Path:
+    raise OSError(f'cannot process {path.name}')
+
+
+def gated(path: Path) -> Path:
+    """Wait until a ``gate`` file appears next to ``path``: a processor another gallery is stuck in."""
+    deadline = time.monotonic() + 30
+    while not (path.parent / 'gate').exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return path
+
+
+def test_downloader_indexes_the_processed_files(null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    with StandInServer(n_images=3) as server, Pipeline([reverse], n_processes=2, max_pending=1) as pipeline:
+        dl = make_downloader(server.manifest_url, pipeline=pipeline)
+        dl.run(n_workers=2, size=0, progress=null_progress)
+    assert sorted(p.name for p in dl.dirname.iterdir() if not p.name.startswith('.')) == ['0001.rev', '0002.rev', '0003.rev']
+    assert (dl.dirname / '0002.rev').read_bytes() == server.payload(2)[::-1]
+    entries = storage.GalleryIndex(dl.dirname).load()
+    assert sorted(entries) == ['0001.rev', '0002.rev', '0003.rev']
+    assert entries['0002.rev'].size == len(server.payload(2))
+
+
+def test_close_waits_only_for_its_own_files(tmp_path: Path, null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / '0001.jpg').write_bytes(b'scan')
+    with StandInServer(n_images=2) as server, Pipeline([gated], n_processes=2) as pipeline:
+        stuck = pipeline.submit(other / '0001.jpg')
+        dl = make_downloader(server.manifest_url, pipeline=pipeline)
+        (dl.dirname / 'gate').touch()
+        dl.run(n_workers=2, size=0, progress=null_progress)
+        assert len(storage.GalleryIndex(dl.dirname).load()) == 2
+        assert not stuck.done()
+        (other / 'gate').touch()
+
+
+def test_async_engine_commits_off_the_event_loop(tmp_path: Path, null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    pytest.importorskip('aiohttp')
+    threads: list[str] = []
+
+    class _Store(ContentStore):
+        def add(self, path: Path, sha256: str, url: str) -> None:
+            threads.append(threading.current_thread().name)
+            super().add(path, sha256, url)
+
+    with StandInServer(n_images=3) as server, Pipeline([reverse], n_processes=1, max_pending=1) as pipeline:
+        dl = make_downloader(server.manifest_url, pipeline=pipeline, store=_Store(tmp_path / 'store'))
+        asyncio.run(dl.run_async(n_workers=3, size=0, progress=null_progress))
+    assert len(threads) == 3
+    assert threading.main_thread().name not in threads
+    assert sorted(storage.GalleryIndex(dl.dirname).load()) == ['0001.rev', '0002.rev', '0003.rev']
+
+
+def test_join_waits_for_the_callbacks(tmp_path: Path) -> None:
+    done: list[BaseException | Processed | None] = []
+
+    def on_done(future: Future[Processed]) -> None:
+        done.append(future.exception() or future.result())
+
+    paths = [tmp_path / f'{i}.jpg' for i in range(4)]
+    for path in paths:
+        path.write_bytes(b'scan')
+    with Pipeline([fail], n_processes=1, max_pending=2) as pipeline:
+        for path in paths:
+            pipeline.submit(path, on_done)
+        pipeline.join()
+        assert len(done) == 4
+    assert all(isinstance(result, OSError) for result in done)
+    with pytest.raises(ValueError, match='at least one processor'):
+        Pipeline([])
+
+
+def test_webp_replaces_the_jpeg(tmp_path: Path) -> None:
+    image_module = pytest.importorskip('PIL.Image')
+    jpeg = tmp_path / '0001.jpg'
+    image_module.linear_gradient('L').save(jpeg, 'JPEG')
+    result = process_file(jpeg, [webp])
+    assert result.path == tmp_path / '0001.webp'
+    assert not jpeg.exists()
+    assert result.sha256 == storage.hash_file(result.path).hexdigest()
+    with image_module.open(result.path) as converted:
+        assert converted.format == 'WEBP'
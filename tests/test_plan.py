@@ -0,0 +1,90 @@
+"""Tests for download plans and shards."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from antenati import Downloader, ProgressBar, iiif
+from antenati.plan import PlanItem, parse_shard, shard, write_plan
+from tests.fixtures.server import StandInServer
+
+
+def test_shards_are_disjoint_and_cover_everything() -> None:
+    items = list(range(10))
+    shards = [shard(items, i, 3) for i in (1, 2, 3)]
+    assert shards[0] == [0, 3, 6, 9]
+    assert sorted(i for s in shards for i in s) == items
+
+
+@pytest.mark.parametrize('text', ['0/2', '3/2', '1', 'a/b'])
+def test_parse_shard_rejects_invalid(text: str) -> None:
+    with pytest.raises(ValueError, match='Invalid shard'):
+        parse_shard(text)
+
+
+def test_plan_is_written_as_ndjson_or_json(tmp_path: Path) -> None:
+    items = [PlanItem('dir', 0, 'pag. 1', 'https://example.org/1.jpg', 'pag-1', 2000, 3000), PlanItem('dir', 1, 'pag. 2', 'u', 'pag-2', None, None)]
+    assert write_plan(items, tmp_path / 'plan.ndjson') == 2
+    assert write_plan(items, tmp_path / 'plan.json') == 2
+    lines = (tmp_path / 'plan.ndjson').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == json.loads((tmp_path / 'plan.json').read_text(encoding='utf-8'))
+    assert json.loads(lines[1]) == {'dirname': 'dir', 'index': 1, 'label': 'pag. 2', 'url': 'u', 'stem': 'pag-2', 'width': None, 'height': None}
+
+
+def test_expected_size_fits_the_box_without_upscaling() -> None:
+    canvas = iiif.Canvas.from_iiif({'label': '1', 'width': 2000, 'height': 3000}, 0)
+    assert iiif.expected_size(canvas, 0) == (2000, 3000)
+    assert iiif.expected_size(canvas, 1500) == (1000, 1500)
+    assert iiif.expected_size(canvas, 5000) == (2000, 3000)
+    assert iiif.expected_size(iiif.Canvas.from_iiif({'label': '1', 'width': '2000'}, 0), 1500) == (None, None)
+
+
+def test_downloader_plan_of_a_shard(tmp_path: Path, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=5) as server:
+        dl = Downloader(server.manifest_url, first=1, last=None, shard=(2, 2))
+        items = dl.plan(1500)
+        dl.check_dir(parentdir=str(tmp_path), interactive=False)
+        dl.run(n_workers=2, size=1500, progress=null_progress)
+    assert [item.index for item in items] == [2, 4]
+    assert [item.stem for item in items] == ['0003', '0005']
+    assert items[0].url == server.image_url(3, '!1500,1500')
+    assert (items[0].width, items[0].height) == (1000, 1500)
+    assert sorted(p.name for p in dl.dirname.glob('*.jpg')) == ['0003.jpg', '0005.jpg']
+
+
+def _canvases(*labels: str) -> list[iiif.Canvas]:
+    return [iiif.Canvas(i, label, f'https://example.org/iiif/2/img{i}/full/full/0/default.jpg', None, None) for i, label in enumerate(labels)]
+
+
+def test_build_plan_renames_colliding_labels() -> None:
+    targets = iiif.build_plan(_canvases('pag. 1', 'Pag 1', 'pag-1-2', 'pag. 1'), 0)
+    assert [t.stem for t in targets] == ['pag-1', 'pag-1-2', 'pag-1-2-2', 'pag-1-3']
+    assert [t.renamed for t in targets] == [False, True, True, True]
+    assert targets[0].url == 'https://example.org/iiif/2/img0/full/pct:100/0/default.jpg'
+
+
+def test_build_plan_keeps_canvases_without_image() -> None:
+    canvases = [*_canvases('a'), iiif.Canvas(1, 'b', None, None, None)]
+    missing = iiif.build_plan(canvases, 0, descriptive_names=True, ark_id='an_ua1')[1]
+    assert missing.url is None and missing.error is not None and 'images[0]' in missing.error
+
+
+class _DuplicateLabelsServer(StandInServer):
+    def manifest(self, gallery: int = 0) -> dict:
+        manifest = super().manifest(gallery)
+        manifest['sequences'][0]['canvases'][2]['label'] = '0001'
+        return manifest
+
+
+def test_duplicate_labels_do_not_overwrite_each_other(tmp_path: Path, null_progress: ProgressBar) -> None:
+    with _DuplicateLabelsServer(n_images=3) as server:
+        # Only the duplicate is selected, but names come from the whole
+        # manifest: the outputs of parts of a gallery can be merged.
+        dl = Downloader(server.manifest_url, first=2, last=None)
+        assert [item.stem for item in dl.plan(0)] == ['0001-2']
+        dl.check_dir(parentdir=str(tmp_path), interactive=False)
+        dl.run(n_workers=2, size=0, progress=null_progress)
+    assert (dl.dirname / '0001-2.jpg').read_bytes() == server.payload(3)
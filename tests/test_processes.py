@@ -0,0 +1,78 @@
+"""Tests for downloading galleries and gallery shards in worker processes."""
+
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from antenati import ProgressBar
+from antenati.batch import GalleryReport
+from antenati.processes import ProcessOptions, Unit, run_processes, shard_gallery, shard_units
+from tests.fixtures.server import StandInServer
+
+
+class _Progress:
+    def __init__(self) -> None:
+        self.totals: list[int] = []
+        self.done = 0
+
+    def bar(self) -> ProgressBar:
+        return ProgressBar(self.totals.append, self._update)
+
+    def _update(self) -> None:
+        self.done += 1
+
+
+def _options(tmp_path: Path) -> ProcessOptions:
+    return ProcessOptions(n_workers=2, parentdir=str(tmp_path), cache=False, index=False)
+
+
+def test_shard_units() -> None:
+    assert shard_units('u', 3) == [Unit('u', (1, 3)), Unit('u', (2, 3)), Unit('u', (3, 3))]
+
+
+def test_galleries_in_processes(tmp_path: Path) -> None:
+    progress = _Progress()
+    finished: list[GalleryReport] = []
+    with StandInServer(n_images=3, n_galleries=2) as server:
+        units = [Unit(url) for url in server.manifest_urls]
+        reports = run_processes(units, 2, _options(tmp_path), progress.bar(), on_gallery=finished.append)
+    assert sorted(r.url for r in finished) == server.manifest_urls
+    assert all(r.ok and r.done == r.total == 3 for r in reports)
+    assert sum(r.received for r in reports) == 2 * 3 * server.image_size
+    for report in reports:
+        assert report.dirname is not None
+        assert (report.dirname / '0003.jpg').read_bytes() == server.payload(3)
+    # The total grows as each process reads its manifest.
+    assert progress.totals[-1] == progress.done == 6
+
+
+def test_shards_of_a_gallery_in_processes(tmp_path: Path) -> None:
+    progress = _Progress()
+    with StandInServer(n_images=5) as server:
+        reports = run_processes(shard_gallery(server.manifest_url, 2, _options(tmp_path)), 2, _options(tmp_path), progress.bar())
+    assert [(r.shard, r.total) for r in reports] == [((1, 2), 3), ((2, 2), 2)]
+    assert all(r.ok for r in reports)
+    dirname = reports[0].dirname
+    assert dirname is not None and dirname == reports[1].dirname
+    assert sorted(p.name for p in dirname.glob('*.jpg')) == [f'{i:04}.jpg' for i in range(1, 6)]
+    assert progress.totals[-1] == progress.done == 5
+
+
+def test_shards_do_not_take_an_existing_directory_without_resume(tmp_path: Path) -> None:
+    with StandInServer(n_images=2) as server:
+        units = shard_gallery(server.manifest_url, 2, _options(tmp_path))
+        assert all(unit.checked for unit in units)
+        with pytest.raises(RuntimeError, match='already exists'):
+            shard_gallery(server.manifest_url, 2, _options(tmp_path))
+        assert shard_gallery(server.manifest_url, 2, replace(_options(tmp_path), resume=True)) == units
+
+
+def test_failure_is_reported_per_unit(tmp_path: Path) -> None:
+    with StandInServer(n_images=2) as server:
+        units = [Unit(f'{server.base_url}/ark/12657/iiif-1/manifest'), Unit(server.manifest_url)]
+        missing, found = run_processes(units, 2, _options(tmp_path), _Progress().bar())
+    assert missing.finished and missing.error is not None and '404' in missing.error
+    assert found.ok
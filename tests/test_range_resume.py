@@ -0,0 +1,137 @@
+"""Tests for ``.part`` files and HTTP range resume in ``Downloader.run``."""
+
+from __future__ import annotations
+
+import io
+from pathlib import Path
+
+import pytest
+import responses
+
+from antenati import Downloader, ProgressBar
+from antenati.http import MAX_RESUME_ATTEMPTS, RETRY_TOTAL
+from tests.conftest import GALLERY_URL
+
+PAYLOAD = b'\xff\xd8' + bytes(range(200)) + b'\xff\xd9'
+IMAGE_URL = 'https://iiif.example.org/iiif/img1/full/pct:100/0/default.jpg'
+
+
+class _DroppedConnection(io.RawIOBase):
+    """Raw stream that serves ``data`` and then fails like a reset socket."""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._data:
+            raise ConnectionResetError('connection reset by peer')
+        n = min(len(buffer), len(self._data))
+        buffer[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+
+def _range_callback(ranges: list[str | None], honour: bool = True):
+    def callback(request):
+        header = request.headers.get('Range')
+        ranges.append(header)
+        if header is None or not honour:
+            return 200, {'Content-Type': 'image/jpeg'}, PAYLOAD
+        start = int(header.removeprefix('bytes=').rstrip('-'))
+        headers = {
+            'Content-Type': 'image/jpeg',
+            'Content-Range': f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}',
+        }
+        return 206, headers, PAYLOAD[start:]
+
+    return callback
+
+
+@pytest.fixture
+def single(mocked_http, tmp_path: Path) -> Downloader:
+    dl = Downloader(GALLERY_URL, first=0, last=1, chunk_size=16)
+    dl.check_dir(parentdir=str(tmp_path), interactive=False)
+    return dl
+
+
+def test_resume_continues_part_file_with_range_request(mocked_http, single: Downloader, null_progress: ProgressBar) -> None:
+    (single.dirname / '0001.part').write_bytes(PAYLOAD[:50])
+    ranges: list[str | None] = []
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=_range_callback(ranges))
+    total = single.run(n_workers=1, size=0, progress=null_progress, resume=True)
+    assert ranges == ['bytes=50-']
+    assert total == len(PAYLOAD) - 50
+    assert (single.dirname / '0001.jpg').read_bytes() == PAYLOAD
+    assert not (single.dirname / '0001.part').exists()
+
+
+def test_resume_falls_back_to_full_download_when_range_is_ignored(mocked_http, single: Downloader, null_progress: ProgressBar) -> None:
+    (single.dirname / '0001.part').write_bytes(b'garbage that must be overwritten')
+    ranges: list[str | None] = []
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=_range_callback(ranges, honour=False))
+    total = single.run(n_workers=1, size=0, progress=null_progress, resume=True)
+    assert total == len(PAYLOAD)
+    assert (single.dirname / '0001.jpg').read_bytes() == PAYLOAD
+
+
+def test_fresh_run_discards_stale_part_file(mocked_http, single: Downloader, null_progress: ProgressBar) -> None:
+    (single.dirname / '0001.part').write_bytes(PAYLOAD[:50])
+    ranges: list[str | None] = []
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=_range_callback(ranges))
+    single.run(n_workers=1, size=0, progress=null_progress)
+    assert ranges == [None]
+    assert (single.dirname / '0001.jpg').read_bytes() == PAYLOAD
+
+
+def test_dropped_transfer_is_continued_from_received_bytes(mocked_http, single: Downloader, null_progress: ProgressBar) -> None:
+    ranges: list[str | None] = []
+    serve_range = _range_callback(ranges)
+
+    def callback(request):
+        if not ranges:
+            ranges.append(request.headers.get('Range'))
+            return 200, {'Content-Type': 'image/jpeg'}, io.BufferedReader(_DroppedConnection(PAYLOAD[:64]))
+        return serve_range(request)
+
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=callback)
+    total = single.run(n_workers=1, size=0, progress=null_progress)
+    assert ranges == [None, 'bytes=64-']
+    assert total == len(PAYLOAD)
+    assert (single.dirname / '0001.jpg').read_bytes() == PAYLOAD
+
+
+def test_repeatedly_dropped_transfer_fails_and_keeps_part_file(
+    mocked_http, single: Downloader, monkeypatch: pytest.MonkeyPatch, null_progress: ProgressBar
+) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.0)
+
+    def callback(_request):
+        return 200, {'Content-Type': 'image/jpeg'}, io.BufferedReader(_DroppedConnection(PAYLOAD[:8]))
+
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=callback)
+    with pytest.raises(RuntimeError, match='Failed to download 1 image'):
+        single.run(n_workers=1, size=0, progress=null_progress)
+    # Each scheduled attempt resumes the transfer MAX_RESUME_ATTEMPTS times.
+    assert sum(c.request.url == IMAGE_URL for c in mocked_http.calls) == (MAX_RESUME_ATTEMPTS + 1) * (RETRY_TOTAL + 1)
+    assert (single.dirname / '0001.part').exists()
+    assert not (single.dirname / '0001.jpg').exists()
+
+
+def test_unsatisfiable_range_restarts_from_scratch(mocked_http, single: Downloader, null_progress: ProgressBar) -> None:
+    (single.dirname / '0001.part').write_bytes(PAYLOAD + b'extra')
+    ranges: list[str | None] = []
+    serve_range = _range_callback(ranges)
+
+    def callback(request):
+        if request.headers.get('Range') is not None and not ranges:
+            ranges.append(request.headers['Range'])
+            return 416, {'Content-Type': 'text/plain'}, b''
+        return serve_range(request)
+
+    mocked_http.add_callback(responses.GET, IMAGE_URL, callback=callback)
+    single.run(n_workers=1, size=0, progress=null_progress, resume=True)
+    assert ranges == [f'bytes={len(PAYLOAD) + 5}-', None]
+    assert (single.dirname / '0001.jpg').read_bytes() == PAYLOAD
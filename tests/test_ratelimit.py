@@ -0,0 +1,88 @@
+"""Tests for the shared request-rate and bandwidth budget."""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from antenati import Downloader, ProgressBar, paths
+from antenati.ratelimit import STATE_FILENAME, RateLimiter
+from tests.fixtures.server import StandInServer
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_requests_beyond_the_burst_wait_their_turn(tmp_path: Path) -> None:
+    clock = _Clock()
+    with RateLimiter(requests_per_second=2, path=tmp_path / 'state', clock=clock) as limiter:
+        delays = [limiter.reserve_request() for _ in range(4)]
+    assert delays == [0.0, 0.0, 0.5, 1.0]
+
+
+def test_budget_refills_with_time_up_to_the_burst(tmp_path: Path) -> None:
+    clock = _Clock()
+    with RateLimiter(requests_per_second=2, path=tmp_path / 'state', clock=clock) as limiter:
+        for _ in range(3):
+            limiter.reserve_request()
+        clock.now += 60
+        assert [limiter.reserve_request() for _ in range(3)] == [0.0, 0.0, 0.5]
+
+
+def test_bandwidth_budget_counts_bytes(tmp_path: Path) -> None:
+    clock = _Clock()
+    with RateLimiter(bytes_per_second=1000, path=tmp_path / 'state', clock=clock) as limiter:
+        assert limiter.reserve_bytes(1000) == 0.0
+        assert limiter.reserve_bytes(3000) == pytest.approx(3.0)
+        # Requests are not limited.
+        assert limiter.reserve_request() == 0.0
+
+
+def test_limiters_on_the_same_file_share_the_budget(tmp_path: Path) -> None:
+    clock = _Clock()
+    state = tmp_path / 'state'
+    with RateLimiter(requests_per_second=1, path=state, clock=clock) as first, RateLimiter(requests_per_second=1, path=state, clock=clock) as second:
+        assert first.reserve_request() == 0.0
+        assert second.reserve_request() == 1.0
+        assert first.reserve_request() == 2.0
+
+
+def test_budget_is_shared_with_other_processes(tmp_path: Path) -> None:
+    state = tmp_path / 'state'
+    with RateLimiter(requests_per_second=1, path=state) as limiter:
+        assert limiter.reserve_request() == 0.0
+        script = f'from antenati.ratelimit import RateLimiter; print(RateLimiter(1, path={str(state)!r}).reserve_request())'
+        child = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    assert float(child.stdout) > 0.5
+
+
+def test_invalid_limits_are_rejected(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match='bytes_per_second'):
+        RateLimiter(bytes_per_second=0, path=tmp_path / 'state')
+
+
+def test_state_file_defaults_to_user_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(paths.CACHE_DIR_ENV, str(tmp_path / 'cache'))
+    with RateLimiter(requests_per_second=1) as limiter:
+        assert limiter.path == tmp_path / 'cache' / STATE_FILENAME
+
+
+def test_downloader_honours_bandwidth_budget(tmp_path: Path) -> None:
+    with StandInServer(n_images=4, image_size=10_000) as server, RateLimiter(bytes_per_second=20_000, path=tmp_path / 'state') as limiter:
+        dl = Downloader(server.manifest_url, first=0, last=None, chunk_size=1000, rate_limiter=limiter)
+        dl.check_dir(parentdir=str(tmp_path), interactive=False)
+        start = time.monotonic()
+        total = dl.run(n_workers=4, size=0, progress=ProgressBar(set_total=lambda _t: None, update=lambda: None))
+        elapsed = time.monotonic() - start
+    assert total == 40_000
+    # One second of burst, then 20 kB/s for the remaining 20 kB.
+    assert elapsed >= 0.9
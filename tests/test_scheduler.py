@@ -0,0 +1,157 @@
+"""Tests for the retry scheduler and the retries of ``Downloader.run``."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from antenati import ProgressBar, http
+from antenati.scheduler import MAX_BACKOFF, MAX_RETRY_AFTER, RetryScheduler, backoff_delay
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _canvas(label: str) -> dict:
+    return {'label': label}
+
+
+def test_backoff_delay_honours_retry_after() -> None:
+    assert backoff_delay(3, retry_after=7.0) == 7.0
+
+
+def test_backoff_delay_caps_retry_after() -> None:
+    assert backoff_delay(0, retry_after=86400.0) == MAX_RETRY_AFTER
+
+
+def test_backoff_delay_is_jittered_exponential_and_capped(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.5)
+    assert backoff_delay(2, rng=lambda: 0.0) == 1.0
+    assert backoff_delay(2, rng=lambda: 1.0) == 2.0
+    assert backoff_delay(20, rng=lambda: 1.0) == MAX_BACKOFF
+
+
+def test_fresh_canvases_are_served_while_a_retry_waits() -> None:
+    clock = _Clock()
+    scheduler = RetryScheduler([_canvas('a'), _canvas('b')], clock=clock, rng=lambda: 1.0)
+    first = scheduler.pop_ready()
+    assert first is not None
+    assert scheduler.defer(first[0], first[1], retry_after=10.0) == 10.0
+    assert scheduler.pop_ready() == (_canvas('b'), 0)
+    assert scheduler.pop_ready() is None
+    assert scheduler.wait_time() == 10.0
+    clock.now = 10.0
+    assert scheduler.pop_ready() == (_canvas('a'), 1)
+    assert not scheduler
+
+
+def test_due_retries_go_before_fresh_canvases() -> None:
+    clock = _Clock()
+    scheduler = RetryScheduler([_canvas('a'), _canvas('b')], clock=clock)
+    scheduler.defer(_canvas('z'), 0, retry_after=0.0)
+    assert scheduler.pop_ready() == (_canvas('z'), 1)
+    assert scheduler.wait_time() == 0.0
+
+
+def test_defer_gives_up_after_max_retries() -> None:
+    scheduler = RetryScheduler([], max_retries=2, clock=_Clock())
+    assert scheduler.defer(_canvas('a'), 1, retry_after=0.0) == 0.0
+    assert scheduler.defer(_canvas('a'), 2, retry_after=0.0) is None
+    assert scheduler.wait_time() == 0.0
+
+
+def _image_log(server: StandInServer) -> list[int]:
+    return [int(path.split('/')[2][3:]) for path in server.log if path.startswith('/iiif/')]
+
+
+def test_run_downloads_other_canvases_during_retry_after(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=4, failures={1: [503]}, retry_after=1) as server:
+        dl = make_downloader(server.manifest_url)
+        dl.run(n_workers=1, size=0, progress=null_progress)
+    # The only worker did not sleep through the Retry-After of image 1.
+    assert _image_log(server) == [1, 2, 3, 4, 1]
+    assert (dl.dirname / '0001.jpg').read_bytes() == server.payload(1)
+
+
+def test_run_does_not_retry_permanent_errors(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=2, failures={2: [404, 404]}) as server:
+        dl = make_downloader(server.manifest_url)
+        with pytest.raises(RuntimeError, match='Failed to download 1 image'):
+            dl.run(n_workers=2, size=0, progress=null_progress)
+    assert _image_log(server).count(2) == 1
+
+
+def test_final_pass_retries_canvases_out_of_retries(monkeypatch: pytest.MonkeyPatch, make_downloader: MakeDownloader) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.0)
+    updates = [0]
+
+    def _update() -> None:
+        updates[0] += 1
+
+    with StandInServer(n_images=3, failures={2: [503] * 6}) as server:
+        dl = make_downloader(server.manifest_url)
+        total = dl.run(n_workers=4, size=0, progress=ProgressBar(lambda _t: None, _update), final_pass=True)
+    assert total == 3 * server.image_size
+    assert _image_log(server).count(2) == 7
+    assert updates[0] == 3
+
+
+class _SameLabelServer(StandInServer):
+    """Give every canvas the same label, as registers with unnumbered pages do."""
+
+    def manifest(self, gallery: int = 0) -> dict:
+        manifest = super().manifest(gallery)
+        for canvas in manifest['sequences'][0]['canvases']:
+            canvas['label'] = 'pagina'
+        return manifest
+
+
+def test_failures_of_canvases_sharing_a_label_are_all_kept(make_downloader: MakeDownloader) -> None:
+    updates = [0]
+
+    def _update() -> None:
+        updates[0] += 1
+
+    with _SameLabelServer(n_images=3, failures={2: [404, 404], 3: [404, 404]}) as server:
+        dl = make_downloader(server.manifest_url)
+        with pytest.raises(RuntimeError, match='Failed to download 2 images') as excinfo:
+            dl.run(n_workers=2, size=0, progress=ProgressBar(lambda _t: None, _update), final_pass=True)
+    assert 'pagina-2' in str(excinfo.value) and 'pagina-3' in str(excinfo.value)
+    # Both tried again by the final pass, and all three ticked.
+    assert _image_log(server).count(2) == _image_log(server).count(3) == 2
+    assert updates[0] == 3
+
+
+def test_without_final_pass_canvases_out_of_retries_fail(monkeypatch: pytest.MonkeyPatch, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    monkeypatch.setattr('antenati.http.RETRY_BACKOFF_FACTOR', 0.0)
+    with StandInServer(n_images=3, failures={2: [503] * 6}) as server:
+        dl = make_downloader(server.manifest_url)
+        with pytest.raises(RuntimeError, match='Failed to download 1 image'):
+            dl.run(n_workers=4, size=0, progress=null_progress)
+    assert _image_log(server).count(2) == 6
+
+
+def test_run_async_downloads_other_canvases_during_retry_after(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    pytest.importorskip('aiohttp')
+    with StandInServer(n_images=4, failures={1: [429]}, retry_after=1) as server:
+        dl = make_downloader(server.manifest_url)
+        asyncio.run(dl.run_async(n_workers=1, size=0, progress=null_progress))
+    assert _image_log(server) == [1, 2, 3, 4, 1]
+
+
+def test_run_gives_the_session_its_retry_policy_back(make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    with StandInServer(n_images=2) as server:
+        dl = make_downloader(server.manifest_url)
+        before = {prefix: adapter.max_retries for prefix, adapter in dl.session.adapters.items()}
+        dl.run(n_workers=2, size=0, progress=null_progress)
+    assert all(adapter.max_retries is before[prefix] for prefix, adapter in dl.session.adapters.items())
+    # Read errors go to the scheduler, like statuses.
+    assert http.transport_retry_policy().read == 0
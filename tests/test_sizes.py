@@ -0,0 +1,79 @@
+"""Tests for requesting images at the sizes the image server has ready."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from antenati import Downloader, ProgressBar, iiif
+from antenati.cache import ResponseCache
+from antenati.errors import ManifestError
+from tests.fixtures.server import StandInServer
+
+
+def _info(width: int, height: int, sizes: list[tuple[int, int]]) -> iiif.ImageInfo:
+    return iiif.parse_image_info({'width': width, 'height': height, 'sizes': [{'width': w, 'height': h} for w, h in sizes]})
+
+
+def test_info_url() -> None:
+    assert iiif.info_url('https://example.org/iiif/2/abc/full/full/0/default.jpg') == 'https://example.org/iiif/2/abc/info.json'
+    with pytest.raises(ManifestError):
+        iiif.info_url('https://example.org/default.jpg')
+
+
+def test_parse_image_info_rejects_malformed() -> None:
+    with pytest.raises(ManifestError, match='Malformed'):
+        iiif.parse_image_info({'width': 2000})
+    with pytest.raises(ManifestError, match='Malformed'):
+        iiif.parse_image_info({'width': 2000, 'height': 3000, 'sizes': [{'width': 0, 'height': 0}]})
+
+
+def test_downscales_learn_divisors_and_rounding() -> None:
+    # 3543 / 4 = 885.75 and 4724 / 8 = 590.5: listed rounded down.
+    floor = _info(3543, 4724, [(442, 590), (885, 1181), (1771, 2362)])
+    other = _info(3500, 4700, [(437, 587), (875, 1175), (1750, 2350)])
+    downscales = iiif.downscales_from([floor, other])
+    assert downscales == iiif.Downscales((2, 4, 8), 'floor')
+    assert downscales.fit(3543, 4724, 2000) == (885, 1181)
+    assert downscales.fit(3543, 4724, 5000) == (3543, 4724)
+    assert downscales.fit(3543, 4724, 100) is None
+
+
+def test_downscales_keep_the_divisors_every_image_has() -> None:
+    tiles = iiif.parse_image_info({'width': 1001, 'height': 1001, 'tiles': [{'width': 256, 'scaleFactors': [1, 2, 4]}]})
+    assert iiif.downscales_from([tiles, _info(1000, 1000, [(500, 500)])]) == iiif.Downscales((2,), 'ceil')
+    assert iiif.downscales_from([_info(1000, 1000, [])]) is None
+
+
+def test_build_plan_requests_ready_sizes() -> None:
+    canvas = iiif.Canvas(0, '1', 'https://example.org/iiif/2/img0/full/full/0/default.jpg', 2000, 3000)
+    target = iiif.build_plan([canvas], 1400, downscales=iiif.Downscales((2, 4), 'ceil'))[0]
+    assert target.url == 'https://example.org/iiif/2/img0/full/500,750/0/default.jpg'
+    assert (target.width, target.height) == (500, 750)
+
+
+def test_downloader_probes_a_sample_of_info_json(tmp_path: Path, null_progress: ProgressBar) -> None:
+    cache = ResponseCache(tmp_path / 'cache')
+    with StandInServer(n_images=5) as server:
+        dl = Downloader(server.manifest_url, first=0, last=None, cache=cache, probe_sizes=True)
+        items = dl.plan(1500)
+        dl.check_dir(parentdir=str(tmp_path), interactive=False)
+        dl.run(n_workers=2, size=1500, progress=null_progress)
+        Downloader(server.manifest_url, first=0, last=None, cache=cache, probe_sizes=True).plan(1500)
+    assert items[0].url == server.image_url(1, '1000,1500')
+    assert (items[0].width, items[0].height) == (1000, 1500)
+    # First, middle and last canvas, probed once per gallery and cached.
+    assert [path for path in server.log if path.endswith('info.json')] == [f'/iiif/img{i}/info.json' for i in (1, 3, 5)] * 2
+    assert (dl.dirname / '0005.jpg').read_bytes() == server.payload(5)
+
+
+class _NoSizesServer(StandInServer):
+    def info_json(self, index: int) -> dict:
+        return {'@id': f'{self.base_url}/iiif/img{index}'}
+
+
+def test_failed_probe_falls_back_to_the_box() -> None:
+    with _NoSizesServer(n_images=2) as server:
+        items = Downloader(server.manifest_url, first=0, last=None, probe_sizes=True).plan(1500)
+    assert items[0].url == server.image_url(1, '!1500,1500')
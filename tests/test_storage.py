@@ -0,0 +1,59 @@
+"""Tests for the on-disk helpers in :mod:`antenati.storage`."""
+
+from __future__ import annotations
+
+from os import link
+from pathlib import Path
+
+from antenati import storage
+from tests.conftest import TINY_JPEG
+
+
+def test_scan_dir_indexes_files_by_stem(tmp_path: Path) -> None:
+    (tmp_path / '0001.jpg').write_bytes(TINY_JPEG)
+    (tmp_path / '0002.png').write_bytes(b'png')
+    (tmp_path / '.hidden').write_bytes(b'x')
+    (tmp_path / 'subdir').mkdir()
+    found = storage.scan_dir(tmp_path)
+    assert found == {'0001': tmp_path / '0001.jpg', '0002': tmp_path / '0002.png'}
+
+
+def test_scan_dir_missing_directory_is_empty(tmp_path: Path) -> None:
+    assert storage.scan_dir(tmp_path / 'nope') == {}
+
+
+def test_is_complete_accepts_full_jpeg(tmp_path: Path) -> None:
+    image = tmp_path / 'a.jpg'
+    image.write_bytes(TINY_JPEG[:2] + b'payload' + TINY_JPEG[2:])
+    assert storage.is_complete(image)
+
+
+def test_is_complete_rejects_truncated_jpeg(tmp_path: Path) -> None:
+    image = tmp_path / 'a.jpg'
+    image.write_bytes(TINY_JPEG[:2] + b'payload')
+    assert not storage.is_complete(image)
+
+
+def test_is_complete_rejects_empty_file(tmp_path: Path) -> None:
+    image = tmp_path / 'a.png'
+    image.write_bytes(b'')
+    assert not storage.is_complete(image)
+
+
+def test_is_complete_accepts_non_empty_non_jpeg(tmp_path: Path) -> None:
+    image = tmp_path / 'a.png'
+    image.write_bytes(b'\x89PNG')
+    assert storage.is_complete(image)
+
+
+def test_part_file_does_not_write_through_hard_links(tmp_path: Path) -> None:
+    shared = tmp_path / 'object'
+    shared.write_bytes(b'stored image')
+    for start in (0, 6):
+        part = tmp_path / '0001.part'
+        link(shared, part)
+        with storage.PartFile(part, start) as part_file:
+            part_file.write(b'reply')
+        assert part.read_bytes() == b'stored image'[:start] + b'reply'
+        assert shared.read_bytes() == b'stored image'
+        part.unlink()
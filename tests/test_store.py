@@ -0,0 +1,78 @@
+"""Tests for the content-addressed store of downloaded images."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from antenati import ProgressBar, storage, store
+from antenati.store import ContentStore
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+
+def _image_requests(server: StandInServer) -> list[str]:
+    return [path for path in server.log if path.startswith('/iiif/')]
+
+
+def test_galleries_share_the_stored_images(tmp_path: Path, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    content_store = ContentStore(tmp_path / 'store')
+    with StandInServer(n_images=3, n_galleries=2) as server:
+        first = make_downloader(server.manifest_urls[0], store=content_store)
+        first.run(n_workers=2, size=0, progress=null_progress)
+        assert len(_image_requests(server)) == 3
+        second = make_downloader(server.manifest_urls[1], store=content_store)
+        second.run(n_workers=2, size=0, progress=null_progress)
+        assert len(_image_requests(server)) == 3
+    for name in ('0001.jpg', '0002.jpg', '0003.jpg'):
+        assert (first.dirname / name).samefile(second.dirname / name)
+    entry = storage.GalleryIndex(second.dirname).load()['0002.jpg']
+    assert (second.dirname / '0002.jpg').samefile(content_store.object_path(entry.sha256))
+    assert entry.size == len(server.payload(2))
+
+
+class _BlankServer(StandInServer):
+    """Serve the same bytes for every image, like blank separator pages."""
+
+    def payload(self, index: int) -> bytes:
+        return super().payload(1)
+
+
+def test_duplicates_are_linked_to_one_object(tmp_path: Path, make_downloader: MakeDownloader, null_progress: ProgressBar) -> None:
+    content_store = ContentStore(tmp_path / 'store')
+    with _BlankServer(n_images=3) as server:
+        dl = make_downloader(server.manifest_url, store=content_store)
+        dl.run(n_workers=2, size=0, progress=null_progress)
+    objects = [path for path in (tmp_path / 'store' / store.OBJECTS_SUBDIR).rglob('*') if path.is_file()]
+    assert len(objects) == 1
+    assert objects[0].stat().st_nlink == 4
+    assert (dl.dirname / '0003.jpg').read_bytes() == server.payload(1)
+
+
+def test_other_filesystems_are_not_stored(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture) -> None:
+    content_store = ContentStore(tmp_path / 'store')
+    stored = tmp_path / '0001.jpg'
+    stored.write_bytes(b'scan')
+    sha256 = storage.hash_file(stored).hexdigest()
+    content_store.add(stored, sha256, 'https://example.org/img1/full/full/0/default.jpg')
+
+    def cross_device(src: Path, dst: Path) -> None:
+        raise OSError(18, 'Invalid cross-device link')
+
+    monkeypatch.setattr(store, 'link', cross_device)
+    monkeypatch.setattr(store, '_reflink', lambda src, dst: False)
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / '0002.jpg').write_bytes(b'other scan')
+    content_store.add(other / '0002.jpg', storage.hash_file(other / '0002.jpg').hexdigest(), 'https://example.org/img2/full/full/0/default.jpg')
+    assert content_store.lookup('https://example.org/img2/full/full/0/default.jpg') is None
+    assert (other / '0002.jpg').read_bytes() == b'other scan'
+    # The images already stored are still copied rather than downloaded.
+    assert content_store.lookup('https://example.org/img1/full/full/0/default.jpg') == (sha256, '.jpg')
+    assert content_store.link(sha256, other / '0001.jpg') == 4
+    assert (other / '0001.jpg').read_bytes() == b'scan'
+    assert not (other / '0001.jpg').samefile(stored)
+    assert [r.message for r in caplog.records if r.levelname == 'WARNING'] == [
+        f'{other} cannot share files with the store {tmp_path / "store"} (another filesystem?): its images are not stored'
+    ]
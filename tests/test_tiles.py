@@ -0,0 +1,60 @@
+"""Tests for downloading huge images as tiles and stitching them."""
+
+from __future__ import annotations
+
+from io import BytesIO
+
+import pytest
+
+from antenati import ProgressBar, iiif
+from tests.conftest import MakeDownloader
+from tests.fixtures.server import StandInServer
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def test_tile_regions_cover_the_image() -> None:
+    assert iiif.tile_regions(5, 3, 2) == [(0, 0, 2, 2), (2, 0, 2, 2), (4, 0, 1, 2), (0, 2, 2, 1), (2, 2, 2, 1), (4, 2, 1, 1)]
+    assert iiif.region_url('https://example.org/img/full/full/0/default.jpg', (0, 2, 2, 1)) == 'https://example.org/img/0,2,2,1/pct:100/0/default.jpg'
+
+
+class _ScanServer(StandInServer):
+    """Serve the regions of a 2000 x 3000 gradient, as PNG so the pixels can be compared."""
+
+    def __init__(self, n_images: int, failures: dict[int, list[int]] | None = None) -> None:
+        super().__init__(n_images=n_images, failures=failures)
+        self.scan = Image.linear_gradient('L').resize((2000, 3000))
+
+    def region(self, index: int, region: tuple[int, int, int, int]) -> tuple[bytes, str] | None:
+        x, y, w, h = region
+        buffer = BytesIO()
+        self.scan.crop((x, y, x + w, y + h)).save(buffer, 'PNG')
+        return buffer.getvalue(), 'image/png'
+
+
+def test_tiles_are_stitched_losslessly(null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    with _ScanServer(n_images=2) as server:
+        dl = make_downloader(server.manifest_url, tile_size=1024)
+        dl.run(n_workers=2, size=0, progress=null_progress)
+    # 2 x 3 tiles per image, no whole-image request.
+    assert sum(',' in path for path in server.log) == 12
+    assert not any('pct:100/0' in path and ',' not in path for path in server.log)
+    with Image.open(dl.dirname / '0001.png') as stitched:
+        assert stitched.tobytes() == server.scan.tobytes()
+    assert sorted(p.name for p in dl.dirname.iterdir() if not p.name.startswith('.antenati')) == ['0001.png', '0002.png']
+
+
+def test_failed_tile_is_fetched_again_alone(null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    with _ScanServer(n_images=1, failures={1: [503]}) as server:
+        dl = make_downloader(server.manifest_url, tile_size=1024)
+        dl.run(n_workers=1, size=0, progress=null_progress)
+    assert sum(',' in path for path in server.log) == 6 + 1
+    assert (dl.dirname / '0001.png').exists()
+
+
+def test_reduced_sizes_are_not_tiled(null_progress: ProgressBar, make_downloader: MakeDownloader) -> None:
+    with _ScanServer(n_images=1) as server:
+        dl = make_downloader(server.manifest_url, tile_size=1024)
+        dl.run(n_workers=1, size=1500, progress=null_progress)
+    assert server.log[-1] == '/iiif/img1/full/!1500,1500/0/default.jpg'
+    assert (dl.dirname / '0001.jpg').read_bytes() == server.payload(1)
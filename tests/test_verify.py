@@ -0,0 +1,96 @@
+"""Tests for :mod:`antenati.verify` and the ``antenati verify`` subcommand."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+import responses
+
+from antenati import Downloader, ProgressBar, storage, verify
+from antenati import cli as antenati_cli
+from tests.conftest import TINY_JPEG
+
+PAYLOAD = TINY_JPEG[:2] + b'scan data' + TINY_JPEG[2:]
+
+
+def _image_url(label: str) -> str:
+    return f'https://iiif.example.org/iiif/img{label[-1]}/full/pct:100/0/default.jpg'
+
+
+@pytest.fixture
+def gallery(mocked_http, downloader: Downloader, tmp_path: Path, null_progress: ProgressBar) -> Downloader:
+    downloader.check_dir(parentdir=str(tmp_path), interactive=False)
+    for label in ('0001', '0002', '0003'):
+        mocked_http.add(responses.GET, _image_url(label), body=PAYLOAD, status=200, content_type='image/jpeg', auto_calculate_content_length=True)
+    downloader.run(n_workers=2, size=0, progress=null_progress)
+    return downloader
+
+
+def test_run_records_every_image_in_sidecar_index(gallery: Downloader) -> None:
+    recorded = storage.GalleryIndex(gallery.dirname).load()
+    assert sorted(recorded) == ['0001.jpg', '0002.jpg', '0003.jpg']
+    entry = recorded['0001.jpg']
+    assert entry.size == entry.content_length == len(PAYLOAD)
+    assert entry.sha256 == storage.hash_file(gallery.dirname / '0001.jpg').hexdigest()
+    assert entry.url == _image_url('0001')
+
+
+def test_verify_clean_gallery_has_no_bad_files(gallery: Downloader) -> None:
+    [report] = verify.verify_galleries([gallery.dirname], n_processes=2)
+    assert report.checked == 3
+    assert report.ok
+
+
+def test_verify_detects_corruption_truncation_and_missing_files(gallery: Downloader) -> None:
+    corrupted = bytearray(PAYLOAD)
+    corrupted[4] ^= 0xFF
+    (gallery.dirname / '0001.jpg').write_bytes(bytes(corrupted))
+    (gallery.dirname / '0002.jpg').write_bytes(PAYLOAD[:-3] + TINY_JPEG[2:])
+    (gallery.dirname / '0003.jpg').unlink()
+    [report] = verify.verify_galleries([gallery.dirname], n_processes=2)
+    assert report.bad == {
+        '0001.jpg': 'SHA-256 mismatch',
+        '0002.jpg': f'size is {len(PAYLOAD) - 1} bytes, {len(PAYLOAD)} recorded',
+        '0003.jpg': 'missing, empty or truncated image',
+    }
+
+
+def test_quick_verify_skips_hashing(gallery: Downloader) -> None:
+    corrupted = bytearray(PAYLOAD)
+    corrupted[4] ^= 0xFF
+    (gallery.dirname / '0001.jpg').write_bytes(bytes(corrupted))
+    [report] = verify.verify_galleries([gallery.dirname], n_processes=1, quick=True)
+    assert report.ok
+
+
+def test_requeue_removes_bad_files_so_resume_refetches_them(mocked_http, gallery: Downloader, null_progress: ProgressBar) -> None:
+    (gallery.dirname / '0002.jpg').write_bytes(PAYLOAD[:5])
+    [report] = verify.verify_galleries([gallery.dirname], n_processes=1)
+    verify.requeue(report)
+    assert not (gallery.dirname / '0002.jpg').exists()
+    assert '0002.jpg' not in storage.GalleryIndex(gallery.dirname).load()
+
+    total = gallery.run(n_workers=1, size=0, progress=null_progress, resume=True)
+    assert total == len(PAYLOAD)
+    [report] = verify.verify_galleries([gallery.dirname], n_processes=1)
+    assert report.ok
+
+
+def test_find_galleries_walks_down_to_indexed_directories(gallery: Downloader, tmp_path: Path) -> None:
+    assert list(verify.find_galleries(tmp_path)) == [gallery.dirname]
+    assert list(verify.find_galleries(tmp_path / 'empty')) == [tmp_path / 'empty']
+
+
+def test_verify_subcommand_exit_status(gallery: Downloader, tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    with pytest.raises(SystemExit) as clean:
+        antenati_cli.main(['verify', '-j', '1', str(tmp_path)])
+    assert clean.value.code == 0
+    (gallery.dirname / '0003.jpg').write_bytes(b'')
+    with pytest.raises(SystemExit) as dirty:
+        antenati_cli.main(['verify', '-j', '1', '--requeue', str(tmp_path)])
+    assert dirty.value.code == 1
+    out = capsys.readouterr().out
+    assert '0003.jpg' in out
+    assert '1 bad' in out
+    assert not (gallery.dirname / '0003.jpg').exists()